@@ -1,10 +1,19 @@
 import os
+import time
 import redis
 import rq
 import rq_dashboard
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, render_template, jsonify, request, Response, stream_with_context
 from . import db
+from . import push
+from . import timeseries
+from . import history
+from . import registry
+from . import config_snapshot
+from . import lanes
 from . import hardware
+from .drivers import transport
+from .drivers import info_cache
 from .tasks.data_logger_cycle import update_device_data
 from .tasks.ventilation_loop import ventilation_loop
 from .tasks.start_tasks import init_tasks
@@ -21,6 +30,10 @@ def create_app():
     # print(app.instance_path)
     res = app.config.from_pyfile('config.py')
     print(f"Keys loaded from current app config: {res}")
+    # timeouts, retries and concurrency of http requests to devices
+    transport.configure(app.config.get("HTTP_TRANSPORT", {}))
+    # how long drivers reuse /info payload of device, seconds
+    info_cache.configure(app.config.get("DEVICE_INFO_MAX_AGE", 0))
     rq_dashboard.web.setup_rq_connection(app)
     app.register_blueprint(rq_dashboard.blueprint, url_prefix="/rq")
     # for key in app.config:
@@ -34,7 +47,9 @@ def create_app():
     # main page with all controls
     @app.route('/')
     def index():
-        return render_template('index.html', devices=db.get_device_states())
+        snapshot = db.get_device_snapshot()
+        return render_template('index.html', devices=snapshot["devices"], version=snapshot["version"],
+                               server_push=push.push_enabled(app.config))
 
     # обработчик для эксперимента
     @app.route('/handle-experiment', methods=['POST'])
@@ -65,27 +80,84 @@ def create_app():
             command = data.get('command')
             arg = data.get('arg')
 
-            # Handle the command (you would replace this with your actual command handling logic)
-            success = hardware.handle_command(device_id, command, arg)
-
-            # Return a success response
-            if success:
-                return jsonify({'status': 'ok'}), 200
-            else:
-                return jsonify({'status': 'error', 'error': 'Failed to handle command'}), 500
+            # Validate command, enqueue it to lane of device and optionally wait for device answer
+            result, status = hardware.handle_command(device_id, command, arg, data.get('wait'),
+                                                     data.get('command_id'))
+            return jsonify(result), status
         except Exception as e:
             # Return an error response if something goes wrong
             return jsonify({'status': 'error', 'error': str(e)}), 500
 
 
+    # status of command from /handle-request: queued, running, ok or error
+    @app.route('/command-status/<command_id>')
+    def get_command_status(command_id):
+        status = hardware.command_status(command_id)
+        if status is None:
+            return jsonify({'status': 'error', 'error': f'Unknown command {command_id}'}), 404
+        return jsonify(status), 200
+
     @app.route('/get-device-updates')
     def get_device_updates():
-        # `device_states` is a big dictionary holding the state of each device
-        new_states = db.get_device_states()
-        return jsonify(new_states)
+        # without `since` it is a list with full state of each device, as before
+        # with `since` (version from previous response) - only devices and fields changed after it
+        since = request.args.get('since', type=int)
+        delta = db.get_device_delta(since)
+        if since is not None and since == delta["version"]:
+            response = Response(status=304)
+        elif since is None:
+            response = jsonify(delta["devices"])
+        else:
+            response = jsonify(delta)
+        response.set_etag(str(delta["version"]))
+        # answers 304 to If-None-Match with current version
+        return response.make_conditional(request)
+
+    # server push of device updates, replaces ajax polling in browsers with EventSource support
+    @app.route('/stream-device-updates')
+    def stream_device_updates():
+        if not push.push_enabled(app.config):
+            return jsonify({'status': 'error', 'error': 'Server push is disabled, use /get-device-updates'}), 404
+        return Response(stream_with_context(push.device_update_events()),
+                        mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    # history of one device field for charts
+    # start and end - unix time in milliseconds, default is last 24 hours
+    # max_points - points budget, data is read from rollup tiers and decimated on server
+    # format=binary returns packed float64 timestamps followed by float32 values
+    @app.route('/history/<int:device_id>/<field>')
+    def device_history(device_id, field):
+        end = request.args.get('end', type=int)
+        if end is None:
+            end = int(time.time() * 1000)
+        start = request.args.get('start', type=int)
+        if start is None:
+            start = end - 24 * 3600 * 1000
+        max_points = min(request.args.get('max_points', 1000, type=int),
+                         app.config.get("HISTORY_MAX_POINTS", 10000))
+        method = request.args.get('method', 'lttb')
+        if method not in history.DECIMATION_METHODS or max_points < 4 or start >= end:
+            return jsonify({'status': 'error', 'error': 'Invalid history request'}), 400
+
+        result = history.get_history(db.get_data_db(), device_id, field, start, end, max_points, method)
+        if result is None:
+            return jsonify({'status': 'error', 'error': f'No data for device {device_id} field {field}'}), 404
+        if request.args.get('format') == 'binary':
+            return Response(history.binary_chunks(result), mimetype='application/octet-stream',
+                            headers={'X-Points': str(len(result["t"])), 'X-Tier': str(result["tier"])})
+        return Response(history.json_chunks(device_id, field, result), mimetype='application/json')
+
+    # versioned snapshot of config for rq jobs, they carry only its version
+    config_snapshot.init_app(app)
+    # devices, their drivers and polling specs, built once from DEVICES config
+    registry.init_app(app)
+    # rq queues and workers for each controller host
+    lanes.init_app(app)
 
     # init database
     db.init_app(app)
+    timeseries.init_app(app)
 
     # init tasks
     init_tasks(app)
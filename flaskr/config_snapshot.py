@@ -0,0 +1,131 @@
+import hashlib
+import json
+import threading
+from . import redis_pool
+
+"""
+Versioned snapshot of app config for rq jobs.
+Jobs do not carry config, only version of snapshot - hash of whitelisted config keys.
+start-periodic publishes snapshot once to redis key config:{version}, every process loads snapshot
+of given version once and keeps it in memory. Process, that was created from the same config file,
+has the same version and never asks redis.
+Runtime state in DEVICES (last_time_active, status etc., initial data values) is not part of snapshot,
+so it does not change version. Credentials are not published, every process adds its own ones
+from its config. Superseded versions expire after SUPERSEDED_TTL.
+"""
+
+# only these keys are needed in jobs, rq-dashboard settings, secret key etc. stay in app
+SNAPSHOT_KEYS = (
+    "DEVICES", "QUEUE", "DATA_DB_NAME", *redis_pool.SETTINGS,
+    "ESP_IP_ADDR", "EXPERIMENT",
+    "POLL_INTERVAL", "HTTP_TRANSPORT", "DEVICE_INFO_MAX_AGE",
+)
+# not stored in redis, taken from config of each process
+SECRET_KEYS = ("ESP_AUTH_LOGIN", "ESP_AUTH_PASS")
+# runtime state of device in config, only initial values for redis
+VOLATILE_PARAMS = ("last_time_active", "status", "last_error", "uptime_sec")
+CONFIG_KEY = "config:{version}"
+CURRENT_VERSION_KEY = "config:current"
+# previous version lives so long, jobs enqueued with it can still load it
+SUPERSEDED_TTL = 24 * 3600
+
+_cache = {}   # version -> snapshot
+_cache_lock = threading.Lock()
+# version of config of this process, its redis settings and credentials
+_local = {"version": None, "redis": None, "secrets": {}}
+
+
+def stable_device(device_dict):
+    """ device config without runtime state: volatile params are dropped, data keeps only its keys """
+    device = dict(device_dict)
+    device["params"] = {key: value for key, value in device_dict["params"].items() if key not in VOLATILE_PARAMS}
+    if "data" in device_dict:
+        device["data"] = {key: None for key in device_dict["data"]}
+    return device
+
+
+def make_snapshot(config, data_db_path):
+    snapshot = {key: config[key] for key in SNAPSHOT_KEYS if key in config}
+    if "DEVICES" in snapshot:
+        snapshot["DEVICES"] = [stable_device(device_dict) for device_dict in snapshot["DEVICES"]]
+    snapshot["DATA_DB_PATH"] = data_db_path
+    return snapshot
+
+
+def snapshot_version(snapshot):
+    dump = json.dumps(snapshot, sort_keys=True, default=str)
+    return hashlib.sha1(dump.encode("utf-8")).hexdigest()[:16]
+
+
+def local_version():
+    """ version of config, this process was created from """
+    return _local["version"]
+
+
+def _public_dump(version):
+    public = {key: value for key, value in _cache[version].items() if key not in SECRET_KEYS}
+    return json.dumps(public, default=str)
+
+
+def publish(red):
+    """
+    store snapshot of this process config to redis and mark it as current
+    :return: version to pass to jobs
+    """
+    version = _local["version"]
+    previous = red.get(CURRENT_VERSION_KEY)
+    if isinstance(previous, bytes):
+        previous = previous.decode()
+    pipe = red.pipeline()
+    pipe.set(CONFIG_KEY.format(version=version), _public_dump(version))
+    pipe.set(CURRENT_VERSION_KEY, version)
+    if previous and previous != version:
+        pipe.expire(CONFIG_KEY.format(version=previous), SUPERSEDED_TTL)
+    pipe.execute()
+    return version
+
+
+def ensure_published(red):
+    """
+    store snapshot of this process, if redis has no such version, for web server, that enqueues jobs itself.
+    Web server does not mark it as current and does not expire other versions: its version can differ
+    from the one of start-periodic (e.g. DATA_DB_PATH depends on cwd). Not current version expires
+    after SUPERSEDED_TTL, so key is checked before every job, not once per process.
+    :return: version to pass to jobs
+    """
+    version = _local["version"]
+    key = CONFIG_KEY.format(version=version)
+    if not red.exists(key):
+        red.set(key, _public_dump(version), ex=SUPERSEDED_TTL, nx=True)
+    return version
+
+
+def get_config(version):
+    """ snapshot of given version, from memory or, once per process, from redis """
+    with _cache_lock:
+        snapshot = _cache.get(version)
+    if snapshot is not None:
+        return snapshot
+    red = redis_pool.get_redis(_local["redis"])
+    raw = red.get(CONFIG_KEY.format(version=version))
+    if raw is None:
+        raise LookupError(f"Config snapshot {version} is not published to redis, restart start-periodic")
+    snapshot = dict(json.loads(raw), **_local["secrets"])
+    with _cache_lock:
+        _cache[version] = snapshot
+    return snapshot
+
+
+def init_snapshot(config, data_db_path):
+    snapshot = make_snapshot(config, data_db_path)
+    version = snapshot_version(snapshot)
+    _local["secrets"] = {key: config[key] for key in SECRET_KEYS if key in config}
+    with _cache_lock:
+        _cache[version] = dict(snapshot, **_local["secrets"])
+    _local["version"] = version
+    _local["redis"] = redis_pool.connection_settings(config)
+    return version
+
+
+def init_app(app):
+    init_snapshot(app.config, app.instance_path + "/" + app.config['DATA_DB_NAME'])
@@ -1,26 +1,157 @@
-import redis
 import click
+import threading
+import time
 from flask import current_app, g
 import sqlite3
 from sqlite3 import Error
+from . import timeseries
+from . import redis_pool
 
 
-def get_device_states():
-    """method to update flask web page data from db"""
-    # lets load all devices data from redis hashes
-    red = get_db()
-    reconstructed_devices = []
-    for device_dict in current_app.config['DEVICES']:
-        # to get needed names
+# global counter of device state changes, every write that really changes some field
+# increments it and stamps the device version key with the new value
+VERSION_KEY = "devices:version"
+
+# pub/sub channel where writers publish changed fields of devices, see push.py
+UPDATES_CHANNEL = "devices:updates"
+
+# message published to UPDATES_CHANNEL after init-db, all clients must reload full state
+RESET_MESSAGE = "reset"
+
+# lua script for writers - updates only changed fields of one device hash,
+# bumps versions, stamps revisions of changed fields and publishes them in the same round trip
+# KEYS[1] - device hash (device_<id>:<section>), KEYS[2] - device version key, KEYS[3] - global version key,
+# KEYS[4] - device fields revisions hash (device_<id>:rev, fields are named <section>:<field>)
+# ARGV[1] - updates channel, ARGV[2] - device id, ARGV[3] - section,
+# then ARGV - field1, value1, field2, value2 ...
+WRITE_DEVICE_STATE_LUA = """
+local fields = {}
+local changed = {}
+for i = 4, #ARGV, 2 do
+    if redis.call('HGET', KEYS[1], ARGV[i]) ~= ARGV[i + 1] then
+        redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+        fields[ARGV[i]] = ARGV[i + 1]
+        changed[#changed + 1] = ARGV[i]
+    end
+end
+if #changed == 0 then
+    return 0
+end
+local version = redis.call('INCR', KEYS[3])
+redis.call('SET', KEYS[2], version)
+for _, field in ipairs(changed) do
+    redis.call('HSET', KEYS[4], ARGV[3] .. ':' .. field, version)
+end
+redis.call('PUBLISH', ARGV[1], cjson.encode({
+    version = version, device_id = ARGV[2], section = ARGV[3], fields = fields}))
+return version
+"""
+
+# per-process cache of the last snapshot of all devices, shared by all requests in this worker
+_snapshot_cache = {"expires": 0.0, "snapshot": None}
+_snapshot_lock = threading.Lock()
+
+
+def write_device_state(red, dev_id, section, mapping):
+    """
+    store fields of one device section to redis, bump device version and publish changed fields
+    to UPDATES_CHANNEL if something changed
+    can be used with redis client or with pipeline (then result will be returned by pipeline.execute())
+    :param red: redis client or pipeline
+    :param dev_id: device id from config
+    :param section: name of device hash - params, data, commands
+    :param mapping: dict with fields to update
+    :return: new global version or 0 if nothing was changed
+    """
+    args = [UPDATES_CHANNEL, dev_id, section]
+    for field, value in mapping.items():
+        args.extend([field, value if value is not None else ""])
+    script = red.register_script(WRITE_DEVICE_STATE_LUA)   # evalsha, script body is sent only once
+    return script(keys=[f"device_{dev_id}:{section}", f"device_{dev_id}:version", VERSION_KEY,
+                        f"device_{dev_id}:rev"], args=args)
+
+
+def read_device_snapshot(red, devices_conf_list):
+    """
+    read the whole devices tree from redis in one pipelined round trip
+    :return: dict with global version, list of device dicts, versions of each device by its id
+    and revisions of each device field (<section>:<field>) by device id
+    """
+    pipe = red.pipeline(transaction=False)
+    pipe.get(VERSION_KEY)
+    for device_dict in devices_conf_list:
         dev_id = device_dict["params"]["device_id"]
-        recon_device = {}   # updated dict
-        # update device params from redis
+        pipe.get(f"device_{dev_id}:version")
+        pipe.hgetall(f"device_{dev_id}:rev")
         for key in device_dict.keys():
-            hash_name = f"device_{dev_id}:{key}"
-            recon_device[key] = red.hgetall(hash_name)
-        # load it to updated list
-        reconstructed_devices.append(recon_device)
-    return reconstructed_devices
+            pipe.hgetall(f"device_{dev_id}:{key}")
+    replies = iter(pipe.execute())
+
+    snapshot = {"version": int(next(replies) or 0), "devices": [], "versions": {}, "revisions": {}}
+    for device_dict in devices_conf_list:
+        dev_id = device_dict["params"]["device_id"]
+        snapshot["versions"][str(dev_id)] = int(next(replies) or 0)
+        snapshot["revisions"][str(dev_id)] = {field: int(rev) for field, rev in next(replies).items()}
+        snapshot["devices"].append({key: next(replies) for key in device_dict.keys()})
+    return snapshot
+
+
+def get_device_snapshot(min_version=None):
+    """
+    cached version of read_device_snapshot, cache lives DEVICE_STATES_CACHE_TTL seconds,
+    so all requests and polls in this process in that time share one redis round trip
+    :param min_version: version, client already has (from other worker), older cache is read again
+    """
+    ttl = current_app.config.get("DEVICE_STATES_CACHE_TTL", 0.5)
+    with _snapshot_lock:
+        now = time.monotonic()
+        snapshot = _snapshot_cache["snapshot"]
+        if snapshot is None or now >= _snapshot_cache["expires"] or \
+                (min_version is not None and min_version > snapshot["version"]):
+            _snapshot_cache["snapshot"] = read_device_snapshot(get_db(), current_app.config['DEVICES'])
+            _snapshot_cache["expires"] = now + ttl
+        return _snapshot_cache["snapshot"]
+
+
+def get_device_states(since=None):
+    """
+    method to update flask web page data from db
+    :param since: if set, return only devices changed after that global version
+    """
+    snapshot = get_device_snapshot(since)
+    # version can go back after init-db, in that case client must get everything
+    if since is None or since > snapshot["version"]:
+        return snapshot["devices"]
+    return [device for device_dict, device in zip(current_app.config['DEVICES'], snapshot["devices"])
+            if snapshot["versions"][str(device_dict["params"]["device_id"])] > since]
+
+
+def get_device_delta(since=None):
+    """
+    versioned state protocol for web clients
+    :param since: global version from previous response, if not set full state is returned
+    :return: dict with current version, flag if it is full state and list of devices, where every
+    device contains only fields changed after given version (and always params.device_id)
+    """
+    snapshot = get_device_snapshot(since)
+    if since is None or since > snapshot["version"]:
+        return {"version": snapshot["version"], "full": True, "devices": snapshot["devices"]}
+
+    devices = []
+    for device_dict, device in zip(current_app.config['DEVICES'], snapshot["devices"]):
+        dev_id = str(device_dict["params"]["device_id"])
+        if snapshot["versions"][dev_id] <= since:
+            continue
+        revisions = snapshot["revisions"][dev_id]
+        delta = {}
+        for section, fields in device.items():
+            changed = {field: value for field, value in fields.items()
+                       if revisions.get(f"{section}:{field}", 0) > since}
+            if changed:
+                delta[section] = changed
+        delta.setdefault("params", {})["device_id"] = dev_id
+        devices.append(delta)
+    return {"version": snapshot["version"], "full": False, "devices": devices}
 
 
 def get_db():
@@ -30,96 +161,117 @@ def get_db():
     :return:
     """
     if 'db' not in g:
-        # TODO update from config in future
-        g.db = redis.Redis(host='localhost', port=6379, decode_responses=True)   # mb it is important to already decode
+        g.db = redis_pool.get_redis()   # mb it is important to already decode
     return g.db
 
 
+def get_rq_db():
+    """
+    redis pointer without decode_responses for rq queues, rq stores pickled jobs
+    """
+    if 'rq_db' not in g:
+        g.rq_db = redis_pool.get_redis(decode_responses=False)
+    return g.rq_db
+
+
 def get_data_db():
     """
     we have operational db - redis and data db - sqlite
     this method returns sqlite db pointer
     :return:
     """
-    if 'db' not in g:
-        # TODO update from config in future
-        g.db = redis.Redis(host='localhost', port=6379, decode_responses=True)   # mb it is important to already decode
-    return g.db
+    if 'data_db' not in g:
+        g.data_db = connect_data_db(current_app.instance_path + "/" + current_app.config['DATA_DB_NAME'])
+    return g.data_db
+
+
+def connect_data_db(db_path):
+    """
+    open sqlite data db in WAL mode, so readers never block writer and commits are cheap
+    :param db_path: full path to sqlite file
+    """
+    conn = sqlite3.connect(db_path, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")   # persistent, stored in db file
+    conn.execute("PRAGMA synchronous=NORMAL")   # in WAL mode fsync only on checkpoint, still safe for app crash
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-16000")   # 16 MB
+    return conn
 
 
 def close_db(e=None):
     db = g.pop('db', None)
     if db is not None:
         db.close()
+    rq_db = g.pop('rq_db', None)
+    if rq_db is not None:
+        rq_db.close()
+    data_db = g.pop('data_db', None)
+    if data_db is not None:
+        data_db.close()
 
 
-def init_db():
-    """ this method must be called only when server created or re-created, it will fully rewrite devices data """
-    devices_conf_list = current_app.config['DEVICES']
-
-    red = get_db()
-    print("Deleting current redis keys to clear app state.")
-    # clear all device_* data from db0
-    # Pattern to match
-    pattern = 'device_*'
-
-    # Use SCAN to find keys matching the pattern
-    # SCAN returns a tuple (cursor, [list of keys])
-    # We start with cursor 0, and SCAN iterates until cursor returns 0 again
-    cursor = '0'
-    while cursor != 0:
-        cursor, keys = red.scan(cursor=cursor, match=pattern, count=100)
-        for key in keys:
-            # Delete each key
-            red.delete(key)
-            print(f"Deleted key: {key}")
-
-    print("Finished deleting keys.")
-
-    # load data from devices config file and store it to redis
-    # iterate over all fields in all devices in list
-    print("Loading new redis keys from app config")
+def replace_device_state(pipe, devices_conf_list, batch=500):
+    """
+    replace all device_* keys with state from config in one MULTI/EXEC, so readers see either old
+    or new state, never half of it. Used with red.transaction(..., VERSION_KEY): if some writer
+    bumps global version meanwhile, transaction is retried
+    :param pipe: pipeline in watch mode
+    :param batch: keys in one UNLINK command
+    :return: (new global version, number of deleted keys)
+    """
+    # global version must not go back after re-init, else web clients can miss new state
+    version = int(pipe.get(VERSION_KEY) or 0) + 1
+    old_keys = list(pipe.scan_iter(match="device_*", count=1000))
+    pipe.multi()
+    for i in range(0, len(old_keys), batch):
+        # UNLINK frees memory in background thread of redis
+        pipe.unlink(*old_keys[i:i + batch])
     for device_dict in devices_conf_list:
         dev_id = device_dict["params"]["device_id"]
         # Store each sub-dictionary in its own hash
         for key, val in device_dict.items():
-            hash_name = f"device_{dev_id}:{key}"
-            for field, value in val.items():
-                red.hset(hash_name, field, value if value is not None else "")
-    print("Finished loading new keys")
+            if val:
+                pipe.hset(f"device_{dev_id}:{key}",
+                          mapping={field: value if value is not None else "" for field, value in val.items()})
+        # all loaded fields are new for clients
+        revisions = {f"{key}:{field}": version for key, val in device_dict.items() for field in val}
+        if revisions:
+            pipe.hset(f"device_{dev_id}:rev", mapping=revisions)
+        pipe.set(f"device_{dev_id}:version", version)
+    pipe.set(VERSION_KEY, version)
+    pipe.publish(UPDATES_CHANNEL, RESET_MESSAGE)
+    return version, len(old_keys)
+
+
+def init_db():
+    """ this method must be called only when server created or re-created, it will fully rewrite devices data """
+    devices_conf_list = current_app.config['DEVICES']
 
-    # create tables in sqlite db for all devices in list
+    red = get_db()
+    print("Replacing redis keys of app state with devices from app config.")
+    version, deleted = red.transaction(lambda pipe: replace_device_state(pipe, devices_conf_list), VERSION_KEY,
+                                       value_from_callable=True)
+    print(f"Deleted {deleted} old keys, loaded {len(devices_conf_list)} devices, state version {version}")
 
-    # remove all old sql tables
-    # TODO mb simply remove or rename old sqlite db file if already exists
+    # create time-series schema in sqlite db and register series for all devices in list
+    # old data is not removed, samples of re-created devices are appended to same series
 
     # create db or connection
-    data_db_path = current_app.instance_path + "/" + current_app.config['DATA_DB_NAME']
-    if "data_db" not in g:
-        g.data_db = sqlite3.connect(
-            data_db_path,  #current_app.config['DATABASE'],
-            detect_types=sqlite3.PARSE_DECLTYPES
-        )
-        # g.db.row_factory = sqlite3.Row
-
-    # then create tables for all
-    print("Loading new sql tables from app config to data db")
-    for device_dict in devices_conf_list:
-        dev_id = device_dict["params"]["device_id"]
-        try:
-            # one table contain one type of data
-            # so one sensor can have multiple tables
-            for d in device_dict["data"]:
-                sql_create_sensor_data_table = f"""CREATE TABLE IF NOT EXISTS device_{dev_id}_{d} (
-                                                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                                                    datetime DATETIME NOT NULL,
-                                                    value REAL NOT NULL
-                                                );"""
-                cursor = g.data_db.cursor()
-                cursor.execute(sql_create_sensor_data_table)
-        except Error as e:
-            print("sqlite database fucked up somehow: {}".format(e))
-    print("finished loading new sql tables from app config to data db")
+    get_data_db()
+
+    print("Loading series catalogue from app config to data db")
+    try:
+        with g.data_db:
+            timeseries.create_schema(g.data_db)
+            for device_dict in devices_conf_list:
+                dev_id = device_dict["params"]["device_id"]
+                # one series contain one type of data
+                # so one sensor can have multiple series
+                for d in device_dict["data"]:
+                    timeseries.get_series_id(g.data_db, dev_id, d)
+    except Error as e:
+        print("sqlite database fucked up somehow: {}".format(e))
+    print("finished loading series catalogue from app config to data db")
 
 
 @click.command('init-db')
@@ -1,8 +1,70 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
 from flaskr.utils.logger import Logger
-from typing import Optional
+from flaskr.drivers.transport import get_transport, new_async_transport, AsyncTransport
+from flaskr.drivers import info_cache
+from typing import Optional, Callable, Dict, Tuple, Any
 
 class BaseDriver:
     def __init__(self, host: str, name: str = "unnamed"):
         self.name = name
         self.base_url = f"http://{host}"
-        self.logger = Logger.get_logger(f"{self.__class__.__name__}_{self.name}") 
\ No newline at end of file
+        self.logger = Logger.get_logger(f"{self.__class__.__name__}_{self.name}")
+        # pooled session with timeouts and retries, shared by all drivers of this host
+        self.transport = get_transport(host)
+
+    def _init_info_cache(self, info_max_age: Optional[float]):
+        """ /info payload of device is cached for info_max_age seconds, see info_cache """
+        self.info_cache = info_cache.get_info_cache(self.base_url)
+        self.info_max_age = info_cache.DEFAULT_MAX_AGE if info_max_age is None else info_max_age
+
+    @staticmethod
+    def _send_concurrently(send: Callable, payloads: Dict[Any, Any]) -> Tuple[Dict[Any, Any], float]:
+        """
+        call send(payload) for every channel at once, firmware accepts only one channel per request
+        number of simultaneous requests is still limited by transport of host
+        :return: (dict channel -> result of send, total latency in seconds)
+        """
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=max(len(payloads), 1)) as executor:
+            futures = {channel: executor.submit(send, payload) for channel, payload in payloads.items()}
+            results = {channel: future.result() for channel, future in futures.items()}
+        return results, time.monotonic() - start
+
+
+class AsyncBaseDriver:
+    def __init__(self, host: str, name: str = "unnamed", transport: Optional[AsyncTransport] = None):
+        """
+        Args:
+            transport: pass one AsyncTransport to all drivers of event loop to share connections,
+                else driver creates its own one and closes it in close()
+        """
+        self.name = name
+        self.base_url = f"http://{host}"
+        self.logger = Logger.get_logger(f"{self.__class__.__name__}_{self.name}")
+        self.own_transport = transport is None
+        self.transport = transport if transport is not None else new_async_transport()
+
+    def _init_info_cache(self, info_max_age: Optional[float]):
+        """ /info payload of device is cached for info_max_age seconds, see info_cache """
+        self.info_cache = info_cache.get_async_info_cache(self.transport, self.base_url)
+        self.info_max_age = info_cache.DEFAULT_MAX_AGE if info_max_age is None else info_max_age
+
+    @staticmethod
+    async def _send_concurrently(send: Callable, payloads: Dict[Any, Any]) -> Tuple[Dict[Any, Any], float]:
+        """ async variant of BaseDriver._send_concurrently, send is coroutine function """
+        start = time.monotonic()
+        channels = list(payloads)
+        results = await asyncio.gather(*(send(payloads[channel]) for channel in channels))
+        return dict(zip(channels, results)), time.monotonic() - start
+
+    async def close(self):
+        if self.own_transport:
+            await self.transport.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
@@ -1,49 +1,143 @@
-import requests
 import json
-from typing import Union, Tuple, Dict, Any
-from flaskr.drivers.base_driver import BaseDriver
+import logging
+from typing import Union, Tuple, Dict, Any, Optional
+from flaskr.drivers.base_driver import BaseDriver, AsyncBaseDriver
 
-class ESP32RelayDriver(BaseDriver):
+
+class ESP32RelayCodec:
+    """
+    Validation of arguments and parsing of responses of ESP32 relay API,
+    shared by sync and async drivers, which only send requests
+    """
+    # drivers have own logger, codec alone checks arguments of commands in web server
+    logger = logging.getLogger(__name__)
+    SENSOR_ERROR_VALUE = -255  # Значение, означающее что датчик не установлен или сломан
+
+    RELAY_ERROR_MESSAGES = [
+        "ERROR Failed to parse JSON",
+        "ERROR Invalid channel type",
+        "ERROR Invalid state type",
+        "ERROR invalid params!"
+    ]
+
+    RELAY_HEADERS: Dict[str, str] = {'Content-Type': 'application/json'}
+    RESET_HEADERS: Dict[str, str] = {'Content-Type': 'text/html'}
+
+    def _parse_info(self, status: int, text: str) -> Optional[Dict]:
+        data = json.loads(text)
+        self.logger.debug(f"Got info response: {data}")
+        if status == 200:
+            return data
+        self.logger.warning(f"Unexpected status code: {status}")
+        return None
+
+    def _parse_sensor_value(self, sensor_type: str, status: int, text: str) -> Optional[float]:
+        self.logger.debug(f"Got sensor value response: {text}")
+        if status == 200:
+            value = float(text)
+            if value == self.SENSOR_ERROR_VALUE:
+                self.logger.warning(f"Sensor error value received for {sensor_type}")
+                return None
+            return value
+        self.logger.warning(f"Unexpected status code for sensor {sensor_type}: {status}")
+        return None
+
+    def _sensor_from_info(self, sensor_type: str, info: Dict) -> Optional[float]:
+        try:
+            value = float(info[sensor_type])
+        except (TypeError, ValueError):
+            self.logger.warning(f"Wrong value of sensor {sensor_type} in info: {info[sensor_type]!r}")
+            return None
+        if value == self.SENSOR_ERROR_VALUE:
+            self.logger.warning(f"Sensor error value received for {sensor_type}")
+            return None
+        return value
+
+    def _relay_payload(self, channel: int, state: Union[bool, int]) -> Dict[str, Any]:
+        # Проверка, что channel является целым числом
+        if not isinstance(channel, int):
+            self.logger.error(f"Invalid channel type: {type(channel)}. Must be an integer.")
+            raise ValueError("Channel must be an integer.")
+
+        # Преобразуем bool в int если нужно
+        if isinstance(state, bool):
+            state_value = 1 if state else 0
+        elif isinstance(state, int) and state in [0, 1]:
+            state_value = state
+        else:
+            self.logger.error(f"Invalid state value: {state}. Must be 0 or 1.")
+            raise ValueError("State must be either 0 or 1.")
+
+        return {
+            "channel": channel,
+            "state": state_value
+        }
+
+    def _parse_relay_response(self, data: Dict[str, Any], text: str) -> Tuple[bool, str]:
+        result: str = text.strip()
+
+        # Проверяем все возможные ошибки
+        if any(error in result for error in self.RELAY_ERROR_MESSAGES):
+            self.logger.warning(f"Error setting relay state: {result}")
+            return False, result
+
+        if "SUCCESS" in result:
+            self.logger.info(f"Successfully set relay state: channel={data['channel']}, state={data['state']}")
+            return True, result
+
+        self.logger.warning(f"Unexpected response when setting relay state: {result}")
+        return False, f"Неожиданный ответ: {result}"
+
+    def _parse_reset_response(self, status: int) -> bool:
+        if status == 200:
+            self.logger.info("Device reset successful")
+            return True
+        self.logger.warning(f"Device reset failed with status code: {status}")
+        return False
+
+
+class ESP32RelayDriver(ESP32RelayCodec, BaseDriver):
     """
     Driver for ESP32 relay based on API from https://github.com/houseofbigseals/esp32_relay
     """
-    def __init__(self, host, name="relay_1"):
+    def __init__(self, host, name="relay_1", info_max_age=None):
         """
         Args:
             host (str): IP address or hostname of ESP32 (example: '10.10.0.7' or 'esp32_relay_4.local')
             name (str): Name identifier for the relay
+            info_max_age (float): seconds to reuse /info payload of this host, default from info_cache
         """
         super().__init__(host, name)
-        self.SENSOR_ERROR_VALUE = -255  # Значение, означающее что датчик не установлен или сломан
+        self._init_info_cache(info_max_age)
 
     def get_info(self):
-        """Get state of all relays and sensors"""
+        """Get state of all relays and sensors, concurrent callers share one request"""
+        return self.info_cache.get(self._fetch_info, self.info_max_age)
+
+    def _fetch_info(self):
         try:
-            response = requests.get(f"{self.base_url}/info")
-            self.logger.debug(f"Got info response: {response.json()}")
-            if response.status_code == 200:
-                return response.json()
-            self.logger.warning(f"Unexpected status code: {response.status_code}")
+            response = self.transport.get(f"{self.base_url}/info")
+            return self._parse_info(response.status_code, response.text)
         except Exception as e:
             self.logger.error(f"Error getting info: {str(e)}")
         return None
 
     def get_sensor_value(self, sensor_type):
         """
-        Get specific sensor value
+        Get specific sensor value, it is taken from /info payload, that has all sensors
         Args:
             sensor_type (str): One of: ext_temp, ext_hum, int_temp, int_hum, roots_temp
         """
+        info = self.get_info()
+        if info is not None and sensor_type in info:
+            return self._sensor_from_info(sensor_type, info)
+        # /info failed or has no such sensor - ask sensor endpoint
+        return self._fetch_sensor_value(sensor_type)
+
+    def _fetch_sensor_value(self, sensor_type):
         try:
-            response = requests.get(f"{self.base_url}/{sensor_type}")
-            self.logger.debug(f"Got sensor value response: {response.text}")
-            if response.status_code == 200:
-                value = float(response.text)
-                if value == self.SENSOR_ERROR_VALUE:
-                    self.logger.warning(f"Sensor error value received for {sensor_type}")
-                    return None
-                return value
-            self.logger.warning(f"Unexpected status code for sensor {sensor_type}: {response.status_code}")
+            response = self.transport.get(f"{self.base_url}/{sensor_type}")
+            return self._parse_sensor_value(sensor_type, response.status_code, response.text)
         except Exception as e:
             self.logger.error(f"Error getting sensor value for {sensor_type}: {str(e)}")
         return None
@@ -57,74 +151,118 @@ class ESP32RelayDriver(BaseDriver):
         Returns:
             Tuple[bool, str]: (success, message)
         """
-        headers: Dict[str, str] = {'Content-Type': 'application/json'}
-        
-        # Проверка, что channel является целым числом
-        if not isinstance(channel, int):
-            self.logger.error(f"Invalid channel type: {type(channel)}. Must be an integer.")
-            raise ValueError("Channel must be an integer.")
-        
-        # Преобразуем bool в int если нужно
-        if isinstance(state, bool):
-            state_value = 1 if state else 0
-        elif isinstance(state, int) and state in [0, 1]:
-            state_value = state
-        else:
-            self.logger.error(f"Invalid state value: {state}. Must be 0 or 1.")
-            raise ValueError("State must be either 0 or 1.")
-        
-        data: Dict[str, Any] = {
-            "channel": channel,
-            "state": state_value
-        }
-        
+        return self._post_relay(self._relay_payload(channel, state))
+
+    def set_relays(self, states: Dict[int, Union[bool, int]]) -> Tuple[Dict[int, Tuple[bool, str]], float]:
+        """
+        Set state of several relays at once, all arguments are validated before any request is sent
+        Args:
+            states (Dict[int, Union[bool, int]]): channel -> state
+        Returns:
+            Tuple[Dict[int, Tuple[bool, str]], float]: (channel -> (success, message), total latency in seconds)
+        """
+        payloads = {channel: self._relay_payload(channel, state) for channel, state in states.items()}
+        return self._send_concurrently(self._post_relay, payloads)
+
+    def _post_relay(self, data: Dict[str, Any]) -> Tuple[bool, str]:
         try:
-            self.logger.debug(f"Setting relay state: channel={channel}, state={state_value}")
-            response = requests.post(
+            self.logger.debug(f"Setting relay state: channel={data['channel']}, state={data['state']}")
+            response = self.transport.post(
                 f"{self.base_url}/relay",
-                headers=headers,
+                headers=self.RELAY_HEADERS,
                 data=json.dumps(data)
             )
-            
-            result: str = response.text.strip()
-            
-            # Проверяем все возможные ошибки
-            error_messages = [
-                "ERROR Failed to parse JSON",
-                "ERROR Invalid channel type",
-                "ERROR Invalid state type",
-                "ERROR invalid params!"
-            ]
-            
-            if any(error in result for error in error_messages):
-                self.logger.warning(f"Error setting relay state: {result}")
-                return False, result
-            
-            if "SUCCESS" in result:
-                self.logger.info(f"Successfully set relay state: channel={channel}, state={state_value}")
-                return True, result
-            
-            self.logger.warning(f"Unexpected response when setting relay state: {result}")
-            return False, f"Неожиданный ответ: {result}"
-            
+            self.info_cache.invalidate()
+            return self._parse_relay_response(data, response.text)
         except Exception as e:
             self.logger.error(f"Error setting relay state: {str(e)}")
             return False, f"Ошибка запроса: {str(e)}"
 
     def reset_device(self):
         """Force reset the device"""
-        headers = {'Content-Type': 'text/html'}
         try:
             self.logger.info("Attempting to reset the device")
-            response = requests.post(
+            response = self.transport.post(
+                f"{self.base_url}/reset",
+                headers=self.RESET_HEADERS,
+                data='force_reset'
+            )
+            self.info_cache.invalidate()
+            return self._parse_reset_response(response.status_code)
+        except Exception as e:
+            self.logger.error(f"Error during device reset: {str(e)}")
+        return False
+
+
+class AsyncESP32RelayDriver(ESP32RelayCodec, AsyncBaseDriver):
+    """
+    Async variant of ESP32RelayDriver with the same methods, results and validation
+    """
+    def __init__(self, host, name="relay_1", transport=None, info_max_age=None):
+        super().__init__(host, name, transport)
+        self._init_info_cache(info_max_age)
+
+    async def get_info(self):
+        """Get state of all relays and sensors, concurrent callers share one request"""
+        return await self.info_cache.get(self._fetch_info, self.info_max_age)
+
+    async def _fetch_info(self):
+        try:
+            status, text = await self.transport.get(f"{self.base_url}/info")
+            return self._parse_info(status, text)
+        except Exception as e:
+            self.logger.error(f"Error getting info: {str(e)}")
+        return None
+
+    async def get_sensor_value(self, sensor_type):
+        """Get specific sensor value, see ESP32RelayDriver.get_sensor_value"""
+        info = await self.get_info()
+        if info is not None and sensor_type in info:
+            return self._sensor_from_info(sensor_type, info)
+        return await self._fetch_sensor_value(sensor_type)
+
+    async def _fetch_sensor_value(self, sensor_type):
+        try:
+            status, text = await self.transport.get(f"{self.base_url}/{sensor_type}")
+            return self._parse_sensor_value(sensor_type, status, text)
+        except Exception as e:
+            self.logger.error(f"Error getting sensor value for {sensor_type}: {str(e)}")
+        return None
+
+    async def set_relay_state(self, channel: int, state: Union[bool, int]) -> Tuple[bool, str]:
+        """Set relay state, see ESP32RelayDriver.set_relay_state"""
+        return await self._post_relay(self._relay_payload(channel, state))
+
+    async def set_relays(self, states: Dict[int, Union[bool, int]]) -> Tuple[Dict[int, Tuple[bool, str]], float]:
+        """Set state of several relays at once, see ESP32RelayDriver.set_relays"""
+        payloads = {channel: self._relay_payload(channel, state) for channel, state in states.items()}
+        return await self._send_concurrently(self._post_relay, payloads)
+
+    async def _post_relay(self, data: Dict[str, Any]) -> Tuple[bool, str]:
+        try:
+            self.logger.debug(f"Setting relay state: channel={data['channel']}, state={data['state']}")
+            status, text = await self.transport.post(
+                f"{self.base_url}/relay",
+                headers=self.RELAY_HEADERS,
+                data=json.dumps(data)
+            )
+            self.info_cache.invalidate()
+            return self._parse_relay_response(data, text)
+        except Exception as e:
+            self.logger.error(f"Error setting relay state: {str(e)}")
+            return False, f"Ошибка запроса: {str(e)}"
+
+    async def reset_device(self):
+        """Force reset the device"""
+        try:
+            self.logger.info("Attempting to reset the device")
+            status, text = await self.transport.post(
                 f"{self.base_url}/reset",
-                headers=headers,
+                headers=self.RESET_HEADERS,
                 data='force_reset'
             )
-            if response.status_code == 200:
-                self.logger.info("Device reset successful")
-                return True
-            self.logger.warning(f"Device reset failed with status code: {response.status_code}")
+            self.info_cache.invalidate()
+            return self._parse_reset_response(status)
         except Exception as e:
             self.logger.error(f"Error during device reset: {str(e)}")
-        return False
\ No newline at end of file
+        return False
@@ -1,9 +1,29 @@
 
-import requests
+import base64
+import json
 from requests.auth import HTTPBasicAuth
+from flaskr.drivers.transport import get_transport, new_async_transport
 
 
-class ESPHomeDeviceDriver:
+class ESPHomeCodec:
+    """
+    urls and parsing of responses of esphome web api, shared by sync and async drivers
+    """
+    def _init_device(self, ip_addr, type, name, auth_login, auth_pass):
+        self.url = "http://" + ip_addr + "/" + type + "/" + name
+        self.auth_login = auth_login
+        self.auth_pass = auth_pass
+
+    @staticmethod
+    def _parse_state(status, text):
+        if status == 200:
+            data = json.loads(text)
+        else:
+            data = {}
+        return status, data
+
+
+class ESPHomeDeviceDriver(ESPHomeCodec):
     """
     simple driver to retrieve data from ESPHome powered esp32 device using rest web-api
     https://esphome.io/web-api/
@@ -14,21 +34,17 @@ class ESPHomeDeviceDriver:
 
     """
     def __init__(self, ip_addr, type, name, auth_login, auth_pass):
-        self.url = "http://" + ip_addr + "/" + type + "/" + name
-        self.auth_login = auth_login
-        self.auth_pass = auth_pass
+        self._init_device(ip_addr, type, name, auth_login, auth_pass)
+        # pooled session with timeouts and retries, shared with other drivers of this device
+        self.transport = get_transport(ip_addr)
 
     def get(self):
         """
         simply send get to device url and return status code and response
         :return:
         """
-        response = requests.get(self.url, auth=HTTPBasicAuth(self.auth_login, self.auth_pass))
-        if response.status_code == 200:
-            data = response.json()
-        else:
-            data = {}
-        return response.status_code, data
+        response = self.transport.get(self.url, auth=HTTPBasicAuth(self.auth_login, self.auth_pass))
+        return self._parse_state(response.status_code, response.text)
 
     def post_no_params(self, command):
         """
@@ -36,7 +52,7 @@ class ESPHomeDeviceDriver:
         :param command:  for switch - turn_on, turn_off and toggle
         :return:
         """
-        response = requests.post(self.url + "/" + command, auth=HTTPBasicAuth(self.auth_login, self.auth_pass))
+        response = self.transport.post(self.url + "/" + command, auth=HTTPBasicAuth(self.auth_login, self.auth_pass))
         return response.status_code, {}   # no data in switch response somehow, so just status
 
     def post_params(self, command, params_dict):
@@ -50,6 +66,31 @@ class ESPHomeDeviceDriver:
         pass
 
 
+class AsyncESPHomeDeviceDriver(ESPHomeCodec):
+    """
+    async variant of ESPHomeDeviceDriver, methods return the same (status, data)
+    pass one AsyncTransport to all drivers of event loop to share connections
+    """
+    def __init__(self, ip_addr, type, name, auth_login, auth_pass, transport=None):
+        self._init_device(ip_addr, type, name, auth_login, auth_pass)
+        credentials = base64.b64encode(f"{auth_login}:{auth_pass}".encode()).decode()
+        self.auth_headers = {"Authorization": "Basic " + credentials}
+        self.own_transport = transport is None
+        self.transport = transport if transport is not None else new_async_transport()
+
+    async def get(self):
+        status, text = await self.transport.get(self.url, headers=self.auth_headers)
+        return self._parse_state(status, text)
+
+    async def post_no_params(self, command):
+        status, text = await self.transport.post(self.url + "/" + command, headers=self.auth_headers)
+        return status, {}
+
+    async def close(self):
+        if self.own_transport:
+            await self.transport.close()
+
+
 if __name__ == "__main__":
     # The URL to send the GET request to
     # url = ('http://10.10.0.7/sensor/kolos-3_dht_internal_temp')
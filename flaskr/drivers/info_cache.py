@@ -0,0 +1,116 @@
+import asyncio
+import threading
+import time
+import weakref
+from concurrent.futures import Future
+
+"""
+Read-through cache of /info payload of device, one per device host, shared by all drivers of process.
+Payload younger than max_age is returned without request, and concurrent callers wait for one
+request in flight instead of sending their own (single-flight), so sensors of device cost one request.
+"""
+
+# default max age of cached payload in seconds, 0 - only concurrent callers share request
+DEFAULT_MAX_AGE = 0.0
+
+_caches = {}
+_caches_lock = threading.Lock()
+# async caches belong to event loop, so they are kept per async transport
+_async_caches = weakref.WeakKeyDictionary()
+
+
+class InfoCache:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.payload = None
+        self.fetched_at = 0.0   # time.monotonic() of last successful fetch
+        self.in_flight = None   # Future of running fetch
+
+    def get(self, fetch, max_age):
+        """
+        :param fetch: function without arguments, that requests payload from device, returns None on failure
+        :param max_age: seconds
+        :return: cached or fresh payload, failures are not cached
+        """
+        with self.lock:
+            if self.payload is not None and time.monotonic() - self.fetched_at <= max_age:
+                return self.payload
+            future = self.in_flight
+            leader = future is None
+            if leader:
+                future = self.in_flight = Future()
+        if not leader:
+            return future.result()
+
+        try:
+            payload = fetch()
+        except BaseException as e:
+            with self.lock:
+                self.in_flight = None
+            future.set_exception(e)
+            raise
+        with self.lock:
+            if payload is not None:
+                self.payload = payload
+                self.fetched_at = time.monotonic()
+            self.in_flight = None
+        future.set_result(payload)
+        return payload
+
+    def invalidate(self):
+        """ forget payload, for example after command, that changed state of device """
+        with self.lock:
+            self.payload = None
+
+
+class AsyncInfoCache:
+    """ the same for async drivers, must be used from one event loop """
+    def __init__(self):
+        self.payload = None
+        self.fetched_at = 0.0
+        self.in_flight = None   # asyncio.Task of running fetch
+
+    async def get(self, fetch, max_age):
+        """
+        :param fetch: coroutine function without arguments, returns None on failure
+        """
+        if self.payload is not None and time.monotonic() - self.fetched_at <= max_age:
+            return self.payload
+        if self.in_flight is None:
+            self.in_flight = asyncio.ensure_future(self._fetch(fetch))
+        # shield - cancelled caller must not cancel request of others
+        return await asyncio.shield(self.in_flight)
+
+    async def _fetch(self, fetch):
+        try:
+            payload = await fetch()
+            if payload is not None:
+                self.payload = payload
+                self.fetched_at = time.monotonic()
+            return payload
+        finally:
+            self.in_flight = None
+
+    def invalidate(self):
+        self.payload = None
+
+
+def configure(max_age):
+    global DEFAULT_MAX_AGE
+    DEFAULT_MAX_AGE = max_age
+
+
+def get_info_cache(base_url) -> InfoCache:
+    with _caches_lock:
+        cache = _caches.get(base_url)
+        if cache is None:
+            cache = _caches[base_url] = InfoCache()
+        return cache
+
+
+def get_async_info_cache(transport, base_url) -> AsyncInfoCache:
+    caches = _async_caches.setdefault(transport, {})
+    cache = caches.get(base_url)
+    if cache is None:
+        cache = caches[base_url] = AsyncInfoCache()
+    return cache
@@ -1,27 +1,89 @@
 import requests
 import json
+import logging
 from typing import Optional, Tuple, Dict, Union
-from flaskr.drivers.base_driver import BaseDriver
+from flaskr.drivers.base_driver import BaseDriver, AsyncBaseDriver
 
-class PWMLampDriver(BaseDriver):
-    def __init__(self, host: str, name: str = "unnamed"):
+
+class PWMLampCodec:
+    """
+    Проверка аргументов и разбор ответов API PWM-лампы,
+    общие для синхронного и асинхронного драйверов
+    """
+    # у драйверов свой логгер, сам кодек проверяет аргументы команд в веб-сервере
+    logger = logging.getLogger(__name__)
+    PWM_HEADERS: Dict[str, str] = {'Content-Type': 'application/json'}
+    RESET_HEADERS: Dict[str, str] = {'Content-Type': 'text/html'}
+
+    def _parse_info(self, text: str) -> Optional[Dict]:
+        data = json.loads(text)
+        self.logger.debug(f"Got info response: {data}")
+        return data
+
+    def _pwm_payload(self, channel: int, duty: int) -> Dict[str, int]:
+        # Проверка, что channel является целым числом
+        if not isinstance(channel, int):
+            self.logger.error("Invalid channel type: %s. Channel must be an integer.", type(channel))
+            raise ValueError("Channel must be an integer.")
+
+        # Проверка, что duty является целым числом
+        if not isinstance(duty, int):
+            self.logger.error("Invalid duty type: %s. Duty must be an integer.", type(duty))
+            raise ValueError("Duty must be an integer.")
+
+        # Проверка диапазона значений
+        if not (0 <= channel <= 3):
+            self.logger.error("Invalid channel value: %d. Channel must be between 0 and 3.", channel)
+            raise ValueError("Channel must be between 0 and 3.")
+
+        if not (0 <= duty <= 100):
+            self.logger.error("Invalid duty value: %d. Duty must be between 0 and 100.", duty)
+            raise ValueError("Duty must be between 0 and 100.")
+
+        return {"channel": channel, "duty": duty}
+
+    def _parse_pwm_response(self, data: Dict[str, int], text: str) -> Tuple[bool, str]:
+        result = text.strip()
+
+        if "SUCCESS" in result:
+            self.logger.info(f"Successfully set PWM: channel={data['channel']}, duty={data['duty']}")
+            return True, result
+        self.logger.warning(f"Failed to set PWM: {result}")
+        return False, result
+
+    def _parse_reset_response(self, text: str) -> Tuple[bool, str]:
+        result: str = text.strip()
+
+        if "force reset command" in result.lower() and "rebooting" in result.lower():
+            self.logger.info("Device reset successful")
+            return True, result
+        self.logger.warning(f"Device reset failed: {result}")
+        return False, result
+
+
+class PWMLampDriver(PWMLampCodec, BaseDriver):
+    def __init__(self, host: str, name: str = "unnamed", info_max_age: Optional[float] = None):
         """
         Инициализация драйвера PWM-лампы
         Args:
             host (str): IP-адрес или hostname устройства (например, '10.10.0.7' или 'esp32_pwm_lamp_0.local')
+            info_max_age (float): сколько секунд можно использовать ответ /info, по умолчанию из info_cache
         """
         super().__init__(host, name)
-    
+        self._init_info_cache(info_max_age)
+
     def get_info(self) -> Optional[Dict]:
-        """Получение информации о состоянии всех каналов и температуре"""
+        """Получение информации о состоянии всех каналов и температуре, одновременные вызовы делят один запрос"""
+        return self.info_cache.get(self._fetch_info, self.info_max_age)
+
+    def _fetch_info(self) -> Optional[Dict]:
         try:
-            response = requests.get(f"{self.base_url}/info")
-            self.logger.debug(f"Got info response: {response.json()}")
-            return response.json()
+            response = self.transport.get(f"{self.base_url}/info")
+            return self._parse_info(response.text)
         except Exception as e:
             self.logger.error(f"Error getting info: {str(e)}")
             return None
-    
+
     def set_pwm(self, channel: int, duty: int) -> Tuple[bool, str]:
         """
         Установка скважности ШИМ для канала
@@ -31,48 +93,33 @@ class PWMLampDriver(BaseDriver):
         Returns:
             tuple: (успех операции, текст ответа)
         """
-        # Проверка, что channel является целым числом
-        if not isinstance(channel, int):
-            self.logger.error("Invalid channel type: %s. Channel must be an integer.", type(channel))
-            raise ValueError("Channel must be an integer.")
-        
-        # Проверка, что duty является целым числом
-        if not isinstance(duty, int):
-            self.logger.error("Invalid duty type: %s. Duty must be an integer.", type(duty))
-            raise ValueError("Duty must be an integer.")
-        
-        # Проверка диапазона значений
-        if not (0 <= channel <= 3):
-            self.logger.error("Invalid channel value: %d. Channel must be between 0 and 3.", channel)
-            raise ValueError("Channel must be between 0 and 3.")
-        
-        if not (0 <= duty <= 100):
-            self.logger.error("Invalid duty value: %d. Duty must be between 0 and 100.", duty)
-            raise ValueError("Duty must be between 0 and 100.")
-        
-        headers = {'Content-Type': 'application/json'}
-        data = {"channel": channel, "duty": duty}
-        
+        return self._post_pwm(self._pwm_payload(channel, duty))
+
+    def set_pwm_many(self, duties: Dict[int, int]) -> Tuple[Dict[int, Tuple[bool, str]], float]:
+        """
+        Установка скважности ШИМ сразу для нескольких каналов, все аргументы проверяются до отправки запросов
+        Args:
+            duties (Dict[int, int]): канал -> скважность ШИМ
+        Returns:
+            tuple: (канал -> (успех операции, текст ответа), общее время выполнения в секундах)
+        """
+        payloads = {channel: self._pwm_payload(channel, duty) for channel, duty in duties.items()}
+        return self._send_concurrently(self._post_pwm, payloads)
+
+    def _post_pwm(self, data: Dict[str, int]) -> Tuple[bool, str]:
         try:
-            self.logger.debug(f"Setting PWM: channel={channel}, duty={duty}")
-            response = requests.post(
+            self.logger.debug(f"Setting PWM: channel={data['channel']}, duty={data['duty']}")
+            response = self.transport.post(
                 f"{self.base_url}/pwm",
-                headers=headers,
+                headers=self.PWM_HEADERS,
                 data=json.dumps(data)
             )
-            
-            result = response.text.strip()
-            
-            if "SUCCESS" in result:
-                self.logger.info(f"Successfully set PWM: channel={channel}, duty={duty}")
-                return True, result
-            self.logger.warning(f"Failed to set PWM: {result}")
-            return False, result
-            
+            self.info_cache.invalidate()
+            return self._parse_pwm_response(data, response.text)
         except Exception as e:
             self.logger.error(f"Error setting PWM: {str(e)}")
             return False, f"Ошибка запроса: {str(e)}"
-    
+
     def reset_device(self) -> Tuple[bool, str]:
         """
         Перезагрузка устройства
@@ -81,29 +128,80 @@ class PWMLampDriver(BaseDriver):
                 success: True если устройство перезагружается, False в противном случае
                 message: Сообщение от устройства
         """
-        headers: Dict[str, str] = {'Content-Type': 'text/html'}
         try:
             self.logger.info("Attempting device reset")
-            response: requests.Response = requests.post(
+            response: requests.Response = self.transport.post(
                 f"{self.base_url}/reset",
-                headers=headers,
+                headers=self.RESET_HEADERS,
                 data='force_reset'
             )
-            result: str = response.text.strip()
-            
-            if "force reset command" in result.lower() and "rebooting" in result.lower():
-                self.logger.info("Device reset successful")
-                return True, result
-            self.logger.warning(f"Device reset failed: {result}")
-            return False, result
-            
+            self.info_cache.invalidate()
+            return self._parse_reset_response(response.text)
         except Exception as e:
             self.logger.error(f"Error during device reset: {str(e)}")
-            return False, f"Ошибка запроса: {str(e)}" 
+            return False, f"Ошибка запроса: {str(e)}"
+
+
+class AsyncPWMLampDriver(PWMLampCodec, AsyncBaseDriver):
+    """
+    Асинхронный вариант PWMLampDriver с теми же методами, результатами и проверками
+    """
+    def __init__(self, host: str, name: str = "unnamed", transport=None, info_max_age: Optional[float] = None):
+        super().__init__(host, name, transport)
+        self._init_info_cache(info_max_age)
+
+    async def get_info(self) -> Optional[Dict]:
+        """Получение информации о состоянии всех каналов и температуре, одновременные вызовы делят один запрос"""
+        return await self.info_cache.get(self._fetch_info, self.info_max_age)
+
+    async def _fetch_info(self) -> Optional[Dict]:
+        try:
+            status, text = await self.transport.get(f"{self.base_url}/info")
+            return self._parse_info(text)
+        except Exception as e:
+            self.logger.error(f"Error getting info: {str(e)}")
+            return None
+
+    async def set_pwm(self, channel: int, duty: int) -> Tuple[bool, str]:
+        """Установка скважности ШИМ для канала, см. PWMLampDriver.set_pwm"""
+        return await self._post_pwm(self._pwm_payload(channel, duty))
+
+    async def set_pwm_many(self, duties: Dict[int, int]) -> Tuple[Dict[int, Tuple[bool, str]], float]:
+        """Установка скважности ШИМ сразу для нескольких каналов, см. PWMLampDriver.set_pwm_many"""
+        payloads = {channel: self._pwm_payload(channel, duty) for channel, duty in duties.items()}
+        return await self._send_concurrently(self._post_pwm, payloads)
+
+    async def _post_pwm(self, data: Dict[str, int]) -> Tuple[bool, str]:
+        try:
+            self.logger.debug(f"Setting PWM: channel={data['channel']}, duty={data['duty']}")
+            status, text = await self.transport.post(
+                f"{self.base_url}/pwm",
+                headers=self.PWM_HEADERS,
+                data=json.dumps(data)
+            )
+            self.info_cache.invalidate()
+            return self._parse_pwm_response(data, text)
+        except Exception as e:
+            self.logger.error(f"Error setting PWM: {str(e)}")
+            return False, f"Ошибка запроса: {str(e)}"
+
+    async def reset_device(self) -> Tuple[bool, str]:
+        """Перезагрузка устройства, см. PWMLampDriver.reset_device"""
+        try:
+            self.logger.info("Attempting device reset")
+            status, text = await self.transport.post(
+                f"{self.base_url}/reset",
+                headers=self.RESET_HEADERS,
+                data='force_reset'
+            )
+            self.info_cache.invalidate()
+            return self._parse_reset_response(text)
+        except Exception as e:
+            self.logger.error(f"Error during device reset: {str(e)}")
+            return False, f"Ошибка запроса: {str(e)}"
 
 
 if __name__ == "__main__":
     lamp1 = PWMLampDriver("10.10.0.14")
     print(lamp1.get_info())
     print(lamp1.set_pwm(0, 0))
-
@@ -0,0 +1,163 @@
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+import serial
+from flaskr.utils.logger import Logger
+
+"""
+Long-lived session with PP Systems SBA-5 CO2 analyzer on serial port.
+Session owns the port, background reader thread reads continuous output of device,
+parses measurement lines to records and matches commands to their acknowledgements
+(device echoes command string and then "OK", each line terminated with <CR><LF>),
+so there are no fixed sleeps between commands and no sample is lost while command is running.
+"""
+
+DEFAULT_DEVNAME = '/dev/serial/by-id/usb-FTDI_FT230X_Basic_UART_DN03WQZS-if00-port0'
+
+# fields of measurement line, like "M 50029 48765 410.25 39.8 10.4 21.3 1003 38.9 40.1"
+# M, zero A/D, current A/D, then these ones
+MEASUREMENT_FIELDS = {
+    3: "co2",   # ppm
+    4: "irga_temp",   # temperature of IRGA, C
+    5: "humidity",   # mbar, if humidity sensor is installed
+    6: "humidity_sensor_temp",   # C
+    7: "pressure",   # atmospheric pressure, mbar
+}
+
+
+def parse_measurement(line: str) -> Optional[Dict]:
+    """
+    parse measurement line of SBA-5
+    :return: dict with ts (unix time of reading) and MEASUREMENT_FIELDS, or None if it is not measurement line
+    """
+    parts = line.split()
+    if len(parts) < 8 or parts[0] != "M":
+        return None
+    try:
+        record = {name: float(parts[index]) for index, name in MEASUREMENT_FIELDS.items()}
+    except ValueError:
+        return None
+    record["ts"] = time.time()
+    return record
+
+
+class SBA5Session:
+    def __init__(self, devname: str = DEFAULT_DEVNAME, baudrate: int = 19200, timeout: float = 1,
+                 port=None, on_measurement: Optional[Callable[[Dict], None]] = None,
+                 on_line: Optional[Callable[[str], None]] = None, name: str = "sba5"):
+        """
+        Args:
+            port: already opened serial port (or serial.serial_for_url("loop://") in tests),
+                by default devname is opened
+            on_measurement: called from reader thread with every parsed measurement record
+            on_line: called from reader thread with every other line of device output
+        """
+        self.name = name
+        self.logger = Logger.get_logger(f"{self.__class__.__name__}_{self.name}")
+        self.port = port if port is not None else serial.Serial(devname, baudrate, timeout=timeout)
+        self.on_measurement = on_measurement
+        self.on_line = on_line
+        self.latest = None   # last measurement record
+        self.measurements = 0   # number of parsed measurement lines
+        self.condition = threading.Condition()
+        self.command_lock = threading.Lock()   # one command at a time
+        self.pending = None   # command waiting for acknowledgement
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._reader_loop, name=f"{self.name}-reader", daemon=True)
+        self.thread.start()
+        return self
+
+    def close(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=5)
+        self.port.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _reader_loop(self):
+        buffer = b""
+        while not self.stop_event.is_set():
+            try:
+                # readline returns partial line on timeout, so line is assembled in buffer
+                buffer += self.port.readline()
+            except Exception as e:
+                if self.stop_event.is_set():
+                    break
+                self.logger.error(f"Error reading serial port: {e}")
+                time.sleep(1)
+                continue
+            while b"\n" in buffer:
+                raw, buffer = buffer.split(b"\n", 1)
+                line = raw.decode("utf-8", errors="replace").strip()
+                if line:
+                    self._handle_line(line)
+
+    def _handle_line(self, line: str):
+        record = parse_measurement(line)
+        if record is not None:
+            with self.condition:
+                self.latest = record
+                self.measurements += 1
+                self.condition.notify_all()
+            if self.on_measurement is not None:
+                self.on_measurement(record)
+            return
+
+        with self.condition:
+            pending = self.pending
+            if pending is not None and not pending["ok"]:
+                if line.upper() == pending["command"].upper():
+                    pending["echo"] = True
+                elif line == "OK":
+                    pending["ok"] = True
+                else:
+                    pending["lines"].append(line)
+                self.condition.notify_all()
+        if self.on_line is not None:
+            self.on_line(line)
+
+    def send_command(self, command: str, timeout: float = 2.0) -> Tuple[bool, List[str]]:
+        """
+        send string command and wait for its acknowledgement
+        single character commands (M, X, Z, !, @, ?, ]) have no acknowledgement,
+        so they return right after write
+        :return: (True if "OK" was received, other lines received while waiting)
+        """
+        command = command.strip()
+        with self.command_lock:
+            if len(command) == 1:
+                self._write(command)
+                return True, []
+            with self.condition:
+                pending = self.pending = {"command": command, "echo": False, "ok": False, "lines": []}
+            try:
+                self._write(command + "\r")
+                with self.condition:
+                    ok = self.condition.wait_for(lambda: pending["ok"], timeout)
+            finally:
+                with self.condition:
+                    self.pending = None
+            if not ok:
+                self.logger.warning(f"No acknowledgement for command {command}, got {pending['lines']}")
+            return ok, pending["lines"]
+
+    def read_measurement(self, timeout: float = 5.0) -> Optional[Dict]:
+        """ wait for next measurement record """
+        with self.condition:
+            count = self.measurements
+            if self.condition.wait_for(lambda: self.measurements > count, timeout):
+                return self.latest
+        return None
+
+    def _write(self, data: str):
+        self.port.write(data.encode("utf-8"))
+        self.port.flush()
@@ -0,0 +1,141 @@
+import asyncio
+import threading
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+"""
+Shared http transport for all drivers.
+One pooled requests.Session per device host with keep-alive connections, connect and read timeouts,
+bounded retries with backoff and limit of concurrent requests, because esp32 web servers
+can handle only few connections at once.
+Async drivers use AsyncTransport with the same policy - one aiohttp session per event loop for all devices.
+"""
+
+# default options of transports, can be changed from app config with configure()
+DEFAULT_OPTIONS = {
+    "connect_timeout": 3.0,   # seconds
+    "read_timeout": 10.0,   # seconds
+    "retries": 2,
+    "backoff": 0.3,   # seconds, sleeps between retries are backoff * 2 ** (retry - 1)
+    "max_concurrency": 2,   # simultaneous requests to one host from this process
+}
+
+# retry policy, same for sync and async transports
+IDEMPOTENT_METHODS = frozenset(["GET", "HEAD", "OPTIONS"])
+RETRY_STATUSES = (502, 503, 504)
+
+_transports = {}
+_transports_lock = threading.Lock()
+
+
+class HostTransport:
+    def __init__(self, host, connect_timeout, read_timeout, retries, backoff, max_concurrency):
+        """
+        Args:
+            host (str): IP address or hostname of device, with port if needed
+        """
+        self.host = host
+        self.timeout = (connect_timeout, read_timeout)
+        # idempotent requests are retried on any network error and on 502/503/504,
+        # other requests (POST) only if connection was not established, so command is never sent twice
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=backoff,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=IDEMPOTENT_METHODS,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.semaphore = threading.BoundedSemaphore(max_concurrency)
+
+    def request(self, method, url, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        with self.semaphore:
+            return self.session.request(method, url, **kwargs)
+
+    def get(self, url, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+
+class _RetryableStatus(Exception):
+    pass
+
+
+class AsyncTransport:
+    def __init__(self, connect_timeout, read_timeout, retries, backoff, max_concurrency):
+        """
+        aiohttp session is created on first request, so it belongs to event loop, that uses it
+        max_concurrency is limit of simultaneous connections per host
+        """
+        self.timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_concurrency = max_concurrency
+        self.session = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit_per_host=self.max_concurrency)
+            self.session = aiohttp.ClientSession(timeout=self.timeout, connector=connector)
+        return self.session
+
+    async def request(self, method, url, **kwargs):
+        """
+        :return: (status, text) of response, body is read before connection is returned to pool
+        """
+        attempt = 0
+        while True:
+            try:
+                async with self._get_session().request(method, url, **kwargs) as response:
+                    if method in IDEMPOTENT_METHODS and response.status in RETRY_STATUSES and attempt < self.retries:
+                        raise _RetryableStatus(response.status)
+                    return response.status, await response.text()
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError, _RetryableStatus) as e:
+                # POST is repeated only if connection was not established
+                retryable = method in IDEMPOTENT_METHODS or isinstance(e, aiohttp.ClientConnectorError)
+                if not retryable or attempt >= self.retries:
+                    raise
+            await asyncio.sleep(self.backoff * 2 ** attempt)
+            attempt += 1
+
+    async def get(self, url, **kwargs):
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request("POST", url, **kwargs)
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+
+def configure(options):
+    """ update default options of transports, created after this call """
+    DEFAULT_OPTIONS.update(options)
+
+
+def get_transport(host) -> HostTransport:
+    """ get transport of host, it is created once per process and shared by all drivers """
+    with _transports_lock:
+        transport = _transports.get(host)
+        if transport is None:
+            transport = HostTransport(host, **DEFAULT_OPTIONS)
+            _transports[host] = transport
+        return transport
+
+
+def new_async_transport(**options) -> AsyncTransport:
+    """ new async transport with default options, updated by given ones """
+    return AsyncTransport(**{**DEFAULT_OPTIONS, **options})
@@ -1,8 +1,19 @@
-from flaskr.tasks.data_logger_cycle import update_device_data
-from . import db
-import redis
-import rq
+import json
+import re
+import time
+import uuid
 from flask import current_app
+from rq.job import Job
+from rq.exceptions import NoSuchJobError
+from . import db
+from . import lanes
+from . import registry
+from . import config_snapshot
+from .tasks.commands import (COMMAND_KEY, REPLY_KEY, get_command, get_command_status, run_command,
+                             set_command_status)
+
+# id of command given by web page, it is used as rq job id and in redis keys
+COMMAND_ID_RE = re.compile(r"^[0-9A-Za-z_-]{8,64}$")
 
 
 def init_hardware():
@@ -10,7 +21,82 @@ def init_hardware():
     pass
 
 
-def handle_command(device_id, command, arg):
-    """ method to handle user command from web page for selected device"""
-    #TBD
-    return True
\ No newline at end of file
+def handle_command(device_id, command, arg, wait=None, command_id=None):
+    """
+    method to handle user command from web page for selected device
+    command is checked against commands of device in redis and its family, enqueued to high queue
+    of device lane (ahead of polling) and device data is updated optimistically, so page shows it at once
+    by default it returns id of command at once, its result is in /command-status/<id> and in push channel
+    :param wait: seconds to wait for answer of device, default COMMAND_WAIT_TIMEOUT, 0 - do not wait
+    :param command_id: id of command made by web page, so it knows the id before its result can be pushed,
+        new id by default
+    :return: (response dict, http status)
+    """
+    try:
+        entry = registry.get_device(device_id)
+    except (KeyError, ValueError, TypeError):
+        return {'status': 'error', 'error': f'Unknown device {device_id}'}, 404
+
+    red = db.get_db()
+    spec = get_command(entry, command)
+    if spec is None or not red.hexists(f"device_{entry['id']}:commands", command):
+        return {'status': 'error', 'error': f'Device {device_id} has no command {command}'}, 400
+    if entry["lane"] is None:
+        return {'status': 'error', 'error': f'Device {device_id} can not get commands from web page'}, 400
+    try:
+        args = spec["parse"](arg)
+    except ValueError as e:
+        return {'status': 'error', 'error': str(e)}, 400
+
+    if wait is None:
+        wait = current_app.config.get("COMMAND_WAIT_TIMEOUT", 0)
+    try:
+        wait = min(float(wait), current_app.config.get("COMMAND_MAX_WAIT", 5))
+    except (ValueError, TypeError):
+        return {'status': 'error', 'error': f'Wrong wait {wait}, it must be number of seconds'}, 400
+    if command_id is None:
+        command_id = uuid.uuid4().hex
+    elif not isinstance(command_id, str) or not COMMAND_ID_RE.match(command_id):
+        return {'status': 'error', 'error': f'Wrong command id {command_id}'}, 400
+    elif red.exists(COMMAND_KEY.format(id=command_id)):
+        return {'status': 'error', 'error': f'Command {command_id} already exists'}, 409
+    queued = {'status': 'queued', 'job_id': command_id, 'status_url': f'/command-status/{command_id}'}
+
+    rq_red = db.get_rq_db()
+    config_version = config_snapshot.ensure_published(rq_red)
+    set_command_status(red, command_id, {"status": "queued", "device_id": entry["id"], "command": command,
+                                         "arg": arg, "created": time.time()})
+    queue = lanes.get_queue(rq_red, entry["lane"], high=True)
+    queue.enqueue(run_command, config_version, entry["id"], command, arg, command_id, wait > 0,
+                  job_id=command_id)
+    optimistic = spec["optimistic"](entry, *args)
+    if optimistic:
+        db.write_device_state(red, entry["id"], "data", optimistic)
+
+    if wait <= 0:
+        return queued, 202
+    reply = rq_red.blpop(REPLY_KEY.format(id=command_id), timeout=wait)
+    if reply is None:
+        # device is still busy, result will be in status of command
+        return queued, 202
+    result = json.loads(reply[1])
+    if result["ok"]:
+        return {'status': 'ok', 'job_id': command_id, 'message': result["message"]}, 200
+    return {'status': 'error', 'job_id': command_id, 'error': result["message"]}, 502
+
+
+def command_status(command_id):
+    """
+    status of command from its status hash, if job died without result (worker was killed), from rq job
+    :return: status dict or None if command is unknown
+    """
+    status = get_command_status(db.get_db(), command_id)
+    if status is None or status["status"] not in ("queued", "running"):
+        return status
+    try:
+        job = Job.fetch(command_id, connection=db.get_rq_db())
+    except NoSuchJobError:
+        return status
+    if job.is_failed or job.is_stopped or job.is_canceled:
+        status.update({"status": "error", "message": f"job {job.get_status()}"})
+    return status
@@ -1,5 +1,6 @@
 from datetime import datetime
 import requests
+from flaskr.drivers.transport import get_transport
 
 
 class HardwareRelay:
@@ -37,7 +38,7 @@ class HardwareRelay:
         headers = {'Content-Type': 'application/json'}
 
         try:
-            response = requests.post(url, json=payload, headers=headers)
+            response = get_transport(self.ip_addr).post(url, json=payload, headers=headers)
             response.raise_for_status()  # Raise an exception for HTTP errors
             self.last_time_active = datetime.now().strftime("%d/%m/%Y, %H:%M:%S")
 
@@ -1,4 +1,4 @@
-import serial
+from flaskr.drivers.sba5_driver import SBA5Session
 
 class SBAWrapper(object):
     """
@@ -13,6 +13,12 @@ class SBAWrapper(object):
         self.dev = devname
         self.baud = baudrate
         self.timeout = timeout
+        self.session = None   # port is opened once, on first command
+
+    def get_session(self):
+        if self.session is None:
+            self.session = SBA5Session(self.dev, self.baud, self.timeout).start()
+        return self.session
 
     def send_command(self, command):
         """
@@ -61,27 +67,10 @@ class SBAWrapper(object):
 
         
         """
-        # \r\n
+        # command is matched to its echo and "OK" by session reader,
+        # result is lines, that device sent besides them, or None if device did not acknowledge command
         try:
-            ser = serial.Serial(
-                port=self.dev,
-                baudrate=self.baud,
-                timeout=self.timeout
-            )
-            bcom = command.encode('utf-8')
-            ser.write(bcom)
+            ok, lines = self.get_session().send_command(command)
+            return "\r\n".join(lines) if ok else None
         except Exception as e:
             print("SBAWrapper error while send command: {}".format(e))
-        # then try to read answer
-        # it must be two messages, ended with \r\n
-        try:
-            ser = serial.Serial(
-                port=self.dev,
-                baudrate=self.baud,
-                timeout=self.timeout
-            )
-            echo = (ser.readline()).decode('utf-8')
-            status = (ser.readline()).decode('utf-8')
-            return echo+status
-        except Exception as e:
-            print("SBAWrapper error while read answer from command: {}".format(e))
@@ -1,92 +1,65 @@
 import click
-import serial
-import threading
 import time
+from flaskr.drivers.sba5_driver import SBA5Session, DEFAULT_DEVNAME
 
-class SBAWrapper:
-    def __init__(self, devname, baudrate, timeout):
-        self.devname = devname
-        self.baudrate = baudrate
-        self.timeout = timeout
-        self.serial_conn = serial.Serial(devname, baudrate, timeout=timeout)
+"""
+CLI for SBA5, run it from app folder: PYTHONPATH=. python flaskr/hardware/sba5_cli.py --help
+"""
 
-    def send_command(self, command):
-        try:
-            self.serial_conn.write(command.encode('utf-8'))
-            self.serial_conn.flush()
-            time.sleep(0.5)  # time for device to answer
-            response = self.serial_conn.readline().decode('utf-8').strip()
-            return response
-        except Exception as e:
-            return f"Error: {str(e)}"
 
-    def read_serial_loop(self, stop_event):
-        try:
-            while not stop_event.is_set():
-                if self.serial_conn.in_waiting > 0:
-                    message = self.serial_conn.readline().decode('utf-8').strip()
-                    if message:
-                        print(f"[Device]: {message}")
-                time.sleep(0.1)
-        except Exception as e:
-            print(f"Error during serial read loop: {str(e)}")
+def print_line(line):
+    print(f"[Device]: {line}")
+
+
+def print_measurement(record):
+    print(f"[Device]: CO2 {record['co2']} ppm, IRGA {record['irga_temp']} C, "
+          f"humidity {record['humidity']} mbar, pressure {record['pressure']} mbar")
+
+
+def wait_for_interrupt(message):
+    print(message)
+    try:
+        while True:
+            time.sleep(0.1)
+    except KeyboardInterrupt:
+        print("\n[Info]: Exiting read loop.")
+
 
 @click.group(context_settings={"help_option_names": ["-h", "--help"]})
-@click.option('--devname', default='/dev/serial/by-id/usb-FTDI_FT230X_Basic_UART_DN03WQZS-if00-port0', help='Device name or path')
+@click.option('--devname', default=DEFAULT_DEVNAME, help='Device name or path')
 @click.option('--baudrate', default=19200, help='Baud rate for serial communication')
 @click.option('--timeout', default=1, help='Timeout for serial communication')
 @click.pass_context
 def cli(ctx, devname, baudrate, timeout):
     "CLI for SBA5 CO2 sensor"
-    ctx.obj = SBAWrapper(devname, baudrate, timeout)
+    ctx.obj = {"devname": devname, "baudrate": baudrate, "timeout": timeout}
 
 @cli.command()
 @click.argument('command')
 @click.option('-l', '--loop', is_flag=True, help="Continuously read responses for the command")
 @click.pass_obj
-def send(sba, command, loop):
+def send(params, command, loop):
     "Send a command to the device"
-    command = command + '\r\n'  # Ensure correct termination
-    if loop:
-        stop_event = threading.Event()
-
-        def handle_interrupt(signum, frame):
-            stop_event.set()
-
-        try:
-            print(f"[Info]: Sending command: {command.strip()} and starting read loop. Press Ctrl+C to exit.")
-            sba.send_command(command)  # Send the command
-            thread = threading.Thread(target=sba.read_serial_loop, args=(stop_event,), daemon=True)
-            thread.start()
-            while not stop_event.is_set():
-                time.sleep(0.1)
-        except KeyboardInterrupt:
-            print("\n[Info]: Exiting read loop.")
-            stop_event.set()
-        thread.join()
-    else:
-        result = sba.send_command(command)
-        print(f"[Response]: {result}")
+    on_line = print_line if loop else None
+    on_measurement = print_measurement if loop else None
+    with SBA5Session(params["devname"], params["baudrate"], params["timeout"],
+                     on_measurement=on_measurement, on_line=on_line) as sba:
+        ok, lines = sba.send_command(command)
+        if command.strip() == "M" and not loop:
+            # measurement has no acknowledgement, just wait for it
+            print(f"[Response]: {sba.read_measurement()}")
+        else:
+            print(f"[Response]: {'OK' if ok else 'no acknowledgement'} {' '.join(lines)}")
+        if loop:
+            wait_for_interrupt(f"[Info]: Sent command: {command.strip()}, reading device output. Press Ctrl+C to exit.")
 
 @cli.command()
 @click.pass_obj
-def listen(sba):
+def listen(params):
     "Enter continuous read mode"
-    stop_event = threading.Event()
-
-    def handle_interrupt(signum, frame):
-        stop_event.set()
-
-    try:
-        print("[Info]: Starting serial read loop. Press Ctrl+C to exit.")
-        thread = threading.Thread(target=sba.read_serial_loop, args=(stop_event,), daemon=True)
-        thread.start()
-        while not stop_event.is_set():
-            time.sleep(0.1)
-    except KeyboardInterrupt:
-        print("\n[Info]: Exiting serial read loop.")
-        stop_event.set()
-    thread.join()
+    with SBA5Session(params["devname"], params["baudrate"], params["timeout"],
+                     on_measurement=print_measurement, on_line=print_line):
+        wait_for_interrupt("[Info]: Starting serial read loop. Press Ctrl+C to exit.")
 
 @cli.command()
 def list_commands():
@@ -0,0 +1,65 @@
+import json
+import numpy as np
+from . import timeseries
+from .utils import decimation
+
+"""
+History of one device field for charts.
+Data is read from the rollup tier that fits requested number of points (see timeseries.query_series)
+and, if it is still too much, decimated on server.
+"""
+
+DECIMATION_METHODS = ("lttb", "minmax")
+
+
+def get_history(conn, device_id, field, start_ms, end_ms, max_points, method="lttb"):
+    """
+    :return: dict with tier and numpy arrays t (unix time ms) and v, or None if there is no such series
+    for rollup tiers v is mean of bucket, min and max arrays are added if data was not decimated
+    """
+    series_id = timeseries.find_series_id(conn, device_id, field)
+    if series_id is None:
+        return None
+    tier, rows = timeseries.query_series(conn, series_id, start_ms, end_ms, max_points)
+    data = np.array(rows, dtype=np.float64).reshape(-1, 5)
+    t, mins, maxs, means = data[:, 0], data[:, 1], data[:, 2], data[:, 3]
+    history = {"tier": tier, "method": None}
+
+    if len(t) <= max_points:
+        history.update(t=t, v=means)
+        if tier:
+            history.update(min=mins, max=maxs)
+        return history
+
+    if method == "minmax":
+        # rollup rows already have min and max of bucket, so use them as points
+        points_t = np.concatenate([t, t])
+        points_v = np.concatenate([mins, maxs])
+        order = np.argsort(points_t, kind="stable")
+        points_t, points_v = points_t[order], points_v[order]
+        selected = decimation.minmax(points_v, max_points)
+    else:
+        points_t, points_v = t, means
+        selected = decimation.lttb(points_t, points_v, max_points)
+    history.update(t=points_t[selected], v=points_v[selected], method=method)
+    return history
+
+
+def json_chunks(device_id, field, history):
+    """ compact json, generated in chunks """
+    header = {"device_id": device_id, "field": field, "tier": history["tier"], "method": history["method"]}
+    yield json.dumps(header)[:-1]
+    yield ', "t": ' + json.dumps(history["t"].astype(np.int64).tolist())
+    for key in ("v", "min", "max"):
+        if key in history:
+            yield f', "{key}": ' + json.dumps(history[key].tolist())
+    yield "}"
+
+
+def binary_chunks(history):
+    """
+    packed little-endian arrays: N float64 timestamps (unix time ms), then N float32 values
+    in js - new Float64Array(buf, 0, n) and new Float32Array(buf, 8 * n, n)
+    """
+    yield history["t"].astype("<f8").tobytes()
+    yield history["v"].astype("<f4").tobytes()
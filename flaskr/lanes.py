@@ -0,0 +1,63 @@
+import click
+import rq
+from . import registry
+from . import redis_pool
+
+"""
+Command lanes - separate rq queues for each controller host (see registry.device_lane).
+Each lane is consumed by its own single worker (start-lane-worker), so requests to one host are serial
+and slow device delays only its own lane, not all devices.
+Lane has two queues: lane:{lane}:high for user commands and actuator sequences and lane:{lane}
+for background polling, worker always takes jobs from high queue first.
+Lane worker is rq.SimpleWorker: jobs of lane are serial anyway, and running them in worker process
+instead of forked child keeps keep-alive http sessions to the host, /info cache, redis pool and
+config snapshot between jobs.
+"""
+
+# systemd template of lane workers, start-workers starts one for each lane
+DEFAULT_SYSTEMD_LANE_NAME = "clay_golem_lane@"
+LANE_QUEUE = "lane:{lane}"
+HIGH_QUEUE = "lane:{lane}:high"
+
+
+def lane_queue_name(lane, high=False):
+    return (HIGH_QUEUE if high else LANE_QUEUE).format(lane=lane)
+
+
+def lane_queue_names(lane):
+    """ queues of lane in order of priority """
+    return [lane_queue_name(lane, high=True), lane_queue_name(lane)]
+
+
+def get_queue(red, lane, high=False):
+    """
+    :param red: redis client without decode_responses (rq stores pickled jobs)
+    """
+    return rq.Queue(lane_queue_name(lane, high), connection=red)
+
+
+@click.command('start-lane-worker')
+@click.argument('lane')
+def start_lane_worker_command(lane):
+    """
+    Start worker of one command lane (controller host) and block this process
+    """
+    red = redis_pool.get_redis(decode_responses=False)
+    if lane not in registry.get_lanes():
+        print(f"Lane {lane} has no devices in config, lanes: {', '.join(registry.get_lanes())}")
+    worker = rq.SimpleWorker(lane_queue_names(lane), connection=red)
+    worker.work()
+
+
+@click.command('list-lanes')
+def list_lanes_command():
+    """
+    Print command lanes of devices from config, one per line
+    """
+    for lane in registry.get_lanes():
+        print(lane)
+
+
+def init_app(app):
+    app.cli.add_command(start_lane_worker_command)
+    app.cli.add_command(list_lanes_command)
@@ -0,0 +1,185 @@
+import threading
+import time
+import uuid
+
+"""
+Redis locks of devices with owner tokens, lease renewal and fair FIFO queue of waiters.
+Lock lock:{name} holds random token of its owner and expires after ttl, if owner dies.
+While lock is held, background thread renews it, only owner can renew or release it (Lua compare-and-set).
+Waiters take tickets in queue lock:{name}:queue and sleep in BLPOP on their own list lock:{name}:wake:{token},
+releasing owner pushes to the list of first waiter, so waiting costs no cpu and no redis polling.
+Waiters refresh their place in queue every wait_refresh seconds, waiters that died are removed from queue
+after waiter_ttl, so they do not block the lock forever.
+"""
+
+LOCK_KEY = "lock:{name}"
+
+# set ttl only if we still hold the lock
+RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# KEYS: lock, queue (token -> ticket), alive (token -> expiry ms), ticket counter
+# ARGV: token, lock ttl ms, waiter ttl ms
+# take lock if it is free and we are first in queue, otherwise take place in queue
+ACQUIRE_SCRIPT = """
+local now = redis.call('TIME')
+local now_ms = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+local dead = redis.call('ZRANGEBYSCORE', KEYS[3], '-inf', now_ms)
+for _, token in ipairs(dead) do
+    redis.call('ZREM', KEYS[2], token)
+    redis.call('ZREM', KEYS[3], token)
+end
+local head = redis.call('ZRANGE', KEYS[2], 0, 0)[1]
+if redis.call('EXISTS', KEYS[1]) == 0 and (not head or head == ARGV[1]) then
+    redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+    redis.call('ZREM', KEYS[2], ARGV[1])
+    redis.call('ZREM', KEYS[3], ARGV[1])
+    return 1
+end
+if not redis.call('ZSCORE', KEYS[2], ARGV[1]) then
+    redis.call('ZADD', KEYS[2], redis.call('INCR', KEYS[4]), ARGV[1])
+end
+redis.call('ZADD', KEYS[3], now_ms + tonumber(ARGV[3]), ARGV[1])
+return 0
+"""
+# KEYS: lock, queue, alive
+# ARGV: token (or "" if we leave queue without lock), wake key prefix, waiter ttl ms
+# release lock if it is ours, or leave queue, and wake first waiter
+WAKE_NEXT_SCRIPT = """
+if ARGV[1] ~= '' then
+    if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+        return 0
+    end
+    redis.call('DEL', KEYS[1])
+end
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return 1
+end
+local head = redis.call('ZRANGE', KEYS[2], 0, 0)[1]
+if head then
+    redis.call('RPUSH', ARGV[2] .. head, 1)
+    redis.call('PEXPIRE', ARGV[2] .. head, ARGV[3])
+end
+return 1
+"""
+
+
+class DeviceLock:
+    def __init__(self, red, name, ttl=10.0, timeout=None, waiter_ttl=30.0, wait_refresh=5.0):
+        """
+        :param red: redis client
+        :param name: name of lock, like device1
+        :param timeout: how long "with lock:" waits for lock, seconds, None - forever
+        :param ttl: lease of lock, seconds, it is renewed every ttl / 3 while lock is held
+        :param waiter_ttl: waiter, that did not refresh its place in queue for this time, is removed from queue
+        :param wait_refresh: how long waiter sleeps in BLPOP without notification, must be less than waiter_ttl
+        """
+        self.red = red
+        self.name = name
+        self.key = LOCK_KEY.format(name=name)
+        self.queue_key = self.key + ":queue"
+        self.alive_key = self.key + ":alive"
+        self.ticket_key = self.key + ":ticket"
+        self.wake_prefix = self.key + ":wake:"
+        self.ttl = ttl
+        self.timeout = timeout
+        self.waiter_ttl = waiter_ttl
+        self.wait_refresh = min(wait_refresh, waiter_ttl / 2)
+        self.acquire_script = red.register_script(ACQUIRE_SCRIPT)
+        self.wake_next_script = red.register_script(WAKE_NEXT_SCRIPT)
+        self.renew_script = red.register_script(RENEW_SCRIPT)
+        self.token = None
+        self.lost = threading.Event()   # set if lease was not renewed in time
+        self._stop_renewal = threading.Event()
+        self._renewal = None
+
+    def acquire(self, timeout=None):
+        """
+        wait for lock in queue
+        :param timeout: seconds, None - wait forever
+        :return: True if lock is acquired
+        """
+        token = uuid.uuid4().hex
+        wake_key = self.wake_prefix + token
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            if self.acquire_script(keys=[self.key, self.queue_key, self.alive_key, self.ticket_key],
+                                   args=[token, int(self.ttl * 1000), int(self.waiter_ttl * 1000)]):
+                self.red.delete(wake_key)
+                self.token = token
+                self.lost.clear()
+                self._start_renewal()
+                return True
+            wait = self.wait_refresh
+            if deadline is not None:
+                wait = min(wait, deadline - time.monotonic())
+                if wait <= 0:
+                    break
+            # BLPOP timeout is in seconds, 0 means forever
+            self.red.blpop(wake_key, timeout=max(wait, 0.01))
+        # leave queue, and if we were first, let next waiter try
+        pipe = self.red.pipeline()
+        pipe.zrem(self.queue_key, token)
+        pipe.zrem(self.alive_key, token)
+        pipe.delete(wake_key)
+        pipe.execute()
+        self.wake_next_script(keys=[self.key, self.queue_key, self.alive_key],
+                              args=["", self.wake_prefix, int(self.waiter_ttl * 1000)])
+        return False
+
+    def release(self):
+        """ release lock if we still hold it and wake first waiter """
+        self._stop_renewal.set()
+        if self._renewal is not None and self._renewal is not threading.current_thread():
+            self._renewal.join()
+        self._renewal = None
+        if self.token is None:
+            return False
+        released = self.wake_next_script(keys=[self.key, self.queue_key, self.alive_key],
+                                         args=[self.token, self.wake_prefix, int(self.waiter_ttl * 1000)])
+        self.token = None
+        return bool(released)
+
+    def renew(self):
+        if self.token is not None and self.renew_script(keys=[self.key], args=[self.token, int(self.ttl * 1000)]):
+            return True
+        self.lost.set()
+        return False
+
+    def _start_renewal(self):
+        self._stop_renewal.clear()
+        self._renewal = threading.Thread(target=self._renewal_loop, name=f"{self.key}-renewal", daemon=True)
+        self._renewal.start()
+
+    def _renewal_loop(self):
+        while not self._stop_renewal.wait(self.ttl / 3):
+            try:
+                if not self.renew():
+                    print(f"Lock {self.key} was lost")
+                    return
+            except Exception as e:
+                # lock expires if redis is unavailable for ttl
+                print(f"Failed to renew lock {self.key}: {e}")
+
+    def __enter__(self):
+        if not self.acquire(self.timeout):
+            raise TimeoutError(f"Lock {self.key} is not acquired")
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+def device_lock(red, device_id, **kwargs):
+    """ lock of one device, all code that talks to device hardware exclusively takes it """
+    return DeviceLock(red, f"device{device_id}", **kwargs)
@@ -0,0 +1,149 @@
+import json
+import os
+import queue
+import threading
+import time
+import redis
+from flask import current_app
+from . import db
+from . import redis_pool
+from .tasks.commands import COMMANDS_CHANNEL
+
+"""
+Server push of device updates to web pages using Server-Sent Events.
+Writers publish changed fields to db.UPDATES_CHANNEL (see db.write_device_state),
+each web process holds only one redis subscription and fans messages out to all streams opened in it.
+Status changes of user commands (commands.COMMANDS_CHANNEL) are pushed as "command" events.
+"""
+
+# channel -> name of SSE event for its messages
+CHANNEL_EVENTS = {
+    db.UPDATES_CHANNEL: "update",
+    COMMANDS_CHANNEL: "command",
+}
+
+# gunicorn profiles (see gunicorn.conf.py), where open stream does not hold whole worker process
+ASYNC_PROFILES = ("gevent",)
+
+_broadcaster = None
+_broadcaster_lock = threading.Lock()
+
+
+class DeviceUpdatesBroadcaster:
+    """
+    One background thread per process subscribed to updates channels.
+    Every open stream has its own bounded queue of (event, data), if client is too slow and queue overflows,
+    queue is cleared and None is put in it - that means stream must resend full snapshot.
+    """
+    def __init__(self, red, channels, queue_size=100, retry_delay=1.0):
+        """
+        :param channels: dict channel -> event name
+        :param retry_delay: seconds before new subscription after redis error
+        """
+        self.red = red
+        self.channels = channels
+        self.queue_size = queue_size
+        self.retry_delay = retry_delay
+        self.listeners = set()
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def subscribe(self):
+        q = queue.Queue(maxsize=self.queue_size)
+        with self.lock:
+            self.listeners.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self.lock:
+            self.listeners.discard(q)
+
+    def _send(self, message):
+        with self.lock:
+            listeners = list(self.listeners)
+        for q in listeners:
+            try:
+                q.put_nowait(message)
+            except queue.Full:
+                # slow client, it will get full snapshot instead of lost updates
+                with q.mutex:
+                    q.queue.clear()
+                q.put_nowait(None)
+
+    def _run(self):
+        while True:
+            try:
+                pubsub = self.red.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(*self.channels)
+                for message in pubsub.listen():
+                    if message["data"] == db.RESET_MESSAGE:
+                        # devices were re-initialized, clients must reload everything
+                        self._send(None)
+                    else:
+                        self._send((self.channels[message["channel"]], message["data"]))
+            except redis.RedisError as e:
+                print(f"Device updates subscription lost: {e}")
+            except Exception as e:
+                # thread must not die, else all streams of this process stop silently
+                print(f"Device updates subscription failed: {e!r}")
+            time.sleep(self.retry_delay)
+            # some updates could be lost while we were disconnected
+            self._send(None)
+
+
+def push_enabled(config):
+    """
+    SERVER_PUSH in config, by default only with async gunicorn profile: with sync workers
+    each open stream holds whole worker and is killed by worker timeout, so pages use ajax polling
+    """
+    enabled = config.get("SERVER_PUSH")
+    if enabled is None:
+        enabled = os.environ.get("CLAY_GUNICORN_PROFILE", "sync") in ASYNC_PROFILES
+    return bool(enabled)
+
+
+def get_broadcaster():
+    global _broadcaster
+    with _broadcaster_lock:
+        if _broadcaster is None:
+            red = redis_pool.get_redis()
+            _broadcaster = DeviceUpdatesBroadcaster(red, CHANNEL_EVENTS)
+        return _broadcaster
+
+
+def format_event(event, data):
+    """ format one Server-Sent Event, data must be already json string """
+    return f"event: {event}\ndata: {data}\n\n"
+
+
+def snapshot_event():
+    """ full snapshot event, always read directly from redis, cached one can be older than subscription """
+    snapshot = db.read_device_snapshot(db.get_db(), current_app.config['DEVICES'])
+    return format_event("snapshot", json.dumps({"version": snapshot["version"], "devices": snapshot["devices"]}))
+
+
+def device_update_events():
+    """
+    generator for SSE stream - first full snapshot of all devices, then only changed fields
+    must be wrapped in stream_with_context because snapshot needs app config
+    """
+    heartbeat = current_app.config.get("SSE_HEARTBEAT", 15)
+    broadcaster = get_broadcaster()
+    # subscribe before snapshot, so nothing will be lost between them
+    q = broadcaster.subscribe()
+    try:
+        yield snapshot_event()
+        while True:
+            try:
+                message = q.get(timeout=heartbeat)
+            except queue.Empty:
+                # comment line, keeps connection alive through proxies
+                yield ": keep-alive\n\n"
+                continue
+            if message is None:
+                yield snapshot_event()
+            else:
+                yield format_event(*message)
+    finally:
+        broadcaster.unsubscribe(q)
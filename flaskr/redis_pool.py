@@ -0,0 +1,64 @@
+import os
+import threading
+import redis
+from flask import current_app
+
+"""
+One redis connection pool per process for web server, workers and console commands.
+Connection settings come from config (app config, config snapshot of job or registry settings):
+    REDIS_HOST, REDIS_PORT, REDIS_DB - tcp connection
+    REDIS_UNIX_SOCKET - path of unix socket, if it is set, host and port are not used
+    REDIS_HEALTH_CHECK_INTERVAL - connection idle for more seconds is checked by PING before use
+    REDIS_MAX_CONNECTIONS, REDIS_POOL_TIMEOUT - size of pool, and how long client waits for free connection
+Clients are cheap objects over shared pool, so every request or job takes its own client and
+connections are reused, instead of new tcp connection for each of them.
+"""
+
+SETTINGS = {
+    "REDIS_HOST": "localhost",
+    "REDIS_PORT": 6379,
+    "REDIS_DB": 0,
+    "REDIS_UNIX_SOCKET": None,
+    "REDIS_HEALTH_CHECK_INTERVAL": 30,
+    "REDIS_MAX_CONNECTIONS": 50,
+    "REDIS_POOL_TIMEOUT": 5,
+}
+
+# (pid, decode_responses, settings) -> pool
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def connection_settings(config):
+    """ redis settings from config, with defaults for missing ones """
+    return {key: config.get(key) if config.get(key) is not None else default
+            for key, default in SETTINGS.items()}
+
+
+def make_pool(settings, decode_responses=True):
+    kwargs = {"db": settings["REDIS_DB"], "decode_responses": decode_responses,
+              "health_check_interval": settings["REDIS_HEALTH_CHECK_INTERVAL"],
+              "max_connections": settings["REDIS_MAX_CONNECTIONS"], "timeout": settings["REDIS_POOL_TIMEOUT"]}
+    if settings["REDIS_UNIX_SOCKET"]:
+        return redis.BlockingConnectionPool(connection_class=redis.UnixDomainSocketConnection,
+                                            path=settings["REDIS_UNIX_SOCKET"], **kwargs)
+    return redis.BlockingConnectionPool(host=settings["REDIS_HOST"], port=settings["REDIS_PORT"], **kwargs)
+
+
+def get_pool(config=None, decode_responses=True):
+    """
+    :param config: dict with redis settings, app config by default
+    :param decode_responses: False for rq, it stores pickled jobs
+    """
+    settings = connection_settings(current_app.config if config is None else config)
+    # pool must not be shared with forked processes
+    key = (os.getpid(), decode_responses, tuple(sorted(settings.items())))
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = make_pool(settings, decode_responses)
+        return _pools[key]
+
+
+def get_redis(config=None, decode_responses=True):
+    """ new redis client over shared pool of this process """
+    return redis.Redis(connection_pool=get_pool(config, decode_responses))
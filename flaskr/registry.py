@@ -0,0 +1,165 @@
+from .drivers.esphome_driver import ESPHomeDeviceDriver, AsyncESPHomeDeviceDriver
+from .drivers.esp32_relay_driver import ESP32RelayDriver, AsyncESP32RelayDriver
+from .drivers.pwm_lamp_driver import PWMLampDriver, AsyncPWMLampDriver
+from .drivers.sba5_driver import SBA5Session
+from . import config_snapshot
+from . import redis_pool
+
+"""
+Registry of devices from DEVICES config.
+Family of device defines its driver classes and polling spec, so polling jobs carry only device id,
+and new device type is added to FAMILIES, without changes in task code.
+Registry is built once per process in create_app (init_app) from config snapshot of this process.
+Jobs pass version of config snapshot, registry is rebuilt only if it differs from current one.
+
+Each device belongs to command lane (see lanes.py) - its controller host: "host" param, esphome host
+(ESP_IP_ADDR) for esphome devices, or explicit "lane" param.
+
+Polling kinds:
+    "esphome" - one esphome web api entity per channel (domain, suffix appended to esphome_name, key in device data)
+    "info" - one /info request of esp32 firmware, keys of device data are taken from its payload (needs "host" param)
+    None - device is not polled by jobs (SBA5 is streamed by start-sba5 service)
+"""
+
+FAMILIES = {
+    "esphome_switch": {
+        "driver": ESPHomeDeviceDriver,
+        "async_driver": AsyncESPHomeDeviceDriver,
+        "poll": "esphome",
+        "channels": [("switch", "", "state")],
+    },
+    "esphome_dht22": {
+        "driver": ESPHomeDeviceDriver,
+        "async_driver": AsyncESPHomeDeviceDriver,
+        "poll": "esphome",
+        # we need make two web api calls - for humidity and for temperature
+        "channels": [("sensor", "hum", "humidity"), ("sensor", "temp", "temperature")],
+    },
+    "esphome_ds18b20": {
+        "driver": ESPHomeDeviceDriver,
+        "async_driver": AsyncESPHomeDeviceDriver,
+        "poll": "esphome",
+        "channels": [("sensor", "", "temperature")],
+    },
+    "esp32_relay": {
+        "driver": ESP32RelayDriver,
+        "async_driver": AsyncESP32RelayDriver,
+        "poll": "info",
+    },
+    "pwm_lamp": {
+        "driver": PWMLampDriver,
+        "async_driver": AsyncPWMLampDriver,
+        "poll": "info",
+    },
+    "sba5": {
+        "driver": SBA5Session,
+        "poll": None,
+    },
+}
+
+# device_id -> entry dict: id, family, params, data_keys, spec, poll_interval, lane
+_devices = {}
+# settings of this process, that jobs need: redis, queue, data db path and esphome credentials
+_settings = {}
+
+
+def build_registry(devices, default_poll_interval=1):
+    """
+    :param devices: DEVICES list from config
+    :return: dict device_id -> entry
+    """
+    registry = {}
+    for device_dict in devices:
+        params = device_dict["params"]
+        spec = FAMILIES.get(params["family"])
+        if spec is None:
+            print(f"Unknown family {params['family']} of device {params['device_id']}, it will not be polled")
+            spec = {"poll": None}
+        registry[int(params["device_id"])] = {
+            "id": int(params["device_id"]),
+            "family": params["family"],
+            "params": params,
+            "data_keys": list(device_dict.get("data", {})),
+            "spec": spec,
+            "poll_interval": params.get("poll_interval", default_poll_interval),
+        }
+    return registry
+
+
+def get_device(device_id):
+    return _devices[int(device_id)]
+
+
+def get_devices(poll=None):
+    """ all devices, or only devices with given polling kind, "any" - all polled devices """
+    if poll is None:
+        return list(_devices.values())
+    if poll == "any":
+        return [entry for entry in _devices.values() if entry["spec"]["poll"] is not None]
+    return [entry for entry in _devices.values() if entry["spec"]["poll"] == poll]
+
+
+def get_settings():
+    return _settings
+
+
+def get_lanes():
+    """ names of all command lanes, esphome host lane is always there, sequences of actuators use it """
+    lanes = {entry["lane"] for entry in _devices.values() if entry["lane"] is not None}
+    if _settings.get("ESP_IP_ADDR"):
+        lanes.add(_settings["ESP_IP_ADDR"])
+    return sorted(lanes)
+
+
+def device_lane(entry, esp_host):
+    """ lane of device, None for devices without network controller """
+    params = entry["params"]
+    if "lane" in params:
+        return params["lane"]
+    if "host" in params:
+        return params["host"]
+    if entry["spec"]["poll"] == "esphome":
+        return esp_host
+    return None
+
+
+def make_drivers(entry, transport=None, use_async=False):
+    """
+    create drivers of device
+    :param transport: shared AsyncTransport for async drivers
+    :return: list of (domain, data_key, driver) for "esphome" devices, one driver for "info" devices
+    """
+    spec = entry["spec"]
+    driver_class = spec["async_driver"] if use_async else spec["driver"]
+    extra = {"transport": transport} if use_async else {}
+    if spec["poll"] == "esphome":
+        return [(domain, data_key, driver_class(_settings["ESP_IP_ADDR"], domain,
+                                                entry["params"]["esphome_name"] + suffix,
+                                                _settings["ESP_AUTH_LOGIN"], _settings["ESP_AUTH_PASS"], **extra))
+                for domain, suffix, data_key in spec["channels"]]
+    return driver_class(entry["params"]["host"], name=entry["params"].get("name", str(entry["id"])), **extra)
+
+
+def init_registry(config, data_db_path):
+    global _devices
+    _devices = build_registry(config["DEVICES"], config.get("POLL_INTERVAL", 1))
+    for entry in _devices.values():
+        entry["lane"] = device_lane(entry, config.get("ESP_IP_ADDR"))
+    _settings.clear()
+    _settings.update({key: config.get(key) for key in ("QUEUE", "ESP_IP_ADDR", "ESP_AUTH_LOGIN", "ESP_AUTH_PASS")})
+    _settings.update(redis_pool.connection_settings(config))
+    _settings["DATA_DB_PATH"] = data_db_path
+
+
+def use_config(version):
+    """ switch registry to config snapshot of given version """
+    if _settings.get("CONFIG_VERSION") == version:
+        return
+    config = config_snapshot.get_config(version)
+    init_registry(config, config["DATA_DB_PATH"])
+    _settings["CONFIG_VERSION"] = version
+
+
+def init_app(app):
+    # snapshot is made by config_snapshot.init_app
+    use_config(config_snapshot.local_version())
@@ -3,6 +3,8 @@ import click
 import subprocess
 import re
 from flask import current_app, g
+from . import registry
+from .lanes import DEFAULT_SYSTEMD_LANE_NAME
 
 """
 All commands here are for manual start-stop app using systemd services
@@ -26,7 +28,9 @@ def start_app_systemd():
 @click.command("start-workers")
 def start_workers_systemd():
     """
-    start selected in config number rq-workers using systemd template
+    start selected in config number rq-workers using systemd template,
+    one worker for each command lane (SYSTEMD_LANE_NAME template, "clay_golem_lane@" by default,
+    polling jobs and commands go to lanes, nobody else takes them)
     and start rq-scheduler using different systemd service
     """
     num_workers = current_app.config["RQ_NUM_WORKERS"]
@@ -40,6 +44,17 @@ def start_workers_systemd():
     except subprocess.CalledProcessError as e:
         print(f"Error occurred while starting services: {e}")
 
+    lane_name_base = current_app.config.get("SYSTEMD_LANE_NAME", DEFAULT_SYSTEMD_LANE_NAME)
+    if lane_name_base:
+        try:
+            for lane in registry.get_lanes():
+                service_name = f"{lane_name_base}{lane}"
+                print(f"Starting {service_name}...")
+                subprocess.run(['sudo', 'systemctl', 'start', service_name], check=True)
+                print(f"{service_name} started.")
+        except subprocess.CalledProcessError as e:
+            print(f"Error occurred while starting lane workers: {e}")
+
     scheduler_name = current_app.config["SYSTEMD_SCHEDULER_NAME"]
     try:
         print(f"Starting {scheduler_name}...")
@@ -54,9 +69,12 @@ def start_workers_systemd():
 @click.command("stop-workers")
 def stop_workers_systemd():
     """
-    stop all workers and scheduler using systemd
+    stop all workers, lane workers and scheduler using systemd
     """
     service_name_pattern = current_app.config["SYSTEMD_WORKER_NAME"]
+    lane_name_base = current_app.config.get("SYSTEMD_LANE_NAME", DEFAULT_SYSTEMD_LANE_NAME)
+    if lane_name_base:
+        service_name_pattern = f"{service_name_pattern}|{lane_name_base}"
     try:
         # List all active systemd units
         completed_process = subprocess.run(['sudo', 'systemctl', 'list-units', '--no-legend', '--plain'],
@@ -0,0 +1,131 @@
+import asyncio
+import time
+from datetime import datetime
+import click
+from flask import current_app
+from .. import db
+from .. import registry
+from .. import redis_pool
+from ..drivers.transport import new_async_transport
+from .data_logger_cycle import parse_esphome_reading, parse_info_readings
+from .sample_writer import SampleWriter
+
+"""
+Long-running asyncio poller - alternative to update_device_data rq jobs.
+One process polls all polled devices from registry concurrently, each on its own interval,
+through async drivers, that share one http session with keep-alive connections, and writes results in batches
+(redis in one pipeline per flush, sqlite through in-process SampleWriter with group commits).
+Enable it with ASYNC_POLLER = True in config, then start-periodic will not enqueue polling jobs.
+"""
+
+
+class AsyncPoller:
+    def __init__(self, config, db_path):
+        self.devices = registry.get_devices(poll="any")
+        self.flush_interval = config.get("POLL_FLUSH_INTERVAL", 1)
+        self.request_timeout = config.get("POLL_REQUEST_TIMEOUT", 5)
+        self.connections_per_host = config.get("POLL_CONNECTIONS_PER_HOST", 4)
+        # no retries - next poll of device is the retry
+        self.transport = new_async_transport(read_timeout=self.request_timeout,
+                                             max_concurrency=self.connections_per_host,
+                                             retries=0)
+        # async drivers of every device, all of them use one transport
+        self.drivers = {entry["id"]: registry.make_drivers(entry, self.transport, use_async=True)
+                        for entry in self.devices}
+        self.red = redis_pool.get_redis(config)
+        self.writer = SampleWriter(db_path,
+                                   max_batch=config.get("WRITER_MAX_BATCH", 500),
+                                   max_delay=config.get("WRITER_MAX_DELAY", 1.0),
+                                   report_interval=config.get("WRITER_REPORT_INTERVAL", 60),
+                                   red=self.red)
+        # results of polls, waiting for next flush
+        self.readings = []   # (device_id, data_key, unix time, redis_value, sql_value)
+        self.errors = []   # (device_id, error message)
+
+    async def read_channel(self, d_id, domain, data_key, driver):
+        try:
+            status, data = await driver.get()
+            if status == 200:
+                redis_value, sql_value = parse_esphome_reading(domain, data)
+                self.readings.append((d_id, data_key, time.time(), redis_value, sql_value))
+            else:
+                self.errors.append((d_id, f"esphome web api status {status}"))
+        except Exception as e:
+            self.errors.append((d_id, e.__str__() + datetime.now().strftime("%d/%m/%Y, %H:%M:%S")))
+
+    async def read_info(self, entry, driver):
+        try:
+            info = await driver.get_info()
+            if info is None:
+                self.errors.append((entry["id"], "no response to /info " + datetime.now().strftime("%d/%m/%Y, %H:%M:%S")))
+                return
+            now = time.time()
+            readings = parse_info_readings(entry, info)
+        except Exception as e:
+            # bad payload of one device must not stop polling of others
+            self.errors.append((entry["id"], e.__str__() + datetime.now().strftime("%d/%m/%Y, %H:%M:%S")))
+            return
+        for data_key, redis_value, sql_value in readings:
+            self.readings.append((entry["id"], data_key, now, redis_value, sql_value))
+
+    async def poll_device(self, entry):
+        """ poll all channels of one device at fixed rate, missed ticks are skipped, not queued """
+        interval = entry["poll_interval"]
+        d_id = entry["id"]
+        next_run = time.monotonic()
+        while True:
+            if entry["spec"]["poll"] == "esphome":
+                await asyncio.gather(*(self.read_channel(d_id, *channel) for channel in self.drivers[d_id]))
+            else:
+                await self.read_info(entry, self.drivers[d_id])
+            next_run += interval
+            now = time.monotonic()
+            if next_run < now:
+                next_run += ((now - next_run) // interval + 1) * interval
+            await asyncio.sleep(next_run - now)
+
+    def write_batch(self, readings, errors):
+        """ blocking part of flush, runs in thread to not stop polling """
+        # one redis round trip for the whole batch
+        pipe = self.red.pipeline(transaction=False)
+        for d_id, data_key, ts, redis_value, _ in readings:
+            db.write_device_state(pipe, d_id, "data", {data_key: redis_value})
+            db.write_device_state(pipe, d_id, "params", {
+                "last_time_active": datetime.fromtimestamp(ts).strftime("%d/%m/%Y, %H:%M:%S"),
+                "status": "ok"})
+        for d_id, message in errors:
+            db.write_device_state(pipe, d_id, "params", {"status": "error", "last_error": message})
+        pipe.execute()
+
+    async def flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            readings, self.readings = self.readings, []
+            errors, self.errors = self.errors, []
+            if not readings and not errors:
+                continue
+            for d_id, data_key, ts, _, sql_value in readings:
+                self.writer.submit(d_id, data_key, ts, sql_value)
+            try:
+                await asyncio.to_thread(self.write_batch, readings, errors)
+            except Exception as e:
+                print(f"Async poller failed to write batch of {len(readings)} readings: {e}")
+
+    async def run(self):
+        self.writer.start()
+        try:
+            await asyncio.gather(self.flush_loop(),
+                                 *(self.poll_device(entry) for entry in self.devices))
+        finally:
+            await self.transport.close()
+
+
+@click.command('start-poller')
+def start_poller_command():
+    """
+    Start asyncio poller for all devices and block this process
+    """
+    db_path = current_app.instance_path + "/" + current_app.config['DATA_DB_NAME']
+    poller = AsyncPoller(current_app.config, db_path)
+    print(f"Polling {len(poller.devices)} devices")
+    asyncio.run(poller.run())
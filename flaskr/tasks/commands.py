@@ -0,0 +1,160 @@
+import json
+import time
+from datetime import datetime
+from .. import db
+from .. import registry
+from .. import redis_pool
+from ..drivers.esp32_relay_driver import ESP32RelayCodec
+from ..drivers.pwm_lamp_driver import PWMLampCodec
+
+"""
+User commands of devices - what each command of device family does.
+Command spec:
+    parse - converts arg from web page to tuple of arguments, raises ValueError if it is invalid,
+        so bad commands are rejected by web server before they get to queue
+    run - function(drivers, *args) -> (ok, message), called in lane worker
+    optimistic - function(entry, *args) -> dict of device data fields, that web server writes to redis
+        right after enqueue, before device answers (next poll writes real state anyway)
+Device can get only commands, that are both in its "commands" config section and in its family here.
+Every command has id (the same as id of its rq job) and status hash command:{id}
+(status queued -> running -> ok or error, message, device_id, command, arg, times), each change of status
+is published to COMMANDS_CHANNEL, so web pages get it by server push.
+"""
+
+# reply of command job for web server, that waits for it
+REPLY_KEY = "command:reply:{id}"
+REPLY_TTL = 60
+COMMAND_KEY = "command:{id}"
+COMMAND_TTL = 3600
+COMMANDS_CHANNEL = "commands:updates"
+
+
+def no_arg(arg):
+    return ()
+
+
+def channel_arg(payload):
+    """
+    :param payload: function(channel, value) of driver codec, that raises ValueError if they are out of range
+    :return: parse "3 1" or "3:1" -> (3, 1), checked by the same rules as driver checks them before request
+    """
+    def parse(arg):
+        parts = str(arg).replace(":", " ").split()
+        if len(parts) != 2:
+            raise ValueError(f"Argument must be 'channel value', got '{arg}'")
+        channel, value = int(parts[0]), int(parts[1])
+        payload(channel, value)
+        return channel, value
+    return parse
+
+
+def esphome_switch(action):
+    def run(drivers):
+        domain, data_key, driver = drivers[0]
+        status, _ = driver.post_no_params(action)  # turn_on, turn_off and toggle
+        return status == 200, f"esphome web api status {status}"
+    return run
+
+
+def channel_data(entry, channel, value):
+    """ data field of channel, if device has it """
+    key = f"ch{channel}"
+    return {key: value} if key in entry["data_keys"] else {}
+
+
+def no_data(entry):
+    return {}
+
+
+def set_relay(driver, channel, state):
+    return driver.set_relay_state(channel, state)
+
+
+def reset_relay(driver):
+    ok = driver.reset_device()
+    return ok, "reset" if ok else "reset failed"
+
+
+def set_pwm(driver, channel, duty):
+    return driver.set_pwm(channel, duty)
+
+
+def reset_lamp(driver):
+    return driver.reset_device()
+
+
+COMMANDS = {
+    "esphome_switch": {
+        "set_on": {"parse": no_arg, "run": esphome_switch("turn_on"), "optimistic": lambda entry: {"state": "ON"}},
+        "set_off": {"parse": no_arg, "run": esphome_switch("turn_off"), "optimistic": lambda entry: {"state": "OFF"}},
+    },
+    "esp32_relay": {
+        "set_relay": {"parse": channel_arg(ESP32RelayCodec()._relay_payload), "run": set_relay, "optimistic": channel_data},
+        "reset": {"parse": no_arg, "run": reset_relay, "optimistic": no_data},
+    },
+    "pwm_lamp": {
+        "set_pwm": {"parse": channel_arg(PWMLampCodec()._pwm_payload), "run": set_pwm, "optimistic": channel_data},
+        "reset": {"parse": no_arg, "run": reset_lamp, "optimistic": no_data},
+    },
+}
+
+
+def get_command(entry, command):
+    """ :return: command spec or None if family of device has no such command """
+    return COMMANDS.get(entry["family"], {}).get(command)
+
+
+def set_command_status(red, command_id, mapping):
+    """ update status hash of command and publish it """
+    mapping = {field: value if value is not None else "" for field, value in mapping.items()}
+    pipe = red.pipeline()
+    pipe.hset(COMMAND_KEY.format(id=command_id), mapping=mapping)
+    pipe.expire(COMMAND_KEY.format(id=command_id), COMMAND_TTL)
+    pipe.publish(COMMANDS_CHANNEL, json.dumps(dict(mapping, id=command_id)))
+    pipe.execute()
+
+
+def get_command_status(red, command_id):
+    """ :return: status dict of command or None if it is unknown or expired """
+    status = red.hgetall(COMMAND_KEY.format(id=command_id))
+    if not status:
+        return None
+    status = {(k.decode() if isinstance(k, bytes) else k): (v.decode() if isinstance(v, bytes) else v)
+              for k, v in status.items()}
+    status["id"] = command_id
+    return status
+
+
+def run_command(config_version, device_id, command, arg, command_id, reply=False):
+    """
+    rq job in high queue of device lane, its job id is command_id: send command to device, store result
+    to status of command and to device params, and push it to reply key, if web server waits for it
+    """
+    registry.use_config(config_version)
+    entry = registry.get_device(device_id)
+    settings = registry.get_settings()
+    red = redis_pool.get_redis(settings)
+    set_command_status(red, command_id, {"status": "running", "started": time.time()})
+
+    spec = get_command(entry, command)
+    try:
+        ok, message = spec["run"](registry.make_drivers(entry), *spec["parse"](arg))
+    except Exception as e:
+        ok, message = False, str(e)
+    if not ok:
+        print(f"Command {command} of device {device_id} failed: {message}")
+
+    now = datetime.now().strftime("%d/%m/%Y, %H:%M:%S")
+    params = {"last_command": f"{command} {arg or ''}".strip() + " " + now}
+    if not ok:
+        params["last_error"] = f"{command}: {message} {now}"
+    db.write_device_state(red, device_id, "params", params)
+    result = {"ok": bool(ok), "message": str(message)}
+    set_command_status(red, command_id, {"status": "ok" if ok else "error", "message": result["message"],
+                                         "device_id": device_id, "command": command, "finished": time.time()})
+    if reply:
+        pipe = red.pipeline()
+        pipe.rpush(REPLY_KEY.format(id=command_id), json.dumps(result))
+        pipe.expire(REPLY_KEY.format(id=command_id), REPLY_TTL)
+        pipe.execute()
+    return result
@@ -1,151 +1,94 @@
-
-import redis
 # from flask import current_app
-import rq
 import time
-import sqlite3
 from datetime import datetime
-from ..drivers import esphome_driver
-
+from .. import db
+from .. import registry
+from .. import redis_pool
+from .sample_writer import publish_sample
 
 
-def update_device_data(config, db_path, device_name):
+def parse_esphome_reading(domain, payload):
     """
-    main goal - to get actual devices state info from hardware and store it to redis
+    convert esphome web api response to values for redis and for sqlite data db
+    switch - (200, {'id': 'switch-kolos-3_relay1', 'value': False, 'state': 'OFF'})
+    sensor - (200, {'id': 'sensor-kolos-3_dht_internal_temp', 'value': 26.3, 'state': '26.3 °C'})
+    :return: (redis_value, sql_value)
     """
-    device_dict = config[device_name]
-    rhost = config['REDIS_HOST']
-    rport = config["REDIS_PORT"]
-    qname = config["QUEUE"]
-    red = redis.Redis(host=rhost, port=rport, decode_responses=True)
-    queue_ = rq.Queue(connection=red, name=qname)
-
-    esp_ip_addr = config['ESP_IP_ADDR']
-    esp_auth_login = config['ESP_AUTH_LOGIN']
-    esp_auth_pass = config['ESP_AUTH_PASS']
-    conn = sqlite3.connect(db_path, detect_types=sqlite3.PARSE_DECLTYPES)
-    cursor = conn.cursor()
-    # dev_id = device_dict["params"]["device_id"]
-    # d =
-    # table_name = f"device_{dev_id}_{d}"
-    # insert_sql = "INSERT INTO sensor_data (sensor_name, datetime, value) VALUES (?, ?, ?)"
-
-    # esphome relay
-    if device_dict["params"]["family"] == "esphome_switch":
-        rel = esphome_driver.ESPHomeDeviceDriver(esp_ip_addr, "switch",
-                           device_dict["params"]["esphome_name"], esp_auth_login, esp_auth_pass)
-        d_id = device_dict["params"]["device_id"]
-        # try to call real hardware
-        try:
-            status = rel.get()  # get is all method for our esphome devices via web-api
-            # success result - (200, {'id': 'switch-kolos-3_relay1', 'value': False, 'state': 'OFF'})
-            if status[0] == 200:
-                # push data to sqlite data db
-                insert_sql = f"INSERT INTO device_{d_id}_state (datetime, value) VALUES (?, ?)"
-                cursor.execute(insert_sql, (datetime.now(), int(status[1]["value"])))
-                conn.commit()
-
-                # push it to redis
-                red.hset(f"device_{d_id}:data", "state", status[1]["state"])
-                red.hset(f"device_{d_id}:params", "last_time_active",
-                         datetime.now().strftime("%d/%m/%Y, %H:%M:%S"))
-                red.hset(f"device_{d_id}:params", "status", "ok")
-            else:
-                # mb store errors in logs in future
-                red.hset(f"device_{d_id}:params", "status", "error")
-                red.hset(f"device_{d_id}:params", "last_error",
-                         f"esphome web api status {status[0]}")
-
-        except Exception as e:
-            red.hset(f"device_{d_id}:params", "status", "error")
-            red.hset(f"device_{d_id}:params", "last_error", e.__str__() +
-                     datetime.now().strftime("%d/%m/%Y, %H:%M:%S"))
-
-    if device_dict["params"]["family"] == "esphome_dht22":
-        # we need make two web api calls - for humidity and for temperature
-        dht_hum = esphome_driver.ESPHomeDeviceDriver(esp_ip_addr, "sensor",
-                           device_dict["params"]["esphome_name"] + "hum", esp_auth_login, esp_auth_pass)
-        dht_temp = esphome_driver.ESPHomeDeviceDriver(esp_ip_addr, "sensor",
-                           device_dict["params"]["esphome_name"] + "temp", esp_auth_login, esp_auth_pass)
-        d_id = device_dict["params"]["device_id"]
-        # try to call real hardware
-        try:
-            status = dht_hum.get()  # get is all method for our esphome devices via web-api
-            # success result - (200, {'id': 'sensor-kolos-3_dht_internal_temp', 'value': 26.3, 'state': '26.3 °C'})
-            if status[0] == 200:
-                # push data to sqlite data db
-                insert_sql = f"INSERT INTO device_{d_id}_humidity (datetime, value) VALUES (?, ?)"
-                cursor.execute(insert_sql, (datetime.now(), int(status[1]["value"])))
-                conn.commit()
-
-                # push it to redis
-                red.hset(f"device_{d_id}:data", "humidity", status[1]["value"])
-                red.hset(f"device_{d_id}:params", "last_time_active",
-                         datetime.now().strftime("%d/%m/%Y, %H:%M:%S"))
-                red.hset(f"device_{d_id}:params", "status", "ok")
-            else:
-                red.hset(f"device_{d_id}:params", "status", "error")
-                red.hset(f"device_{d_id}:params", "last_error",
-                         f"esphome web api status {status[0]}")
-        except Exception as e:
-            red.hset(f"device_{d_id}:params", "status", "error")
-            red.hset(f"device_{d_id}:params", "last_error", e.__str__() +
-                     datetime.now().strftime("%d/%m/%Y, %H:%M:%S"))
-
-        try:
-            status = dht_temp.get()  # get is all method for our esphome devices via web-api
-            # success result - (200, {'id': 'sensor-kolos-3_dht_internal_temp', 'value': 26.3, 'state': '26.3 °C'})
-            if status[0] == 200:
-                # push data to sqlite data db
-                insert_sql = f"INSERT INTO device_{d_id}_temperature (datetime, value) VALUES (?, ?)"
-                cursor.execute(insert_sql, (datetime.now(), int(status[1]["value"])))
-                conn.commit()
+    if domain == "switch":
+        return payload["state"], int(payload["value"])
+    return payload["value"], float(payload["value"])
 
-                # push it to redis
-                red.hset(f"device_{d_id}:data", "temperature", status[1]["value"])
-                red.hset(f"device_{d_id}:params", "last_time_active",
-                         datetime.now().strftime("%d/%m/%Y, %H:%M:%S"))
-                red.hset(f"device_{d_id}:params", "status", "ok")
-            else:
-                red.hset(f"device_{d_id}:params", "status", "error")
-                red.hset(f"device_{d_id}:params", "last_error",
-                         f"esphome web api status {status[0]}")
-        except Exception as e:
-            red.hset(f"device_{d_id}:params", "status", "error")
-            red.hset(f"device_{d_id}:params", "last_error", e.__str__() +
-                     datetime.now().strftime("%d/%m/%Y, %H:%M:%S"))
 
-    # esphome ds18b20
-    if device_dict["params"]["family"] == "esphome_ds18b20":
-        # we need make two web api calls - for humidity and for temperature
-        ds18b20 = esphome_driver.ESPHomeDeviceDriver(esp_ip_addr, "sensor",
-                           device_dict["params"]["esphome_name"], esp_auth_login, esp_auth_pass)
-        d_id = device_dict["params"]["device_id"]
-        # try to call real hardware
-        try:
-            status = ds18b20.get()  # get is all method for our esphome devices via web-api
-            # success result - (200, {'id': 'sensor-kolos-3_dht_internal_temp', 'value': 26.3, 'state': '26.3 °C'})
-            if status[0] == 200:
-                # push data to sqlite data db
-                insert_sql = f"INSERT INTO device_{d_id}_temperature (datetime, value) VALUES (?, ?)"
-                cursor.execute(insert_sql, (datetime.now(), int(status[1]["value"])))
-                conn.commit()
-
-                # push it to redis
-                red.hset(f"device_{d_id}:data", "temperature", status[1]["value"])
-                red.hset(f"device_{d_id}:params", "last_time_active",
-                         datetime.now().strftime("%d/%m/%Y, %H:%M:%S"))
-                red.hset(f"device_{d_id}:params", "status", "ok")
-            else:
-                red.hset(f"device_{d_id}:params", "status", "error")
-                red.hset(f"device_{d_id}:params", "last_error",
-                         f"esphome web api status {status[0]}")
-        except Exception as e:
-            red.hset(f"device_{d_id}:params", "status", "error")
-            red.hset(f"device_{d_id}:params", "last_error", e.__str__() +
-                     datetime.now().strftime("%d/%m/%Y, %H:%M:%S"))
-
-    # schedule itself again
-    time.sleep(1)
-    queue_.enqueue(update_device_data, config, db_path, device_name)
+def parse_info_readings(entry, info):
+    """
+    take keys of device data from /info payload of esp32 firmware
+    values equal to SENSOR_ERROR_VALUE of driver codec (sensor is not connected or broken) are skipped
+    :return: list of (data_key, redis_value, sql_value)
+    """
+    error_value = getattr(entry["spec"].get("driver"), "SENSOR_ERROR_VALUE", None)
+    readings = []
+    for data_key in entry["data_keys"]:
+        if data_key not in info:
+            continue
+        value = float(info[data_key])
+        if value != error_value:
+            readings.append((data_key, info[data_key], value))
+    return readings
+
+
+def read_device(entry, drivers):
+    """
+    read all data of device once, drivers are made by registry.make_drivers(entry)
+    :return: (list of (data_key, redis_value, sql_value), list of error messages)
+    """
+    if entry["spec"]["poll"] == "esphome":
+        readings, errors = [], []
+        for domain, data_key, driver in drivers:
+            # try to call real hardware
+            try:
+                status, payload = driver.get()  # get is all method for our esphome devices via web-api
+                if status == 200:
+                    readings.append((data_key, *parse_esphome_reading(domain, payload)))
+                else:
+                    errors.append(f"esphome web api status {status}")
+            except Exception as e:
+                errors.append(e.__str__())
+        return readings, errors
+    try:
+        info = drivers.get_info()
+        if info is None:
+            return [], ["no response to /info"]
+        return parse_info_readings(entry, info), []
+    except Exception as e:
+        return [], [e.__str__()]
+
+
+def store_readings(red, device_id, readings, errors, ts):
+    """ push readings to samples stream (writer service will store them to sqlite data db) and to redis """
+    for data_key, redis_value, sql_value in readings:
+        publish_sample(red, device_id, data_key, ts, sql_value)
+    if readings:
+        db.write_device_state(red, device_id, "data", {data_key: value for data_key, value, _ in readings})
+        db.write_device_state(red, device_id, "params", {
+            "last_time_active": datetime.fromtimestamp(ts).strftime("%d/%m/%Y, %H:%M:%S"),
+            "status": "ok"})
+    if errors:
+        # mb store errors in logs in future
+        db.write_device_state(red, device_id, "params", {
+            "status": "error",
+            "last_error": "; ".join(errors) + " " + datetime.fromtimestamp(ts).strftime("%d/%m/%Y, %H:%M:%S")})
+
+
+def update_device_data(config_version, device_id):
+    """
+    main goal - to get actual devices state info from hardware and store it to redis
+    job carries only config version and device id, device and settings are taken from registry
+    job is enqueued every poll_interval of device by periodic scheduler (start-periodic)
+    """
+    registry.use_config(config_version)
+    entry = registry.get_device(device_id)
+    settings = registry.get_settings()
+    red = redis_pool.get_redis(settings)
 
+    readings, errors = read_device(entry, registry.make_drivers(entry))
+    store_readings(red, entry["id"], readings, errors, time.time())
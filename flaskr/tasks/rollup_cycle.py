@@ -0,0 +1,17 @@
+import time
+from .. import db
+from .. import timeseries
+
+
+def rollup_data(db_path, grace, retention_days):
+    """
+    build rollup tiers of all series from new raw samples, remove old raw samples
+    job is enqueued every ROLLUP_PERIOD seconds by periodic scheduler (start-periodic)
+    """
+    conn = db.connect_data_db(db_path)
+    try:
+        timeseries.create_schema(conn)
+        timeseries.rollup(conn, int(time.time() * 1000),
+                          grace_ms=grace * 1000, raw_retention_ms=retention_days * 86400000)
+    finally:
+        conn.close()
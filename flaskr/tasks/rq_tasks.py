@@ -1,9 +1,11 @@
-import redis
 import rq
 import time
 from datetime import datetime, timedelta
 
 import requests
+from .. import redis_pool
+from .. import registry
+from ..locks import device_lock
 device_path = "/home/bigfoot/PycharmProjects/clay_golem/flaskr/tasks/device1.txt"
 
 def count_words_at_url(url):
@@ -14,48 +16,37 @@ def count_words_at_url(url):
 # user-defined tasks to work with low-level drivers
 def short_task(data):
     # short task - do something with stub device and done
-    red = redis.Redis(host='localhost', port=6379, decode_responses=True)
+    # redis settings of loaded config, pool of worker process is shared by all its jobs
+    red = redis_pool.get_redis(registry.get_settings())
     # get device lock
-    # or sleep until get it
-    lock_acquired = 0
-    while not lock_acquired:
-        lock_acquired = red.set("lock:device1", "test", ex=10, nx=True)
-        time.sleep(0.1)
-
-    # when lock acquired
-    with open(device_path, 'a') as file1:
-        date_ = datetime.now().strftime("%d/%m/%Y, %H:%M:%S")
-        file1.write(date_ + " : short task started! : " + str(data)+ "\n")
-        time.sleep(1)
-        date_ = datetime.now().strftime("%d/%m/%Y, %H:%M:%S")
-        file1.write(date_ + " : short task ended! : " + str(data) + "\n")
-
-    # free lock
-    lock_deleted = red.delete("lock:device1", "test")
+    # or wait in queue until it is released by previous owner
+    with device_lock(red, 1):
+        # when lock acquired
+        with open(device_path, 'a') as file1:
+            date_ = datetime.now().strftime("%d/%m/%Y, %H:%M:%S")
+            file1.write(date_ + " : short task started! : " + str(data)+ "\n")
+            time.sleep(1)
+            date_ = datetime.now().strftime("%d/%m/%Y, %H:%M:%S")
+            file1.write(date_ + " : short task ended! : " + str(data) + "\n")
+    # lock is freed only if it is still ours
 
 
 def short_periodical_task(rhost, rport, qname, i):
     # periodical task, works everytime but mostly sleeps, waiting for signal from redis or time
     # it scheduling itself to next run
-    red = redis.Redis(host=rhost, port=rport, decode_responses=True)
-    queue_ = rq.Queue(connection=red, name=qname)
+    settings = {"REDIS_HOST": rhost, "REDIS_PORT": rport}
+    red = redis_pool.get_redis(settings)
+    queue_ = rq.Queue(connection=redis_pool.get_redis(settings, decode_responses=False), name=qname)
     # get device lock
-    # or sleep until get it
-    lock_acquired = 0
-    while not lock_acquired:
-        lock_acquired = red.set("lock:device1", "test", ex=10, nx=True)
-        time.sleep(0.1)
-
-    # when lock acquired
-    with open(device_path, 'a') as file1:
-        date_ = datetime.now().strftime("%d/%m/%Y, %H:%M:%S")
-        file1.write(date_ + " : short periodical task started! : " + str(i)+ "\n")
-        time.sleep(1)
-        date_ = datetime.now().strftime("%d/%m/%Y, %H:%M:%S")
-        file1.write(date_ + " : short periodical task ended! : " + str(i)+ "\n")
-
-    # free lock
-    lock_deleted = red.delete("lock:device1", "test")
+    # or wait in queue until it is released by previous owner
+    with device_lock(red, 1):
+        # when lock acquired
+        with open(device_path, 'a') as file1:
+            date_ = datetime.now().strftime("%d/%m/%Y, %H:%M:%S")
+            file1.write(date_ + " : short periodical task started! : " + str(i)+ "\n")
+            time.sleep(1)
+            date_ = datetime.now().strftime("%d/%m/%Y, %H:%M:%S")
+            file1.write(date_ + " : short periodical task ended! : " + str(i)+ "\n")
 
     # schedule itself again
     queue_.enqueue_in(timedelta(seconds=10), short_periodical_task, rhost, rport, qname, i-1)
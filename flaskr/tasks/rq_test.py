@@ -5,14 +5,14 @@ from flask import current_app
 import rq
 import sys
 import datetime
-import redis
+from flaskr import redis_pool
 
 sys.path.append("/home/bigfoot/PycharmProjects/clay_golem/instance")
 import config
 
 
 if __name__ == "__main__":
-    r = redis.Redis(host='localhost', port=6379)
+    r = redis_pool.get_redis({"REDIS_HOST": "localhost", "REDIS_PORT": 6379}, decode_responses=False)
     queue = rq.Queue(connection=r)
     # tasks for update devices states in redis
     queue.enqueue(update_device_data, config.RELAY_1_DICT, 'localhost', 6379, "default")
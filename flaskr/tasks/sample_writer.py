@@ -0,0 +1,205 @@
+import queue
+import threading
+import time
+import click
+import redis
+from flask import current_app
+from .. import db
+from .. import timeseries
+from .. import redis_pool
+from ..utils.logger import Logger
+
+"""
+Dedicated writer of sensor samples to sqlite data db.
+Samples come from in-process queue (async poller) or from redis stream (rq jobs, see publish_sample)
+and are inserted with executemany in group commits, bounded by size and by time.
+So we have one fsync per batch, not per sample, and only one process writes to the data db.
+"""
+
+# redis stream with samples from all processes, that can not write to data db directly
+SAMPLES_STREAM = "samples:stream"
+SAMPLES_GROUP = "sample_writer"
+# malformed entries of samples stream with error, they are acknowledged and moved here
+DEAD_LETTER_STREAM = "samples:dead"
+# hash where writer reports its throughput and lag
+STATS_KEY = "sample_writer:stats"
+
+
+def publish_sample(red, device_id, data_key, ts, value, maxlen=100000):
+    """
+    send one sample to samples stream, writer service will store it
+    :param red: redis client or pipeline
+    :param ts: unix timestamp (seconds, float)
+    :param maxlen: approximate limit of stream length, if writer is stopped old samples are dropped
+    """
+    return red.xadd(SAMPLES_STREAM, {"device_id": device_id, "key": data_key, "ts": ts, "value": value},
+                    maxlen=maxlen, approximate=True)
+
+
+def parse_stream_sample(fields):
+    """ :return: (device_id, data_key, ts, value), raises KeyError, TypeError or ValueError for malformed entry """
+    return fields["device_id"], fields["key"], float(fields["ts"]), float(fields["value"])
+
+
+class SampleWriter:
+    def __init__(self, db_path, max_batch=500, max_delay=1.0, report_interval=60, red=None):
+        """
+        :param db_path: full path to sqlite data db
+        :param max_batch: commit when so many samples are collected
+        :param max_delay: or when oldest collected sample waits so many seconds
+        :param report_interval: seconds between stats reports to log (and to redis, if red is given)
+        """
+        self.conn = db.connect_data_db(db_path)
+        # writer is the only way of samples to data db, it must not depend on init-db or migrate-data-db
+        timeseries.create_schema(self.conn)
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.report_interval = report_interval
+        self.red = red
+        self.queue = queue.Queue()
+        self.logger = Logger.get_logger(self.__class__.__name__)
+        self.stats = {"rows": 0, "batches": 0, "errors": 0, "rejected": 0, "rows_per_sec": 0.0, "lag_sec": 0.0,
+                      "queue": 0}
+        self._rows_at_report = 0
+        self._last_report = time.monotonic()
+        self._thread = None
+        self._stopped = threading.Event()
+        self._series_cache = {}   # (device_id, field) -> series_id
+
+    def submit(self, device_id, data_key, ts, value):
+        """ put one sample to in-process queue, ts - unix timestamp """
+        self.queue.put((device_id, data_key, ts, value))
+
+    def write_batch(self, samples):
+        """
+        insert batch of (device_id, data_key, ts, value) in one transaction
+        :return: True if batch was committed
+        """
+        try:
+            with self.conn:
+                timeseries.insert_samples(self.conn, samples, self._series_cache)
+        except Exception as e:
+            # series registered in failed transaction are rolled back too
+            self._series_cache.clear()
+            self.stats["errors"] += 1
+            self.logger.error(f"Failed to write batch of {len(samples)} samples: {e}")
+            return False
+        self.stats["rows"] += len(samples)
+        self.stats["batches"] += 1
+        # how long the oldest sample of batch waited to be stored
+        self.stats["lag_sec"] = round(time.time() - min(sample[2] for sample in samples), 3)
+        self.report()
+        return True
+
+    def report(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._last_report < self.report_interval:
+            return
+        self.stats["rows_per_sec"] = round((self.stats["rows"] - self._rows_at_report) / (now - self._last_report), 2)
+        self.stats["queue"] = self.queue.qsize()
+        self._rows_at_report = self.stats["rows"]
+        self._last_report = now
+        self.logger.info(f"Sample writer stats: {self.stats}")
+        if self.red is not None:
+            try:
+                self.red.hset(STATS_KEY, mapping=self.stats)
+            except redis.RedisError as e:
+                self.logger.warning(f"Failed to report stats to redis: {e}")
+
+    def run_queue(self):
+        """ consume in-process queue forever """
+        while True:
+            samples = [self.queue.get()]
+            if samples[0] is None:
+                return   # stop()
+            deadline = time.monotonic() + self.max_delay
+            while len(samples) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    sample = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if sample is None:
+                    self.queue.put(None)   # stop after this batch
+                    break
+                samples.append(sample)
+            self.write_batch(samples)
+
+    def start(self):
+        """ start in-process queue consumer in background thread """
+        self._thread = threading.Thread(target=self.run_queue, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """ stop consumers after current batch """
+        self._stopped.set()
+        self.queue.put(None)
+        if self._thread is not None:
+            self._thread.join()
+
+    def run_stream(self, red, consumer="writer"):
+        """
+        consume samples stream forever, samples are acknowledged only after commit,
+        so after crash not acknowledged ones will be read again
+        """
+        try:
+            red.xgroup_create(SAMPLES_STREAM, SAMPLES_GROUP, id="0", mkstream=True)
+        except redis.ResponseError:
+            pass   # group already exists
+        # first read our pending samples after restart, then new ones
+        last_id = "0"
+        while not self._stopped.is_set():
+            replies = red.xreadgroup(SAMPLES_GROUP, consumer, {SAMPLES_STREAM: last_id},
+                                     count=self.max_batch, block=int(self.max_delay * 1000))
+            messages = replies[0][1] if replies else []
+            if not messages:
+                if last_id == "0":
+                    last_id = ">"
+                self.report()
+                continue
+            samples, message_ids = [], []
+            for message_id, fields in messages:
+                try:
+                    samples.append(parse_stream_sample(fields))
+                    message_ids.append(message_id)
+                except (KeyError, TypeError, ValueError) as e:
+                    # else it stays pending and stops writer after every restart
+                    self.reject(red, message_id, fields, e)
+            if not samples:
+                continue
+            if self.write_batch(samples):
+                red.xack(SAMPLES_STREAM, SAMPLES_GROUP, *message_ids)
+            else:
+                # retry not acknowledged samples a bit later
+                last_id = "0"
+                time.sleep(self.max_delay)
+
+    def reject(self, red, message_id, fields, error, maxlen=10000):
+        """ move malformed stream entry to dead letter stream and acknowledge it """
+        self.stats["rejected"] += 1
+        self.logger.warning(f"Rejected malformed sample {message_id} {fields}: {error!r}")
+        entry = {"id": message_id, "error": repr(error)}
+        if isinstance(fields, dict):
+            entry.update({f"field:{name}": value for name, value in fields.items()})
+        pipe = red.pipeline()
+        pipe.xadd(DEAD_LETTER_STREAM, entry, maxlen=maxlen, approximate=True)
+        pipe.xack(SAMPLES_STREAM, SAMPLES_GROUP, message_id)
+        pipe.execute()
+
+
+@click.command('start-writer')
+def start_writer_command():
+    """
+    Start writer of samples from redis stream to sqlite data db and block this process
+    """
+    db_path = current_app.instance_path + "/" + current_app.config['DATA_DB_NAME']
+    red = redis_pool.get_redis()
+    writer = SampleWriter(db_path,
+                          max_batch=current_app.config.get("WRITER_MAX_BATCH", 500),
+                          max_delay=current_app.config.get("WRITER_MAX_DELAY", 1.0),
+                          report_interval=current_app.config.get("WRITER_REPORT_INTERVAL", 60),
+                          red=red)
+    print(f"Writing samples from {SAMPLES_STREAM} to {db_path}")
+    writer.run_stream(red)
@@ -0,0 +1,128 @@
+import collections
+import threading
+import time
+from datetime import datetime
+import click
+import redis
+from flask import current_app
+from .. import db
+from .. import registry
+from .. import redis_pool
+from ..drivers.sba5_driver import MEASUREMENT_FIELDS
+from .sample_writer import SampleWriter
+
+"""
+Ingestion service for SBA-5 CO2 analyzers - devices with family "sba5" in config.
+Serial reader thread of SBA5Session only puts parsed frames to bounded in-memory buffer,
+flush loop takes them from buffer in batches and stores them:
+to device_{id}:data hash (write_device_state, so frontend gets every frame), to redis stream
+sba5:{id}:frames with raw frames, and to sqlite data db through in-process SampleWriter.
+If storage is slower than device, oldest frames are dropped from buffer, serial reads never wait.
+Device params in config: serial_port, baudrate (default 19200).
+"""
+
+SBA5_FAMILY = "sba5"
+# keys of device data, the same as fields of parsed frame
+SBA5_DATA_KEYS = tuple(MEASUREMENT_FIELDS.values())
+
+
+def sba5_stream_key(device_id):
+    """ outside of device_* keys, so init-db does not delete history of frames """
+    return f"sba5:{device_id}:frames"
+
+
+class SBA5Ingest:
+    def __init__(self, device_id, session, red, writer, buffer_size=1000, flush_interval=1.0, stream_maxlen=10000):
+        """
+        :param session: SBA5Session, not started yet
+        :param red: redis client
+        :param writer: SampleWriter for data db
+        :param buffer_size: max number of frames waiting for flush
+        """
+        self.device_id = device_id
+        self.session = session
+        self.session.on_measurement = self.on_measurement
+        self.red = red
+        self.writer = writer
+        self.buffer = collections.deque(maxlen=buffer_size)
+        self.flush_interval = flush_interval
+        self.stream_maxlen = stream_maxlen
+        self.dropped = 0   # frames lost because buffer was full
+
+    def on_measurement(self, record):
+        """ called from serial reader thread, must not block """
+        if len(self.buffer) == self.buffer.maxlen:
+            self.dropped += 1
+        self.buffer.append(record)
+
+    def take_frames(self):
+        frames = []
+        while self.buffer:
+            frames.append(self.buffer.popleft())
+        return frames
+
+    def flush(self):
+        """ store all buffered frames, redis in one pipeline and sqlite through writer queue """
+        frames = self.take_frames()
+        if not frames:
+            return 0
+        pipe = self.red.pipeline(transaction=False)
+        for frame in frames:
+            db.write_device_state(pipe, self.device_id, "data", {key: frame[key] for key in SBA5_DATA_KEYS})
+            pipe.xadd(sba5_stream_key(self.device_id), frame, maxlen=self.stream_maxlen, approximate=True)
+        db.write_device_state(pipe, self.device_id, "params", {
+            "last_time_active": datetime.fromtimestamp(frames[-1]["ts"]).strftime("%d/%m/%Y, %H:%M:%S"),
+            "status": "ok",
+            "dropped_frames": self.dropped})
+        try:
+            pipe.execute()
+        except redis.RedisError as e:
+            print(f"SBA5 ingest of device {self.device_id} failed to write {len(frames)} frames to redis: {e}")
+        for frame in frames:
+            for key in SBA5_DATA_KEYS:
+                self.writer.submit(self.device_id, key, frame["ts"], frame[key])
+        return len(frames)
+
+    def run(self):
+        """ read device and store frames forever """
+        self.session.start()
+        while True:
+            # frames keep coming to buffer meanwhile
+            time.sleep(self.flush_interval)
+            self.flush()
+
+
+@click.command('start-sba5')
+@click.option('--device-id', type=int, default=None, help="Ingest only this SBA5 device")
+def start_sba5_command(device_id):
+    """
+    Start ingestion of all SBA5 devices from config and block this process
+    """
+    config = current_app.config
+    db_path = current_app.instance_path + "/" + config['DATA_DB_NAME']
+    red = redis_pool.get_redis(config)
+    writer = SampleWriter(db_path,
+                          max_batch=config.get("WRITER_MAX_BATCH", 500),
+                          max_delay=config.get("WRITER_MAX_DELAY", 1.0),
+                          report_interval=config.get("WRITER_REPORT_INTERVAL", 60),
+                          red=red)
+    ingests = []
+    for entry in registry.get_devices():
+        if entry["family"] != SBA5_FAMILY or device_id not in (None, entry["id"]):
+            continue
+        params = entry["params"]
+        session = entry["spec"]["driver"](params["serial_port"], params.get("baudrate", 19200), name=f"sba5_{entry['id']}")
+        ingests.append(SBA5Ingest(entry["id"], session, red, writer,
+                                  buffer_size=config.get("SBA5_BUFFER_SIZE", 1000),
+                                  flush_interval=config.get("SBA5_FLUSH_INTERVAL", 1.0),
+                                  stream_maxlen=config.get("SBA5_STREAM_MAXLEN", 10000)))
+    if not ingests:
+        print("No SBA5 devices in config")
+        return
+    print(f"Ingesting {len(ingests)} SBA5 devices")
+    writer.start()
+    threads = [threading.Thread(target=ingest.run, daemon=True) for ingest in ingests]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
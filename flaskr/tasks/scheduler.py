@@ -0,0 +1,272 @@
+import math
+import random
+import time
+import uuid
+import click
+import rq
+from rq.job import Job
+from flask import current_app
+from .. import registry
+from .. import config_snapshot
+from .. import lanes
+from .. import redis_pool
+from ..locks import RENEW_SCRIPT, RELEASE_SCRIPT
+from .data_logger_cycle import update_device_data
+from .ventilation_loop import ventilation_loop
+from .sequences import SEQUENCES, SequenceDispatcher
+from .rollup_cycle import rollup_data
+
+"""
+Periodic scheduler - one process (start-periodic), that enqueues rq jobs of periodic tasks at fixed rate.
+Runs of task are slots anchor + k * interval of unix time, so schedule does not drift and does not depend
+on how long jobs run, and jobs do not schedule themselves (crashed job does not stop its loop).
+Task spec is dict:
+    name - unique name, state of task is stored in redis hash periodic:{name}
+    func, args - rq job, queue - name of rq queue for it (command lane of device), None - default queue
+    interval - seconds between slots, anchor - unix time of slot 0 (default 0, so 15 min slots are at :00, :15...)
+    jitter - random delay of every run, 0..jitter seconds, slots are not shifted by it
+    missed - what to do with slots missed while scheduler was stopped or behind:
+        "skip" - drop them, latest slot runs only if it is late not more than grace seconds (default interval)
+        "once" - run latest slot once
+        "all" - run every missed slot, not more than max_catch_up of them; jobs get the same args as
+            in-time ones, not time of their slot, so task must find out itself what period it covers
+    overlap - "skip" - do not enqueue new job while previous one is queued or running, "allow" - enqueue anyway
+Several schedulers may run on different hosts, only one of them holding leader lock in redis fires jobs,
+others wait for lock to expire.
+Leader also enqueues steps of running actuator sequences (see sequences.py) when their time comes.
+"""
+
+MISSED_POLICIES = ("skip", "once", "all")
+OVERLAP_POLICIES = ("skip", "allow")
+# previous job with one of these statuses is not finished yet
+ACTIVE_STATUSES = ("queued", "started", "deferred", "scheduled")
+
+LEADER_KEY = "periodic:leader"
+TASK_KEY = "periodic:{name}"
+
+
+def make_task(name, func, args, interval, jitter=0.0, missed="once", overlap="skip", grace=None,
+              anchor=0.0, max_catch_up=10, job_timeout=None, queue=None):
+    if missed not in MISSED_POLICIES:
+        raise ValueError(f"Unknown missed runs policy {missed} of periodic task {name}")
+    if overlap not in OVERLAP_POLICIES:
+        raise ValueError(f"Unknown overlap policy {overlap} of periodic task {name}")
+    if interval <= 0:
+        raise ValueError(f"Interval of periodic task {name} must be positive")
+    return {
+        "name": name, "func": func, "args": tuple(args), "interval": float(interval), "jitter": float(jitter),
+        "missed": missed, "overlap": overlap, "grace": float(interval if grace is None else grace),
+        "anchor": float(anchor), "max_catch_up": max_catch_up, "job_timeout": job_timeout, "queue": queue,
+    }
+
+
+def next_slot_after(task, now):
+    """ first slot of task strictly after now """
+    k = math.floor((now - task["anchor"]) / task["interval"]) + 1
+    return task["anchor"] + k * task["interval"]
+
+
+def due_runs(task, slot, now):
+    """
+    slots of task to run now
+    :param slot: earliest slot not run yet
+    :return: (list of slots to run, next slot not run yet)
+    """
+    if now < slot:
+        return [], slot
+    missed = math.floor((now - slot) / task["interval"])   # slots before latest one
+    latest = slot + missed * task["interval"]
+    next_slot = latest + task["interval"]
+    if task["missed"] == "all":
+        count = min(missed + 1, task["max_catch_up"])
+        runs = [latest - i * task["interval"] for i in reversed(range(count))]
+    elif task["missed"] == "skip" and now - latest > task["grace"]:
+        runs = []
+    else:
+        # "once", and "skip" in time
+        runs = [latest]
+    return runs, next_slot
+
+
+class LeaderLock:
+    """ redis lock with random token, only owner can renew or release it """
+
+    def __init__(self, red, key=LEADER_KEY, ttl=10.0):
+        self.red = red
+        self.key = key
+        self.ttl = ttl
+        self.token = uuid.uuid4().hex
+        self.renew_script = red.register_script(RENEW_SCRIPT)
+        self.release_script = red.register_script(RELEASE_SCRIPT)
+        self.held_until = 0.0   # monotonic time, when lock expires if it is not renewed
+
+    def acquire(self):
+        started = time.monotonic()
+        if self.red.set(self.key, self.token, nx=True, px=int(self.ttl * 1000)):
+            self.held_until = started + self.ttl
+            return True
+        return False
+
+    def renew(self):
+        started = time.monotonic()
+        if self.renew_script(keys=[self.key], args=[self.token, int(self.ttl * 1000)]):
+            self.held_until = started + self.ttl
+            return True
+        self.held_until = 0.0
+        return False
+
+    def release(self):
+        self.release_script(keys=[self.key], args=[self.token])
+        self.held_until = 0.0
+
+    def held(self, margin=0.0):
+        return time.monotonic() + margin < self.held_until
+
+
+class PeriodicScheduler:
+    def __init__(self, red, queue, tasks, lock=None, leader_ttl=10.0, sequences=None):
+        """
+        :param red: redis client for task state, without decode_responses (the same as for rq)
+        :param queue: default rq queue for jobs
+        :param tasks: list of task specs from make_task
+        :param sequences: SequenceDispatcher, enqueues steps of running actuator sequences
+        """
+        self.red = red
+        self.queue = queue
+        self.tasks = {task["name"]: task for task in tasks}
+        self.queues = {None: queue}   # queue name from task spec -> rq queue
+        self.lock = lock if lock is not None else LeaderLock(red, ttl=leader_ttl)
+        self.sequences = sequences
+        self.state = {}   # name -> {"slot", "fire_at", "job_id"}, valid only while we are leader
+
+    def load_state(self, now):
+        """ continue schedule of previous leader from redis, or start from next slot """
+        pipe = self.red.pipeline(transaction=False)
+        for name in self.tasks:
+            pipe.hmget(TASK_KEY.format(name=name), "slot", "job_id")
+        for (name, task), (slot, job_id) in zip(self.tasks.items(), pipe.execute()):
+            slot = float(slot) if slot is not None else next_slot_after(task, now)
+            self.state[name] = {"slot": slot, "fire_at": slot + random.uniform(0, task["jitter"]),
+                                "job_id": job_id.decode() if job_id else None}
+
+    def get_queue(self, name):
+        if name not in self.queues:
+            self.queues[name] = rq.Queue(name, connection=self.red)
+        return self.queues[name]
+
+    def running_jobs(self, names):
+        """ names of tasks, which previous job is still queued or running """
+        ids = [self.state[name]["job_id"] for name in names if self.state[name]["job_id"]]
+        active = set()
+        for job in Job.fetch_many(ids, connection=self.red) if ids else []:
+            if job is not None and job.get_status(refresh=False) in ACTIVE_STATUSES:
+                active.add(job.id)
+        return {name for name in names if self.state[name]["job_id"] in active}
+
+    def tick(self, now):
+        """
+        enqueue jobs of all due tasks and due steps of sequences
+        :return: seconds to sleep until next due task
+        """
+        due = [name for name, state in self.state.items() if now >= state["fire_at"]]
+        running = self.running_jobs([name for name in due if self.tasks[name]["overlap"] == "skip"])
+        pipe = self.red.pipeline(transaction=False)
+        for name in due:
+            task, state = self.tasks[name], self.state[name]
+            runs, next_slot = due_runs(task, state["slot"], now)
+            skipped = 0
+            if name in running:
+                skipped, runs = len(runs), []
+            elif not runs:
+                print(f"Periodic task {name} is too late, skipped till {time.ctime(next_slot)}")
+            for _ in runs:
+                job = self.get_queue(task["queue"]).enqueue(task["func"], *task["args"], job_timeout=task["job_timeout"])
+                state["job_id"] = job.id
+            state["slot"] = next_slot
+            state["fire_at"] = next_slot + random.uniform(0, task["jitter"])
+            mapping = {"slot": next_slot, "last_tick": now}
+            if runs:
+                mapping.update({"job_id": state["job_id"], "last_run": now})
+            pipe.hset(TASK_KEY.format(name=name), mapping=mapping)
+            if skipped:
+                pipe.hincrby(TASK_KEY.format(name=name), "skipped_overlap", skipped)
+        if due:
+            pipe.execute()
+        next_fire = min((state["fire_at"] for state in self.state.values()), default=now + 1)
+        if self.sequences is not None:
+            next_fire = min(next_fire, self.sequences.dispatch(now))
+        return max(0.0, next_fire - time.time())
+
+    def run(self):
+        """ fire tasks while we are leader, wait for leadership otherwise """
+        renew_every = self.lock.ttl / 3
+        next_renew = 0.0
+        try:
+            while True:
+                if not self.lock.held():
+                    if not self.lock.acquire():
+                        self.state = {}
+                        time.sleep(renew_every)
+                        continue
+                    print(f"Periodic scheduler became leader, {len(self.tasks)} tasks")
+                    self.load_state(time.time())
+                    next_renew = time.monotonic() + renew_every
+                if time.monotonic() >= next_renew:
+                    if not self.lock.renew():
+                        print("Periodic scheduler lost leadership")
+                        self.state = {}
+                        continue
+                    next_renew = time.monotonic() + renew_every
+                # never fire without lock valid for some time more
+                if not self.lock.held(margin=renew_every):
+                    continue
+                wait = self.tick(time.time())
+                time.sleep(min(wait, max(0.0, next_renew - time.monotonic())))
+        finally:
+            if self.lock.held():
+                self.lock.release()
+
+
+def build_tasks(config, config_version, data_db_path):
+    """
+    periodic tasks of this app, PERIODIC_TASKS config overrides their specs by name,
+    like {"ventilation_loop": {"jitter": 5}}
+    """
+    overrides = config.get("PERIODIC_TASKS", {})
+    specs = []
+    # device polling, not needed if devices are polled by separate async poller process (start-poller)
+    if not config.get("ASYNC_POLLER", False):
+        for entry in registry.get_devices(poll="any"):
+            specs.append({"name": f"update_device_data_{entry['id']}", "func": update_device_data,
+                          "args": (config_version, entry["id"]), "interval": entry["poll_interval"],
+                          "queue": lanes.lane_queue_name(entry["lane"]) if entry["lane"] else None,
+                          "jitter": entry["params"].get("poll_jitter", 0.0), "missed": "once"})
+    # rollup tiers of samples in data db and retention of raw samples
+    specs.append({"name": "rollup_data", "func": rollup_data,
+                  "args": (data_db_path, config.get("ROLLUP_GRACE", 60), config.get("RAW_RETENTION_DAYS", 30)),
+                  "interval": config.get("ROLLUP_PERIOD", 60), "missed": "once"})
+    # start of ventilation sequence every measure_cycle_time minutes, late ventilation is worse than skipped one
+    specs.append({"name": "ventilation_loop", "func": ventilation_loop, "args": (config_version,),
+                  "interval": config["EXPERIMENT"]["ventilation"]["measure_cycle_time"] * 60,
+                  "missed": "skip", "grace": 60})
+    return [make_task(**dict(spec, **overrides.get(spec["name"], {}))) for spec in specs]
+
+
+@click.command('start-periodic')
+def start_periodic_command():
+    """
+    Start periodic scheduler of rq jobs and block this process
+    """
+    config = current_app.config
+    # rq stores pickled jobs, so no decode_responses here
+    red = redis_pool.get_redis(decode_responses=False)
+    queue = rq.Queue(connection=red, name=config['QUEUE'])
+    # jobs get only version of config snapshot, workers load it from redis once
+    config_version = config_snapshot.publish(red)
+    data_db_path = current_app.instance_path + "/" + config['DATA_DB_NAME']
+    # steps of actuator sequences go ahead of polling in lane of esphome host
+    sequence_queue = lanes.get_queue(red, config['ESP_IP_ADDR'], high=True)
+    scheduler = PeriodicScheduler(red, queue, build_tasks(config, config_version, data_db_path),
+                                  leader_ttl=config.get("PERIODIC_LEADER_TTL", 10),
+                                  sequences=SequenceDispatcher(red, sequence_queue, SEQUENCES, config_version))
+    scheduler.run()
@@ -0,0 +1,176 @@
+import time
+import uuid
+import datetime
+import traceback
+import rq
+from ..drivers.esphome_driver import ESPHomeDeviceDriver
+from .. import config_snapshot
+from .. import redis_pool
+
+"""
+Timed actuator sequences as declarative state machines, like ventilation: valves open, wait, pumps on,
+wait vent_time, all off. Sequence is dict:
+    name - state of running sequence is stored in redis hash sequence:{name}
+    steps - list of {"name", "actions": [(domain, esphome entity, command), ...], "wait": seconds after actions}
+    on_error - name of step to jump to if actions of other step fail (usually step that turns everything off)
+Nobody sleeps during waits: rq job runs actions of one step and stores time of next transition to redis,
+periodic scheduler (start-periodic) enqueues job of next step when this time comes.
+After restart of scheduler or workers sequence continues from its current step.
+Sequences are built from config by builders in SEQUENCES.
+"""
+
+SEQUENCE_KEY = "sequence:{name}"
+# step job, that did not finish in this time (worker was killed), is enqueued again
+DISPATCH_TIMEOUT = 120
+# scheduler checks running sequences at least so often, seconds
+CHECK_INTERVAL = 1.0
+
+# start new run only if sequence is not running now
+START_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'state') == 'running' then
+    return 0
+end
+redis.call('DEL', KEYS[1])
+redis.call('HSET', KEYS[1], 'run_id', ARGV[1], 'state', 'running', 'step', 0, 'step_name', ARGV[2],
+           'next_at', ARGV[3], 'started_at', ARGV[3])
+return 1
+"""
+# move run to next step only if it is still at the step we have done, so duplicated job does nothing
+ADVANCE_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'run_id') ~= ARGV[1] or redis.call('HGET', KEYS[1], 'step') ~= ARGV[2] then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'state', ARGV[3], 'step', ARGV[4], 'step_name', ARGV[5], 'next_at', ARGV[6],
+           'dispatched', '')
+return 1
+"""
+
+
+def ventilation_sequence(config):
+    vent = config["EXPERIMENT"]["ventilation"]
+    valves = [("switch", "kolos-3_relay3"), ("switch", "kolos-3_relay4")]
+    pumps = [("switch", "kolos-3_relay1"), ("switch", "kolos-3_relay2")]
+    return {
+        "name": "ventilation",
+        "steps": [
+            # wait when valves fully open
+            {"name": "open_valves", "actions": [(*valve, "turn_on") for valve in valves], "wait": 5},
+            {"name": "pumps_on", "actions": [(*pump, "turn_on") for pump in pumps], "wait": vent["vent_time"]},
+            {"name": "all_off", "actions": [(*relay, "turn_off") for relay in pumps + valves], "wait": 0},
+        ],
+        "on_error": "all_off",
+    }
+
+
+# name -> builder of sequence from config snapshot
+SEQUENCES = {
+    "ventilation": ventilation_sequence,
+}
+
+
+def get_sequence(config, name):
+    return SEQUENCES[name](config)
+
+
+def step_index(sequence, step_name):
+    return [step["name"] for step in sequence["steps"]].index(step_name)
+
+
+def run_actions(config, actions):
+    """ send commands to esphome devices, raise on first failed one """
+    for domain, entity, command in actions:
+        driver = ESPHomeDeviceDriver(config['ESP_IP_ADDR'], domain, entity,
+                                     config['ESP_AUTH_LOGIN'], config['ESP_AUTH_PASS'])
+        status, _ = driver.post_no_params(command)  # turn_on, turn_off and toggle
+        if status != 200:
+            raise RuntimeError(f"{command} of {entity} returned status {status}")
+
+
+def start_sequence(config_version, name):
+    """
+    start new run of sequence, its first step is enqueued by scheduler
+    :return: run id, or None if sequence is still running
+    """
+    config = config_snapshot.get_config(config_version)
+    sequence = get_sequence(config, name)
+    red = redis_pool.get_redis(config)
+    run_id = uuid.uuid4().hex
+    started = red.eval(START_SCRIPT, 1, SEQUENCE_KEY.format(name=name),
+                       run_id, sequence["steps"][0]["name"], time.time())
+    if not started:
+        print(f"Sequence {name} is still running, new run is not started")
+        return None
+    return run_id
+
+
+def run_sequence_step(config_version, name, run_id, step):
+    """ rq job: do actions of one step of sequence run and set time of next transition """
+    config = config_snapshot.get_config(config_version)
+    sequence = get_sequence(config, name)
+    red = redis_pool.get_redis(config)
+    key = SEQUENCE_KEY.format(name=name)
+    current = red.hmget(key, "run_id", "step")
+    if current != [run_id, str(step)]:
+        # run was restarted or step is already done by duplicated job
+        return
+
+    next_step, state, wait = step + 1, "running", sequence["steps"][step]["wait"]
+    try:
+        run_actions(config, sequence["steps"][step]["actions"])
+    except Exception as e:
+        # log something or make emergency call
+        failure_info = {
+            'error': str(e),
+            'traceback': traceback.format_exc(),
+            'timestamp': datetime.datetime.now().strftime("%d/%m/%Y, %H:%M:%S")  # Store the timestamp of the failure
+        }
+        job = rq.get_current_job()
+        red.hset(f"job_failure:{name}_{sequence['steps'][step]['name']}_{job.id if job else run_id}",
+                 mapping=failure_info)
+        red.hset(key, "last_error", f"{sequence['steps'][step]['name']}: {e}")
+        on_error = step_index(sequence, sequence["on_error"])
+        # if even safe step failed, sequence stops here
+        next_step, state = (on_error, "running") if step != on_error else (len(sequence["steps"]), "failed")
+        wait = 0
+
+    if next_step >= len(sequence["steps"]):
+        next_name, state = "", "done" if state == "running" else state
+    else:
+        next_name = sequence["steps"][next_step]["name"]
+    red.eval(ADVANCE_SCRIPT, 1, key, run_id, step, state, next_step, next_name, time.time() + wait)
+
+
+class SequenceDispatcher:
+    """ used by periodic scheduler, enqueues jobs of steps, which time has come """
+
+    def __init__(self, red, queue, names, config_version):
+        """
+        :param red: redis client without decode_responses (the same as for rq)
+        """
+        self.red = red
+        self.queue = queue
+        self.names = list(names)
+        self.config_version = config_version
+
+    def dispatch(self, now):
+        """
+        :return: time of next check
+        """
+        pipe = self.red.pipeline(transaction=False)
+        for name in self.names:
+            pipe.hmget(SEQUENCE_KEY.format(name=name), "state", "run_id", "step", "next_at",
+                       "dispatched", "dispatched_at")
+        next_check = now + CHECK_INTERVAL
+        for name, fields in zip(self.names, pipe.execute()):
+            state, run_id, step, next_at, dispatched, dispatched_at = [
+                value.decode() if value is not None else None for value in fields]
+            if state != "running":
+                continue
+            if now < float(next_at):
+                next_check = min(next_check, float(next_at))
+                continue
+            if dispatched == step and now - float(dispatched_at) < DISPATCH_TIMEOUT:
+                continue
+            self.red.hset(SEQUENCE_KEY.format(name=name), mapping={"dispatched": step, "dispatched_at": now})
+            self.queue.enqueue(run_sequence_step, self.config_version, name, run_id, int(step))
+        return next_check
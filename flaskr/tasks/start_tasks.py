@@ -1,63 +1,27 @@
-import redis
 import rq
 from rq.command import send_shutdown_command, send_kill_horse_command, send_stop_job_command
-from flask import current_app
-from ..tasks.data_logger_cycle import update_device_data
-from ..tasks.ventilation_loop import ventilation_loop, calculate_next_loop_time
+from ..tasks.scheduler import start_periodic_command
+from ..tasks.async_poller import start_poller_command
+from ..tasks.sample_writer import start_writer_command
+from ..tasks.sba5_ingest import start_sba5_command
 import click
+from .. import redis_pool
 from rq.registry import FailedJobRegistry, ScheduledJobRegistry, StartedJobRegistry
 import datetime
 
 
-@click.command('start-tasks')
-def start_tasks_command():
-    """
-    Create rq jobs from python files in tasks directory
-    """
-    # # start redis queue tasks for data logging and lss control loop
-    red = redis.Redis(host='localhost', port=6379)
-
-    # try to get lock to check if tasks already queued
-    if red.set("lock:tasks_started", "test", ex=10, nx=True):
-        db_path = current_app.instance_path + "/" + current_app.config['DATA_DB_NAME']
-        queue = rq.Queue(connection=red)
-        # tasks for update devices states in redis
-        queue.enqueue(update_device_data, current_app.config, db_path, 'RELAY_1_DICT')
-        queue.enqueue(update_device_data, current_app.config, db_path, 'RELAY_2_DICT')
-        queue.enqueue(update_device_data, current_app.config, db_path, 'RELAY_3_DICT')
-        queue.enqueue(update_device_data, current_app.config, db_path, 'RELAY_4_DICT')
-        queue.enqueue(update_device_data, current_app.config, db_path, 'SENSOR_DHT22_1_DICT')
-        queue.enqueue(update_device_data, current_app.config, db_path, 'SENSOR_DS18B20_1_DICT')
-
-        # create task for ventilation
-        # schedule task to every N minutes ventilation
-        next_run_time = calculate_next_loop_time(current_app.config["EXPERIMENT"]["ventilation"]["measure_cycle_time"])
-        print(next_run_time)
-        queue.enqueue_at(next_run_time, ventilation_loop,current_app.config)
-
-        # # create redis queue workers for that work
-        # workers = []
-        # # creating one scheduled worker (must be created before regular workers somehow)
-        # worker = rq.Worker(queues=['default'], connection=red)
-        # workers.append(worker)
-        # worker.work(with_scheduler=True)
-        #
-        # for i in range(8):
-        #     wi = rq.Worker(['default'], connection=red)
-        #     workers.append(wi)
-        #     wi.work()
-
-
 @click.command('start-worker')
 def start_worker():
     """
     Manually start one regular worker and block this process
     """
-    red = redis.Redis(host='localhost', port=6379)
+    red = redis_pool.get_redis(decode_responses=False)
     queue = rq.Queue('default', connection=red)
     workers = rq.Worker.count(connection=red)
     print(f"We have already {workers} workers in {queue.name} queue")
-    wi = rq.Worker(['default'], connection=red)
+    # jobs run in this process, not in forked work horse, so config snapshot, registry, http sessions
+    # and redis pool live between jobs
+    wi = rq.SimpleWorker(['default'], connection=red)
     wi.work()
 
 
@@ -66,11 +30,11 @@ def start_scheduler():
     """
     Manually tart one scheduler and block this process
     """
-    red = redis.Redis(host='localhost', port=6379)
+    red = redis_pool.get_redis(decode_responses=False)
     queue = rq.Queue('default', connection=red)
     workers = rq.Worker.count(connection=red)
     print(f"We have already {workers} workers in {queue.name} queue")
-    wi = rq.Worker(['default'], connection=red)
+    wi = rq.SimpleWorker(['default'], connection=red)   # see start_worker
     wi.work(with_scheduler=True)
 
 
@@ -79,7 +43,7 @@ def clear_queue():
     """
     Clear redis queue from all rq jobs
     """
-    red = redis.Redis(host='localhost', port=6379)
+    red = redis_pool.get_redis(decode_responses=False)
     queue = rq.Queue('default', connection=red)
     # Empty the queue
     queue.empty()
@@ -100,7 +64,7 @@ def kill_all_workers():
     """
     Manually kill all worker processes
     """
-    red = redis.Redis(host='localhost', port=6379)
+    red = redis_pool.get_redis(decode_responses=False)
     queue = rq.Queue('default', connection=red)
     workers = rq.Worker.all(queue=queue)
 
@@ -112,8 +76,11 @@ def kill_all_workers():
 
 
 def init_tasks(app):
-    app.cli.add_command(start_tasks_command)
+    app.cli.add_command(start_periodic_command)
     app.cli.add_command(start_worker)
     app.cli.add_command(start_scheduler)
     app.cli.add_command(kill_all_workers)
-    app.cli.add_command(clear_queue)
\ No newline at end of file
+    app.cli.add_command(clear_queue)
+    app.cli.add_command(start_poller_command)
+    app.cli.add_command(start_writer_command)
+    app.cli.add_command(start_sba5_command)
\ No newline at end of file
@@ -0,0 +1,246 @@
+import re
+import time
+import click
+from flask import current_app
+from . import db
+
+"""
+Time-series schema of sqlite data db.
+All samples of all devices are stored in one narrow table, clustered by (series_id, ts),
+so windowed queries of one series and joins of several series are index range scans.
+Series catalogue maps (device_id, field) from config to series_id.
+Raw samples are aggregated to rollup tiers (min/max/sum/count per bucket) and old raw samples
+are removed by retention policy, charts read the tier that fits requested number of points.
+"""
+
+# rollup tiers - bucket sizes in seconds, every tier is built from previous one
+ROLLUP_TIERS = (60, 900, 3600)
+# tier of raw samples in rollup_state and in result of query_series
+RAW_TIER = 0
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS series (
+    series_id INTEGER PRIMARY KEY,
+    device_id INTEGER NOT NULL,
+    field TEXT NOT NULL,
+    UNIQUE (device_id, field)
+);
+CREATE TABLE IF NOT EXISTS samples (
+    series_id INTEGER NOT NULL REFERENCES series (series_id),
+    ts INTEGER NOT NULL,   -- unix time in milliseconds
+    value REAL NOT NULL,
+    PRIMARY KEY (series_id, ts)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rollup_state (
+    tier INTEGER PRIMARY KEY,   -- bucket size in seconds, RAW_TIER - raw samples
+    done_until INTEGER NOT NULL   -- all buckets before it (unix time ms) are final, raw samples before it are deleted
+);
+"""
+
+ROLLUP_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS rollup_{tier} (
+    series_id INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,   -- start of bucket, unix time in milliseconds
+    min REAL NOT NULL,
+    max REAL NOT NULL,
+    sum REAL NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (series_id, bucket)
+) WITHOUT ROWID;
+"""
+
+# old per-device tables, created by init-db before narrow schema - device_<id>_<field>
+OLD_TABLE_RE = re.compile(r"^device_(\d+)_(.+)$")
+
+
+def create_schema(conn):
+    conn.executescript(SCHEMA_SQL)
+    for tier in ROLLUP_TIERS:
+        conn.executescript(ROLLUP_TABLE_SQL.format(tier=tier))
+
+
+def get_series_id(conn, device_id, field, cache=None):
+    """
+    find series of device field in catalogue or register new one
+    :param cache: optional dict (device_id, field) -> series_id, to not ask sqlite every time
+    """
+    key = (int(device_id), field)
+    if cache is not None and key in cache:
+        return cache[key]
+    conn.execute("INSERT OR IGNORE INTO series (device_id, field) VALUES (?, ?)", key)
+    series_id = conn.execute("SELECT series_id FROM series WHERE device_id = ? AND field = ?", key).fetchone()[0]
+    if cache is not None:
+        cache[key] = series_id
+    return series_id
+
+
+def find_series_id(conn, device_id, field):
+    """ find series of device field in catalogue, without registration, returns None if there is no such series """
+    row = conn.execute("SELECT series_id FROM series WHERE device_id = ? AND field = ?",
+                       (int(device_id), field)).fetchone()
+    return row[0] if row else None
+
+
+def insert_samples(conn, samples, cache=None):
+    """
+    insert (device_id, field, ts, value) samples, ts - unix time in seconds
+    caller is responsible for transaction
+    """
+    rows = [(get_series_id(conn, device_id, field, cache), int(ts * 1000), value)
+            for device_id, field, ts, value in samples]
+    # same series and millisecond - later sample wins
+    conn.executemany("INSERT OR REPLACE INTO samples (series_id, ts, value) VALUES (?, ?, ?)", rows)
+
+
+def rollup(conn, now_ms, grace_ms=60000, raw_retention_ms=None):
+    """
+    incrementally aggregate raw samples to all rollup tiers and apply retention policy
+    only buckets ended more than grace_ms ago are built, so late samples from writer are not lost
+    every run re-builds buckets after done_until of each tier, it is safe to run it at any time
+    :param now_ms: current unix time in milliseconds
+    :param raw_retention_ms: raw samples older than that are deleted (only if already rolled up)
+    :return: dict tier -> new done_until
+    """
+    series_ids = [row[0] for row in conn.execute("SELECT series_id FROM series")]
+    done = {}
+    source = None   # raw samples for first tier, then previous tier
+    for tier in ROLLUP_TIERS:
+        bucket_ms = tier * 1000
+        row = conn.execute("SELECT done_until FROM rollup_state WHERE tier = ?", (tier,)).fetchone()
+        start = row[0] if row else 0
+        end = (now_ms - grace_ms) // bucket_ms * bucket_ms
+        if source is not None:
+            # can not go further than finished buckets of previous tier
+            end = min(end, done[source] // bucket_ms * bucket_ms)
+        if end > start:
+            with conn:
+                for series_id in series_ids:
+                    if source is None:
+                        conn.execute(
+                            f"""INSERT OR REPLACE INTO rollup_{tier} (series_id, bucket, min, max, sum, count)
+                                SELECT series_id, ts / {bucket_ms} * {bucket_ms} AS b,
+                                       MIN(value), MAX(value), SUM(value), COUNT(*)
+                                FROM samples WHERE series_id = ? AND ts >= ? AND ts < ?
+                                GROUP BY b""", (series_id, start, end))
+                    else:
+                        conn.execute(
+                            f"""INSERT OR REPLACE INTO rollup_{tier} (series_id, bucket, min, max, sum, count)
+                                SELECT series_id, bucket / {bucket_ms} * {bucket_ms} AS b,
+                                       MIN(min), MAX(max), SUM(sum), SUM(count)
+                                FROM rollup_{source} WHERE series_id = ? AND bucket >= ? AND bucket < ?
+                                GROUP BY b""", (series_id, start, end))
+                conn.execute("INSERT OR REPLACE INTO rollup_state (tier, done_until) VALUES (?, ?)", (tier, end))
+        done[tier] = max(start, end)
+        source = tier
+
+    if raw_retention_ms is not None:
+        # never delete raw samples, that are not rolled up yet
+        cutoff = min(now_ms - raw_retention_ms, done[ROLLUP_TIERS[0]])
+        with conn:
+            for series_id in series_ids:
+                conn.execute("DELETE FROM samples WHERE series_id = ? AND ts < ?", (series_id, cutoff))
+            conn.execute("""INSERT INTO rollup_state (tier, done_until) VALUES (?, ?)
+                            ON CONFLICT (tier) DO UPDATE SET done_until = MAX(done_until, excluded.done_until)""",
+                         (RAW_TIER, cutoff))
+    return done
+
+
+def _raw_cutoff(conn):
+    """ raw samples before it are deleted by retention policy """
+    row = conn.execute("SELECT done_until FROM rollup_state WHERE tier = ?", (RAW_TIER,)).fetchone()
+    return row[0] if row else 0
+
+
+def query_series(conn, series_id, start_ms, end_ms, max_points):
+    """
+    read series in range [start_ms, end_ms) with not more than about max_points points
+    raw samples are returned if they are still stored for the whole range and fit in budget,
+    else the finest rollup tier that fits in budget (or the coarsest one, if none fits).
+    Tail of range that is not rolled up yet is aggregated from raw samples on the fly.
+    :return: (tier in seconds or RAW_TIER for raw samples, list of (ts_ms, min, max, mean, count))
+    """
+    # series can start after start_ms, so its first sample does not tell if range is complete
+    if start_ms >= _raw_cutoff(conn):
+        count = conn.execute("SELECT COUNT(*) FROM samples WHERE series_id = ? AND ts >= ? AND ts < ?",
+                             (series_id, start_ms, end_ms)).fetchone()[0]
+        if count <= max_points:
+            rows = conn.execute("SELECT ts, value, value, value, 1 FROM samples "
+                                "WHERE series_id = ? AND ts >= ? AND ts < ? ORDER BY ts",
+                                (series_id, start_ms, end_ms)).fetchall()
+            return RAW_TIER, rows
+
+    tier = ROLLUP_TIERS[-1]
+    for candidate in ROLLUP_TIERS:
+        if (end_ms - start_ms) / (candidate * 1000) <= max_points:
+            tier = candidate
+            break
+    bucket_ms = tier * 1000
+    row = conn.execute("SELECT done_until FROM rollup_state WHERE tier = ?", (tier,)).fetchone()
+    done_until = row[0] if row else 0
+    start_bucket = start_ms // bucket_ms * bucket_ms
+    rows = conn.execute(f"""SELECT bucket, min, max, sum / count, count FROM rollup_{tier}
+                            WHERE series_id = ? AND bucket >= ? AND bucket < ? ORDER BY bucket""",
+                        (series_id, start_bucket, min(end_ms, done_until))).fetchall()
+    if end_ms > done_until:
+        rows += conn.execute(f"""SELECT ts / {bucket_ms} * {bucket_ms} AS b,
+                                        MIN(value), MAX(value), AVG(value), COUNT(*)
+                                 FROM samples WHERE series_id = ? AND ts >= ? AND ts < ?
+                                 GROUP BY b ORDER BY b""",
+                             (series_id, max(start_bucket, done_until), end_ms)).fetchall()
+    return tier, rows
+
+
+def migrate_old_tables(conn, drop=False):
+    """
+    copy data from old per-device tables device_<id>_<field> to narrow samples table
+    old tables stored python datetime.now(), so it is local time text
+    :return: dict table name -> number of copied rows
+    """
+    create_schema(conn)
+    tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+    copied = {}
+    for table in tables:
+        match = OLD_TABLE_RE.match(table)
+        if match is None:
+            continue
+        with conn:
+            series_id = get_series_id(conn, match.group(1), match.group(2))
+            cursor = conn.execute(
+                f"""INSERT OR REPLACE INTO samples (series_id, ts, value)
+                    SELECT ?, CAST(ROUND((julianday(datetime, 'utc') - 2440587.5) * 86400000) AS INTEGER), value
+                    FROM {table} WHERE datetime IS NOT NULL""", (series_id,))
+            copied[table] = cursor.rowcount
+            if drop:
+                conn.execute(f"DROP TABLE {table}")
+    return copied
+
+
+@click.command('migrate-data-db')
+@click.option('--drop', is_flag=True, help="Drop old per-device tables after copy")
+def migrate_data_db_command(drop):
+    """Copy samples from old device_<id>_<field> tables to narrow samples table."""
+    data_db_path = current_app.instance_path + "/" + current_app.config['DATA_DB_NAME']
+    conn = db.connect_data_db(data_db_path)
+    copied = migrate_old_tables(conn, drop=drop)
+    for table, rows in copied.items():
+        click.echo(f"{table}: {rows} rows")
+    click.echo(f"Migrated {len(copied)} tables.")
+    conn.close()
+
+
+@click.command('rollup-data')
+def rollup_data_command():
+    """Build rollup tiers from raw samples and remove old raw samples now."""
+    data_db_path = current_app.instance_path + "/" + current_app.config['DATA_DB_NAME']
+    conn = db.connect_data_db(data_db_path)
+    create_schema(conn)
+    done = rollup(conn, int(time.time() * 1000),
+                  grace_ms=current_app.config.get("ROLLUP_GRACE", 60) * 1000,
+                  raw_retention_ms=current_app.config.get("RAW_RETENTION_DAYS", 30) * 86400000)
+    click.echo(f"Rollup tiers are done until: {done}")
+    conn.close()
+
+
+def init_app(app):
+    app.cli.add_command(migrate_data_db_command)
+    app.cli.add_command(rollup_data_command)
@@ -0,0 +1,70 @@
+import numpy as np
+
+"""
+Decimation of time series for charts, so browser gets only as many points as it can draw.
+Both methods keep first and last points and return indices of selected points in time order.
+"""
+
+
+def _bucket_edges(n, n_buckets):
+    """ edges of n_buckets nearly equal buckets over points 1 .. n - 2 (first and last points are kept apart) """
+    return np.linspace(1, n - 1, n_buckets + 1).astype(np.int64)
+
+
+def lttb(t, v, n_out):
+    """
+    Largest-Triangle-Three-Buckets - keeps visual shape of the series
+    https://skemman.is/handle/1946/15343
+    selection of point depends on previous selected point, so loop is over buckets,
+    but all points inside bucket are processed by numpy at once
+    :param t: timestamps, sorted
+    :param v: values
+    :param n_out: number of points to keep, at least 3
+    :return: indices of selected points
+    """
+    n = len(t)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    t = np.asarray(t, dtype=np.float64)
+    v = np.asarray(v, dtype=np.float64)
+    edges = _bucket_edges(n, n_out - 2)
+    # average point of every bucket, for the last bucket it is the last point
+    sums_t = np.add.reduceat(t[1:n - 1], edges[:-1] - 1)
+    sums_v = np.add.reduceat(v[1:n - 1], edges[:-1] - 1)
+    sizes = np.diff(edges)
+    avg_t = np.append(sums_t / sizes, t[-1])
+    avg_v = np.append(sums_v / sizes, v[-1])
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # doubled area of triangles (a, point, average of next bucket) for all points of bucket
+        area = np.abs((t[a] - avg_t[i + 1]) * (v[lo:hi] - v[a]) - (t[a] - t[lo:hi]) * (avg_v[i + 1] - v[a]))
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def minmax(v, n_out):
+    """
+    min/max buckets - keeps all peaks of the series, fully vectorized
+    every bucket gives its min and max points, so about n_out points are returned
+    :param v: values
+    :param n_out: number of points to keep, at least 4
+    :return: indices of selected points
+    """
+    n = len(v)
+    if n_out >= n or n_out < 4:
+        return np.arange(n)
+    v = np.asarray(v, dtype=np.float64)
+    edges = _bucket_edges(n, (n_out - 2) // 2)
+    bucket = np.searchsorted(edges, np.arange(1, n - 1), side="right") - 1
+    # sort points of inner part by (bucket, value), first one of bucket is min, last one is max
+    order = np.lexsort((v[1:n - 1], bucket)) + 1
+    first = edges[:-1] - 1
+    last = edges[1:] - 2
+    inner = np.concatenate([order[first], order[last]])
+    return np.unique(np.concatenate([[0], inner, [n - 1]]))
@@ -29,8 +29,37 @@ print(app_dir)
 # Bind gunicorn to the IP address of wg0 interface on port 8000
 bind = f"{ip_address}:8000"
 
+# Serving profile, set CLAY_GUNICORN_PROFILE in environment (systemd unit) to change it
+#   sync - 4 sync workers, each request and each open SSE stream takes a whole worker process
+#   gevent - few processes with many greenlets, hundreds of dashboard and stream clients fit on raspberry pi
+#   gthread - sync workers with thread pool, if gevent can not be installed
+profile = os.environ.get("CLAY_GUNICORN_PROFILE", "sync")
+profiles = {
+    "sync": {"worker_class": "sync", "workers": 4, "threads": 1, "timeout": 30},
+    "gevent": {"worker_class": "gevent", "workers": 2, "threads": 1, "timeout": 30},
+    "gthread": {"worker_class": "gthread", "workers": 2, "threads": 16, "timeout": 30},
+}
+if profile not in profiles:
+    raise ValueError(f"Unknown gunicorn profile {profile}, use one of {', '.join(profiles)}")
+
+
+def env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+worker_class = profiles[profile]["worker_class"]
 # Specify the number of workers
-workers = 4
+workers = env_int("CLAY_GUNICORN_WORKERS", profiles[profile]["workers"])
+# threads of gthread worker
+threads = env_int("CLAY_GUNICORN_THREADS", profiles[profile]["threads"])
+# max simultaneous clients of one gevent worker, open SSE streams are counted too
+worker_connections = env_int("CLAY_GUNICORN_CONNECTIONS", 1000)
+# seconds to keep idle http connection open, ajax polling reuses it
+keepalive = env_int("CLAY_GUNICORN_KEEPALIVE", 5)
+# silent sync worker is restarted after it, for gevent worker it is only heartbeat of process
+timeout = env_int("CLAY_GUNICORN_TIMEOUT", profiles[profile]["timeout"])
+# on restart workers finish requests in this time, open SSE streams are closed after it
+graceful_timeout = env_int("CLAY_GUNICORN_GRACEFUL_TIMEOUT", 10)
 
 # Set the working directory to the directory of your Flask application
 chdir = app_dir
@@ -0,0 +1,36 @@
+import fakeredis
+import pytest
+from flaskr import create_app, db, redis_pool
+
+CONFIG = """
+DEVICES = [
+    {"params": {"device_id": 7, "type": "relay", "family": "esp32_relay", "host": "relay.local", "name": "relay7"},
+     "commands": {"set_relay": None}, "data": {"ch0": 0, "ch1": 0}},
+    {"params": {"device_id": 8, "type": "sensor", "family": "esphome_dht22", "esphome_name": "dht", "name": "DHT"},
+     "commands": {}, "data": {"temperature": 0}},
+]
+REDIS_HOST = "localhost"
+REDIS_PORT = 6379
+DATA_DB_NAME = "data.sqlite"
+RQ_DASHBOARD_REDIS_URL = "redis://127.0.0.1:6379"
+"""
+
+
+@pytest.fixture
+def web_app(tmp_path, monkeypatch):
+    """Фикстура: приложение из create_app с конфигом во временной папке и общим fakeredis вместо redis"""
+    (tmp_path / "instance").mkdir()
+    (tmp_path / "instance" / "config.py").write_text(CONFIG)
+    monkeypatch.chdir(tmp_path)
+    server = fakeredis.FakeServer()
+    clients = {True: fakeredis.FakeRedis(server=server, decode_responses=True),
+               False: fakeredis.FakeRedis(server=server)}
+    monkeypatch.setattr(redis_pool, "get_redis", lambda config=None, decode_responses=True: clients[decode_responses])
+    app = create_app()
+    app.config["DEVICE_STATES_CACHE_TTL"] = 60
+    db._snapshot_cache.update({"expires": 0.0, "snapshot": None})
+    with app.app_context():
+        db.init_db()
+    db._snapshot_cache.update({"expires": 0.0, "snapshot": None})
+    app.red = clients[True]
+    return app
@@ -0,0 +1,133 @@
+import asyncio
+import pytest
+from aiohttp import web
+from flaskr.drivers.esp32_relay_driver import AsyncESP32RelayDriver
+from flaskr.drivers.pwm_lamp_driver import AsyncPWMLampDriver
+from flaskr.drivers.esphome_driver import AsyncESPHomeDeviceDriver
+from flaskr.drivers.transport import new_async_transport
+
+
+def run_with_server(routes, scenario):
+    """Запуск сценария против локального тестового HTTP-сервера, scenario получает host сервера"""
+    async def main():
+        app = web.Application()
+        app.add_routes(routes)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        try:
+            return await scenario(f"127.0.0.1:{port}")
+        finally:
+            await runner.cleanup()
+    return asyncio.run(main())
+
+
+def test_async_relay_get_info_and_sensor():
+    """Тест получения информации и значений датчиков асинхронным драйвером реле через кэш /info"""
+    calls = []
+
+    async def info(request):
+        calls.append(request.path)
+        await asyncio.sleep(0.05)
+        return web.json_response({"ch0": 1, "ext_temp": -255, "int_temp": 21.5})
+
+    async def scenario(host):
+        async with AsyncESP32RelayDriver(host, info_max_age=10) as relay:
+            return await asyncio.gather(relay.get_info(), relay.get_sensor_value("ext_temp"),
+                                        relay.get_sensor_value("int_temp"))
+
+    info_data, ext_temp, int_temp = run_with_server([web.get("/info", info)], scenario)
+    assert info_data == {"ch0": 1, "ext_temp": -255, "int_temp": 21.5}
+    assert ext_temp is None
+    assert int_temp == 21.5
+    assert calls == ["/info"]
+
+
+def test_async_relay_set_state():
+    """Тест установки состояния реле асинхронным драйвером"""
+    received = []
+
+    async def relay_handler(request):
+        received.append(await request.json())
+        return web.Response(text="RESULT: SUCCESS\n Relay: 1, set to state: 1")
+
+    async def scenario(host):
+        async with AsyncESP32RelayDriver(host) as relay:
+            with pytest.raises(ValueError, match="State must be either 0 or 1."):
+                await relay.set_relay_state(1, 9)
+            return await relay.set_relay_state(1, True)
+
+    success, message = run_with_server([web.post("/relay", relay_handler)], scenario)
+    assert success is True
+    assert "SUCCESS" in message
+    assert received == [{"channel": 1, "state": 1}]
+
+
+def test_async_pwm_set_pwm_many_devices():
+    """Тест одновременной работы нескольких асинхронных драйверов ламп с общим транспортом"""
+    async def pwm(request):
+        data = await request.json()
+        return web.Response(text=f"RESULT: SUCCESS channel {data['channel']}")
+
+    async def scenario(host):
+        transport = new_async_transport()
+        lamps = [AsyncPWMLampDriver(host, name=f"lamp{i}", transport=transport) for i in range(4)]
+        try:
+            return await asyncio.gather(*(lamp.set_pwm(i, 50) for i, lamp in enumerate(lamps)))
+        finally:
+            await transport.close()
+
+    results = run_with_server([web.post("/pwm", pwm)], scenario)
+    assert [success for success, _ in results] == [True] * 4
+
+
+def test_async_set_relays():
+    """Тест одновременной установки нескольких реле асинхронным драйвером"""
+    async def relay_handler(request):
+        data = await request.json()
+        return web.Response(text=f"RESULT: SUCCESS\n Relay: {data['channel']}, set to state: {data['state']}")
+
+    async def scenario(host):
+        async with AsyncESP32RelayDriver(host) as relay:
+            return await relay.set_relays({0: 1, 1: False, 2: True})
+
+    results, latency = run_with_server([web.post("/relay", relay_handler)], scenario)
+    assert sorted(results) == [0, 1, 2]
+    assert all(success for success, _ in results.values())
+    assert "set to state: 0" in results[1][1]
+    assert latency >= 0
+
+
+def test_async_network_error():
+    """Тест ошибки соединения у асинхронного драйвера"""
+    async def scenario():
+        transport = new_async_transport(connect_timeout=0.5, retries=0)
+        async with AsyncPWMLampDriver("127.0.0.1:1", transport=transport) as lamp:
+            result = await lamp.set_pwm(0, 10)
+        await transport.close()
+        return result
+
+    success, message = asyncio.run(scenario())
+    assert success is False
+    assert "Ошибка запроса" in message
+
+
+def test_async_esphome_get():
+    """Тест чтения сенсора ESPHome асинхронным драйвером с авторизацией"""
+    async def sensor(request):
+        if request.headers.get("Authorization") is None:
+            return web.Response(status=401)
+        return web.json_response({"id": "sensor-k3_temp", "value": 23.4, "state": "23.4 °C"})
+
+    async def scenario(host):
+        driver = AsyncESPHomeDeviceDriver(host, "sensor", "k3_temp", "admin", "secret")
+        try:
+            return await driver.get()
+        finally:
+            await driver.close()
+
+    status, data = run_with_server([web.get("/sensor/k3_temp", sensor)], scenario)
+    assert status == 200
+    assert data["value"] == 23.4
@@ -0,0 +1,95 @@
+import asyncio
+import fakeredis
+from aiohttp import web
+from flaskr import registry
+from flaskr.tasks.async_poller import AsyncPoller
+from test_async_drivers import run_with_server
+
+
+def make_poller(tmp_path, host, devices):
+    # empty data db without init-db, writer creates schema itself
+    db_path = str(tmp_path / "data.sqlite")
+    config = {"DEVICES": devices, "ESP_IP_ADDR": host, "ESP_AUTH_LOGIN": "admin", "ESP_AUTH_PASS": "secret",
+              "REDIS_HOST": "localhost", "REDIS_PORT": 6379, "POLL_FLUSH_INTERVAL": 0.05, "WRITER_MAX_DELAY": 0.05}
+    registry.init_registry(config, db_path)
+    poller = AsyncPoller(config, db_path)
+    poller.red = poller.writer.red = fakeredis.FakeRedis(decode_responses=True)
+    return poller
+
+
+def run_poller(tmp_path, routes, devices):
+    """ опрос устройств с локальным сервером 0.5 с, устройства с host получают host сервера """
+    async def scenario(host):
+        for device in devices:
+            if "host" in device["params"]:
+                device["params"]["host"] = host
+        poller = make_poller(tmp_path, host, devices)
+        try:
+            await asyncio.wait_for(poller.run(), timeout=0.5)
+        except asyncio.TimeoutError:
+            pass
+        poller.writer.stop()
+        return poller
+    return run_with_server(routes, scenario)
+
+
+def count_samples(poller):
+    """ число записанных в sqlite сэмплов по устройствам """
+    assert poller.writer.stats["errors"] == 0
+    return dict(poller.writer.conn.execute("SELECT device_id, COUNT(*) FROM samples JOIN series USING (series_id) "
+                                           "GROUP BY device_id").fetchall())
+
+
+def test_bad_reading_does_not_stop_polling(tmp_path):
+    """Тест опроса: неверное значение одного устройства даёт ошибку устройства, остальные опрашиваются и пишутся"""
+    calls = []
+
+    async def sensor(request):
+        calls.append(request.match_info["name"])
+        if request.match_info["name"] == "broken":
+            return web.json_response({"value": "not a number"})
+        return web.json_response({"value": 20.0 + len(calls)})
+
+    devices = [
+        {"params": {"device_id": 1, "family": "esphome_ds18b20", "esphome_name": "good", "poll_interval": 0.05},
+         "data": {"temperature": 0}},
+        {"params": {"device_id": 2, "family": "esphome_ds18b20", "esphome_name": "broken", "poll_interval": 0.05},
+         "data": {"temperature": 0}},
+    ]
+    poller = run_poller(tmp_path, [web.get("/sensor/{name}", sensor)], devices)
+    red = poller.red
+    assert calls.count("good") > 4
+    assert red.hget("device_1:params", "status") == "ok"
+    assert float(red.hget("device_1:data", "temperature")) > 21
+    assert red.hget("device_2:params", "status") == "error"
+    assert "not a number" in red.hget("device_2:params", "last_error")
+    # сэмплы хорошего устройства дошли до sqlite, у сломанного их нет
+    counts = count_samples(poller)
+    assert counts[1] > 1 and 2 not in counts
+
+
+def test_bad_info_does_not_stop_polling(tmp_path):
+    """Тест опроса: неверное значение в /info одного устройства даёт ошибку устройства, остальные опрашиваются"""
+    calls = []
+
+    async def info(request):
+        calls.append(request.path)
+        # оба устройства на одном хосте, у второго в данных ключ bad
+        return web.json_response({"ch0": len(calls), "bad": "not a number"})
+
+    devices = [
+        {"params": {"device_id": 1, "family": "esp32_relay", "host": None, "name": "good", "poll_interval": 0.05},
+         "data": {"ch0": 0}},
+        {"params": {"device_id": 2, "family": "pwm_lamp", "host": None, "name": "broken", "poll_interval": 0.05},
+         "data": {"bad": 0}},
+    ]
+
+    poller = run_poller(tmp_path, [web.get("/info", info)], devices)
+    red = poller.red
+    assert len(calls) > 4
+    assert red.hget("device_1:params", "status") == "ok"
+    assert int(red.hget("device_1:data", "ch0")) > 1
+    assert red.hget("device_2:params", "status") == "error"
+    assert "not a number" in red.hget("device_2:params", "last_error")
+    counts = count_samples(poller)
+    assert counts[1] > 1 and 2 not in counts
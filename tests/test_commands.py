@@ -0,0 +1,130 @@
+import json
+import fakeredis
+import pytest
+import rq
+from flask import Flask
+from flaskr import config_snapshot, hardware, lanes, redis_pool, registry
+from flaskr.tasks import commands
+
+CONFIG = {
+    "DEVICES": [
+        {"params": {"device_id": 7, "family": "esp32_relay", "host": "relay.local", "name": "relay7"},
+         "commands": {"set_relay": None}, "data": {"ch0": 0, "ch1": 0}},
+    ],
+    "REDIS_HOST": "localhost",
+    "REDIS_PORT": 6379,
+    "QUEUE": "default",
+    "COMMAND_WAIT_TIMEOUT": 0,
+}
+
+
+@pytest.fixture
+def app(monkeypatch):
+    """Фикстура: приложение с реестром устройств и общим fakeredis вместо redis"""
+    server = fakeredis.FakeServer()
+    red = fakeredis.FakeRedis(server=server, decode_responses=True)
+    rq_red = fakeredis.FakeRedis(server=server)
+    monkeypatch.setattr(redis_pool, "get_redis",
+                        lambda config=None, decode_responses=True: red if decode_responses else rq_red)
+    config_snapshot.init_snapshot(CONFIG, "/tmp/data.sqlite")
+    registry.use_config(config_snapshot.local_version())
+    red.hset("device_7:commands", "set_relay", "")
+
+    app = Flask(__name__)
+    app.config.update(CONFIG)
+    with app.app_context():
+        yield red, rq_red
+
+
+def test_command_rejected(app):
+    """Тест проверки команды до постановки в очередь"""
+    assert hardware.handle_command(7, "reset", None)[1] == 400   # нет в commands устройства
+    assert hardware.handle_command(7, "set_relay", "one")[1] == 400
+    assert hardware.handle_command(99, "set_relay", "0 1")[1] == 404
+
+
+def test_command_wrong_wait(app):
+    """Тест нечислового wait: ошибка 400, команда не ставится в очередь"""
+    red, rq_red = app
+    for wait in ("abc", [1], {}):
+        result, status = hardware.handle_command(7, "set_relay", "1 1", wait)
+        assert status == 400 and "wait" in result["error"]
+    assert lanes.get_queue(rq_red, "relay.local", high=True).job_ids == []
+    assert red.hget("device_7:data", "ch1") is None
+
+
+def test_command_arg_out_of_range(app):
+    """Тест аргумента вне диапазона драйвера: ошибка 400 до очереди и оптимистичной записи"""
+    red, rq_red = app
+    for arg in ("1 2", "1 -1", "1.5 1"):
+        assert hardware.handle_command(7, "set_relay", arg)[1] == 400
+    assert lanes.get_queue(rq_red, "relay.local", high=True).job_ids == []
+    assert red.hget("device_7:data", "ch1") is None
+
+    parse = commands.COMMANDS["pwm_lamp"]["set_pwm"]["parse"]
+    assert parse("3:100") == (3, 100)
+    for arg in ("4 50", "0 101", "0 -1"):
+        with pytest.raises(ValueError):
+            parse(arg)
+
+
+def test_command_queued_and_run(app, requests_mock):
+    """Тест отправки команды: оптимистичное обновление сразу, выполнение в высокоприоритетной очереди линии"""
+    red, rq_red = app
+    result, status = hardware.handle_command(7, "set_relay", "1 1")
+    assert status == 202 and result["status"] == "queued"
+    assert red.hget("device_7:data", "ch1") == "1"
+    assert lanes.get_queue(rq_red, "relay.local", high=True).job_ids == [result["job_id"]]
+    assert hardware.command_status(result["job_id"])["status"] == "queued"
+
+    requests_mock.post("http://relay.local/relay", text="SUCCESS")
+    rq.SimpleWorker(lanes.lane_queue_names("relay.local"), connection=rq_red).work(burst=True)
+    assert requests_mock.last_request.json() == {"channel": 1, "state": 1}
+    assert red.hget("device_7:params", "last_command").startswith("set_relay 1 1")
+    status = hardware.command_status(result["job_id"])
+    assert (status["status"], status["message"], status["device_id"]) == ("ok", "SUCCESS", "7")
+    assert hardware.command_status("unknown") is None
+
+
+def test_command_reply(app, requests_mock):
+    """Тест ответа задания команды ожидающему веб-серверу"""
+    red, rq_red = app
+    requests_mock.post("http://relay.local/relay", text="ERROR invalid params!")
+    result = commands.run_command(config_snapshot.local_version(), 7, "set_relay", "0 1", "r1", reply=True)
+    assert result["ok"] is False
+    assert json.loads(red.lpop(commands.REPLY_KEY.format(id="r1"))) == result
+    assert red.hget("device_7:params", "last_error").startswith("set_relay: ERROR invalid params!")
+
+
+def test_handle_request_wrong_wait(web_app):
+    """Тест /handle-request с нечисловым wait: 400 вместо 500"""
+    web_app.red.hset("device_7:commands", "set_relay", "")
+    response = web_app.test_client().post("/handle-request",
+                                          json={"device_id": 7, "command": "set_relay", "arg": "1 1", "wait": "soon"})
+    assert response.status_code == 400 and response.get_json()["status"] == "error"
+
+
+def test_command_id_from_page(app):
+    """Тест id команды от страницы: он становится id задания, неверный или повторный id отклоняется"""
+    red, rq_red = app
+    result, status = hardware.handle_command(7, "set_relay", "1 1", command_id="a1b2c3d4e5f6a7b8")
+    assert status == 202 and result["job_id"] == "a1b2c3d4e5f6a7b8"
+    assert lanes.get_queue(rq_red, "relay.local", high=True).job_ids == ["a1b2c3d4e5f6a7b8"]
+    assert hardware.handle_command(7, "set_relay", "1 1", command_id="a1b2c3d4e5f6a7b8")[1] == 409
+    assert hardware.handle_command(7, "set_relay", "1 1", command_id="../../x")[1] == 400
+    assert hardware.handle_command(7, "set_relay", "1 1", command_id=12345678)[1] == 400
+    assert len(lanes.get_queue(rq_red, "relay.local", high=True).job_ids) == 1
+
+
+def test_command_status_route(web_app):
+    """Тест /command-status/<id>: статус команды, отправленной со своим id, 404 для неизвестной"""
+    web_app.red.hset("device_7:commands", "set_relay", "")
+    client = web_app.test_client()
+    assert client.get("/command-status/0123456789abcdef").status_code == 404
+    response = client.post("/handle-request", json={"device_id": 7, "command": "set_relay", "arg": "0 1",
+                                                     "command_id": "0123456789abcdef"})
+    assert response.status_code == 202
+    response = client.get("/command-status/0123456789abcdef")
+    assert response.status_code == 200
+    status = response.get_json()
+    assert (status["id"], status["status"], status["command"]) == ("0123456789abcdef", "queued", "set_relay")
@@ -0,0 +1,74 @@
+import json
+import fakeredis
+from flaskr import config_snapshot, redis_pool
+
+CONFIG = {
+    "DEVICES": [{"params": {"device_id": 1, "family": "esphome_switch"}, "data": {"state": "OFF"}}],
+    "REDIS_HOST": "localhost",
+    "REDIS_PORT": 6379,
+    "QUEUE": "default",
+    "ESP_AUTH_PASS": "secret",
+    "SECRET_KEY": "dev",
+    "RQ_DASHBOARD_REDIS_URL": "redis://127.0.0.1:6379",
+}
+
+
+def test_snapshot_whitelist_and_version():
+    """Тест снимка конфига: только нужные задачам ключи, версия зависит от содержимого"""
+    snapshot = config_snapshot.make_snapshot(CONFIG, "/tmp/data.sqlite")
+    assert "SECRET_KEY" not in snapshot and "RQ_DASHBOARD_REDIS_URL" not in snapshot
+    assert "ESP_AUTH_PASS" not in snapshot
+    assert snapshot["DATA_DB_PATH"] == "/tmp/data.sqlite"
+
+    version = config_snapshot.snapshot_version(snapshot)
+    assert version == config_snapshot.snapshot_version(json.loads(json.dumps(snapshot)))
+    changed = dict(CONFIG, QUEUE="other")
+    assert config_snapshot.snapshot_version(config_snapshot.make_snapshot(changed, "/tmp/data.sqlite")) != version
+
+
+def test_version_ignores_runtime_state():
+    """Тест версии: время активности, статус и начальные значения данных устройства не меняют версию"""
+    version = config_snapshot.snapshot_version(config_snapshot.make_snapshot(CONFIG, "/tmp/data.sqlite"))
+    device = {"params": {"device_id": 1, "family": "esphome_switch", "last_time_active": "18/10/2026, 10:00:00",
+                         "status": "ok"}, "data": {"state": "ON"}}
+    restarted = dict(CONFIG, DEVICES=[device], ESP_AUTH_PASS="other")
+    assert config_snapshot.snapshot_version(config_snapshot.make_snapshot(restarted, "/tmp/data.sqlite")) == version
+
+
+def test_publish_and_get_config(monkeypatch):
+    """Тест публикации снимка: без паролей в redis, пароли процесса добавляются при чтении, старая версия истекает"""
+    red = fakeredis.FakeRedis(decode_responses=True)
+    old_version = config_snapshot.init_snapshot(dict(CONFIG, QUEUE="old"), "/tmp/data.sqlite")
+    config_snapshot.publish(red)
+    version = config_snapshot.init_snapshot(CONFIG, "/tmp/data.sqlite")
+    assert config_snapshot.publish(red) == version
+    assert red.get(config_snapshot.CURRENT_VERSION_KEY) == version
+    stored = json.loads(red.get(config_snapshot.CONFIG_KEY.format(version=version)))
+    assert "ESP_AUTH_PASS" not in stored
+    assert stored["DEVICES"] == [{"params": {"device_id": 1, "family": "esphome_switch"}, "data": {"state": None}}]
+    assert red.ttl(config_snapshot.CONFIG_KEY.format(version=version)) == -1
+    assert 0 < red.ttl(config_snapshot.CONFIG_KEY.format(version=old_version)) <= config_snapshot.SUPERSEDED_TTL
+    assert config_snapshot.get_config(version)["QUEUE"] == "default"
+
+    # другой процесс загружает снимок из redis и добавляет свои пароли
+    config_snapshot._cache.pop(old_version)
+    monkeypatch.setattr(redis_pool, "get_redis", lambda config=None, decode_responses=True: red)
+    loaded = config_snapshot.get_config(old_version)
+    assert loaded["QUEUE"] == "old" and loaded["ESP_AUTH_PASS"] == "secret"
+
+
+def test_ensure_published_keeps_current():
+    """Тест публикации веб-сервером: текущая версия не меняется, удаленный снимок публикуется снова"""
+    red = fakeredis.FakeRedis(decode_responses=True)
+    current = config_snapshot.init_snapshot(CONFIG, "/tmp/data.sqlite")
+    config_snapshot.publish(red)
+    web_version = config_snapshot.init_snapshot(CONFIG, "/other/cwd/data.sqlite")
+    assert config_snapshot.ensure_published(red) == web_version != current
+    assert red.get(config_snapshot.CURRENT_VERSION_KEY) == current
+    assert red.ttl(config_snapshot.CONFIG_KEY.format(version=current)) == -1
+    assert 0 < red.ttl(config_snapshot.CONFIG_KEY.format(version=web_version)) <= config_snapshot.SUPERSEDED_TTL
+
+    red.delete(config_snapshot.CONFIG_KEY.format(version=web_version))
+    config_snapshot.ensure_published(red)
+    stored = json.loads(red.get(config_snapshot.CONFIG_KEY.format(version=web_version)))
+    assert stored["DATA_DB_PATH"] == "/other/cwd/data.sqlite" and "ESP_AUTH_PASS" not in stored
@@ -0,0 +1,166 @@
+import json
+import threading
+import fakeredis
+from flask import Flask
+from flaskr import db, redis_pool
+
+
+def make_app():
+    app = Flask(__name__)
+    app.config.update({"REDIS_HOST": "localhost", "REDIS_PORT": 6379, "REDIS_MAX_CONNECTIONS": 7})
+    return app
+
+
+def test_requests_share_process_pool():
+    """Тест общего пула соединений: у каждого запроса свой клиент, но пул один на процесс"""
+    redis_pool._pools.clear()
+    app = make_app()
+    clients = []
+
+    def request():
+        with app.app_context():
+            clients.append((db.get_db(), db.get_rq_db()))
+
+    threads = [threading.Thread(target=request) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len({id(red) for red, _ in clients}) == 3
+    assert len({id(red.connection_pool) for red, _ in clients}) == 1
+    assert len({id(rq_red.connection_pool) for _, rq_red in clients}) == 1
+    pool = clients[0][0].connection_pool
+    assert pool is not clients[0][1].connection_pool
+    assert pool.max_connections == 7
+    assert pool.connection_kwargs["decode_responses"] is True
+
+
+DEVICES = [
+    {"params": {"device_id": 1, "name": "lamp"}, "data": {"ch0": 0, "ch1": None}, "commands": {}},
+    {"params": {"device_id": 2, "name": "relay"}, "data": {"state": "OFF"}, "commands": {"set_on": None}},
+]
+
+
+def test_replace_device_state():
+    """Тест перезаписи состояния: старые ключи удалены, новые загружены одной транзакцией, версия растёт"""
+    red = fakeredis.FakeRedis(decode_responses=True)
+    red.set(db.VERSION_KEY, 41)
+    red.hset("device_1:data", mapping={"ch0": 5, "old": 1})
+    red.hset("device_9:params", "name", "removed device")
+    pubsub = red.pubsub()
+    pubsub.subscribe(db.UPDATES_CHANNEL)
+    pubsub.get_message()
+
+    version, deleted = red.transaction(lambda pipe: db.replace_device_state(pipe, DEVICES, batch=1),
+                                       db.VERSION_KEY, value_from_callable=True)
+    assert (version, deleted) == (42, 2)
+    assert red.get(db.VERSION_KEY) == "42"
+    assert red.hgetall("device_1:data") == {"ch0": "0", "ch1": ""}
+    assert not red.exists("device_9:params") and not red.exists("device_1:commands")
+    assert red.hgetall("device_2:commands") == {"set_on": ""}
+    assert red.hgetall("device_2:rev") == {"params:device_id": "42", "params:name": "42", "data:state": "42",
+                                          "commands:set_on": "42"}
+    assert red.get("device_1:version") == "42"
+    assert pubsub.get_message(timeout=1)["data"] == db.RESET_MESSAGE
+
+
+def test_replace_device_state_retry():
+    """Тест повтора транзакции, если кто-то записал состояние устройства во время перезаписи"""
+    red = fakeredis.FakeRedis(decode_responses=True)
+    calls = []
+
+    def replace(pipe):
+        calls.append(1)
+        if len(calls) == 1:
+            db.write_device_state(red, 2, "data", {"state": "ON"})
+        return db.replace_device_state(pipe, DEVICES)
+
+    version, _ = red.transaction(replace, db.VERSION_KEY, value_from_callable=True)
+    assert len(calls) == 2
+    assert version == 2
+    assert red.hgetall("device_2:data") == {"state": "OFF"}
+
+
+def test_write_device_state_changed_fields():
+    """Тест записи состояния: версию и ревизии получают только изменённые поля"""
+    red = fakeredis.FakeRedis(decode_responses=True)
+    pubsub = red.pubsub()
+    pubsub.subscribe(db.UPDATES_CHANNEL)
+    pubsub.get_message()
+    assert db.write_device_state(red, 1, "data", {"ch0": 1, "ch1": 2}) == 1
+    assert db.write_device_state(red, 1, "data", {"ch0": 1, "ch1": 3}) == 2
+    assert red.hgetall("device_1:data") == {"ch0": "1", "ch1": "3"}
+    assert red.hgetall("device_1:rev") == {"data:ch0": "1", "data:ch1": "2"}
+    assert red.get("device_1:version") == "2"
+    assert red.get(db.VERSION_KEY) == "2"
+    pubsub.get_message(timeout=1)
+    message = json.loads(pubsub.get_message(timeout=1)["data"])
+    assert message == {"version": 2, "device_id": "1", "section": "data", "fields": {"ch1": "3"}}
+
+
+def test_write_device_state_no_changes():
+    """Тест записи без изменений: возвращает 0, версия не растёт и ничего не публикуется"""
+    red = fakeredis.FakeRedis(decode_responses=True)
+    db.write_device_state(red, 1, "data", {"ch0": 1, "ch1": None})
+    pubsub = red.pubsub()
+    pubsub.subscribe(db.UPDATES_CHANNEL)
+    pubsub.get_message()
+    assert db.write_device_state(red, 1, "data", {"ch0": "1", "ch1": ""}) == 0
+    assert red.get(db.VERSION_KEY) == "1"
+    assert pubsub.get_message(timeout=0.1) is None
+
+
+def test_read_device_snapshot():
+    """Тест снимка состояния: версии, ревизии и секции всех устройств за один конвейер"""
+    red = fakeredis.FakeRedis(decode_responses=True)
+    red.transaction(lambda pipe: db.replace_device_state(pipe, DEVICES), db.VERSION_KEY)
+    db.write_device_state(red, 2, "data", {"state": "ON"})
+    snapshot = db.read_device_snapshot(red, DEVICES)
+    assert snapshot["version"] == 2
+    assert snapshot["versions"] == {"1": 1, "2": 2}
+    assert snapshot["revisions"]["2"]["data:state"] == 2 and snapshot["revisions"]["1"]["data:ch0"] == 1
+    assert snapshot["devices"][0] == {"params": {"device_id": "1", "name": "lamp"},
+                                      "data": {"ch0": "0", "ch1": ""}, "commands": {}}
+    assert snapshot["devices"][1]["data"] == {"state": "ON"}
+
+
+def test_device_updates_not_modified(web_app):
+    """Тест /get-device-updates: без изменений ответ 304 по since и по ETag"""
+    client = web_app.test_client()
+    response = client.get("/get-device-updates")
+    assert response.status_code == 200 and len(response.json) == 2
+    version = response.headers["ETag"].strip('"')
+    assert client.get(f"/get-device-updates?since={version}").status_code == 304
+    assert client.get("/get-device-updates", headers={"If-None-Match": f'"{version}"'}).status_code == 304
+
+
+def test_device_updates_partial_delta(web_app):
+    """Тест частичной дельты: только изменённые поля изменённых устройств"""
+    client = web_app.test_client()
+    version = client.get("/get-device-updates?since=0").json["version"]
+    db.write_device_state(web_app.red, 7, "data", {"ch0": 1, "ch1": 0})
+    db._snapshot_cache["expires"] = 0.0
+    delta = client.get(f"/get-device-updates?since={version}").json
+    assert delta == {"version": version + 1, "full": False,
+                     "devices": [{"data": {"ch0": "1"}, "params": {"device_id": "7"}}]}
+
+
+def test_device_updates_lagging_cache(web_app):
+    """Тест отставшего кэша воркера: клиент с более новой версией не получает старое полное состояние"""
+    client = web_app.test_client()
+    version = client.get("/get-device-updates?since=0").json["version"]
+    # другой воркер уже отдал клиенту новую версию, а кэш этого воркера ещё старый
+    db.write_device_state(web_app.red, 8, "data", {"temperature": 21})
+    assert client.get(f"/get-device-updates?since={version + 1}").status_code == 304
+    assert db._snapshot_cache["snapshot"]["version"] == version + 1
+
+
+def test_device_updates_reset(web_app):
+    """Тест сброса: если версия клиента больше версии в redis (redis очищен), приходит полное состояние"""
+    client = web_app.test_client()
+    version = client.get("/get-device-updates?since=0").json["version"]
+    web_app.red.flushall()
+    db._snapshot_cache["expires"] = 0.0
+    delta = client.get(f"/get-device-updates?since={version}").json
+    assert delta["full"] is True and delta["version"] == 0
+    assert len(delta["devices"]) == 2
@@ -0,0 +1,39 @@
+import numpy as np
+from flaskr.utils import decimation
+
+
+def test_lttb_keeps_edges_and_count():
+    """Тест LTTB: сохраняются первая и последняя точки, количество точек по бюджету"""
+    t = np.arange(10000, dtype=np.float64)
+    v = np.sin(t / 300)
+    selected = decimation.lttb(t, v, 100)
+    assert len(selected) == 100
+    assert selected[0] == 0 and selected[-1] == 9999
+    assert np.all(np.diff(selected) > 0)
+
+
+def test_lttb_keeps_peak():
+    """Тест LTTB: одиночный выброс не теряется"""
+    t = np.arange(1000, dtype=np.float64)
+    v = np.zeros(1000)
+    v[537] = 100.0
+    selected = decimation.lttb(t, v, 20)
+    assert 537 in selected
+
+
+def test_lttb_small_input():
+    """Тест LTTB: если точек меньше бюджета, возвращаются все"""
+    assert list(decimation.lttb([1, 2, 3], [1, 2, 3], 10)) == [0, 1, 2]
+
+
+def test_minmax_keeps_extremes():
+    """Тест min/max: сохраняются минимум и максимум каждой корзины"""
+    rng = np.random.default_rng(1)
+    v = rng.normal(size=5000)
+    v[1234] = 50.0
+    v[4321] = -50.0
+    selected = decimation.minmax(v, 50)
+    assert len(selected) <= 50
+    assert 1234 in selected and 4321 in selected
+    assert selected[0] == 0 and selected[-1] == 4999
+    assert np.all(np.diff(selected) > 0)
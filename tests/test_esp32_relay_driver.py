@@ -1,3 +1,5 @@
+import threading
+import time
 import pytest
 import requests
 from unittest.mock import Mock
@@ -132,4 +134,61 @@ def test_set_relay_state_invalid_channel_and_state(relay, mock_requests):
 
     # Проверка с недопустимым значением состояния
     with pytest.raises(ValueError, match="State must be either 0 or 1."):
-        relay.set_relay_state(1, 9)  # state как 9 
\ No newline at end of file
+        relay.set_relay_state(1, 9)  # state как 9 
+
+def test_set_relays(relay, mock_requests):
+    """Тест установки состояния нескольких реле одновременно"""
+    mock_requests.post("http://test.local/relay", text="RESULT: SUCCESS")
+    results, latency = relay.set_relays({0: True, 1: 0, 3: 1})
+
+    assert results == {0: (True, "RESULT: SUCCESS"), 1: (True, "RESULT: SUCCESS"), 3: (True, "RESULT: SUCCESS")}
+    assert latency >= 0
+    sent = sorted((request.json()["channel"], request.json()["state"]) for request in mock_requests.request_history)
+    assert sent == [(0, 1), (1, 0), (3, 1)]
+
+    # неверное состояние любого канала - ни один запрос не отправляется
+    with pytest.raises(ValueError, match="State must be either 0 or 1."):
+        relay.set_relays({0: 1, 1: 5})
+    assert mock_requests.call_count == 3
+
+
+def test_sensor_values_from_cached_info(mock_requests):
+    """Тест чтения датчиков из кэшированного ответа /info"""
+    relay = ESP32RelayDriver(host="cached.local", info_max_age=60)
+    mock_requests.get("http://cached.local/info", json={"ch0": 0, "ext_temp": 25.5, "int_hum": -255})
+    assert relay.get_sensor_value("ext_temp") == 25.5
+    assert relay.get_sensor_value("int_hum") is None
+    assert ESP32RelayDriver(host="cached.local", info_max_age=60).get_info()["ch0"] == 0
+    assert mock_requests.call_count == 1
+
+    # после команды состояние реле меняется, поэтому кэш сбрасывается
+    mock_requests.post("http://cached.local/relay", text="RESULT: SUCCESS")
+    relay.set_relay_state(0, 1)
+    relay.get_info()
+    assert mock_requests.call_count == 3
+
+
+def test_sensor_wrong_value_in_info(relay, mock_requests):
+    """Тест нечислового значения датчика в /info: None вместо исключения"""
+    mock_requests.get("http://test.local/info", json={"ext_temp": "error", "int_temp": None, "ext_hum": 40})
+    assert relay.get_sensor_value("ext_temp") is None
+    assert relay.get_sensor_value("int_temp") is None
+    assert relay.get_sensor_value("ext_hum") == 40.0
+
+
+def test_get_info_single_flight(mock_requests):
+    """Тест объединения одновременных запросов /info в один"""
+    def slow_info(request, context):
+        time.sleep(0.1)
+        return {"ext_temp": 20.0}
+
+    mock_requests.get("http://flight.local/info", json=slow_info)
+    relay = ESP32RelayDriver(host="flight.local")
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(relay.get_info())) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [{"ext_temp": 20.0}] * 5
+    assert mock_requests.call_count == 1
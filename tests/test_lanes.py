@@ -0,0 +1,61 @@
+import fakeredis
+import rq
+from flaskr import lanes, systemd_handle
+
+done = []
+
+
+def remember(name):
+    done.append(name)
+
+
+def test_high_queue_first():
+    """Тест линии: команды пользователя выполняются раньше накопившегося опроса"""
+    red = fakeredis.FakeRedis()
+    for i in range(3):
+        lanes.get_queue(red, "relay.local").enqueue(remember, f"poll{i}")
+    lanes.get_queue(red, "relay.local", high=True).enqueue(remember, "command")
+    # задания другой линии этот воркер не берет
+    lanes.get_queue(red, "10.10.0.7").enqueue(remember, "other")
+
+    worker = rq.SimpleWorker(lanes.lane_queue_names("relay.local"), connection=red)
+    worker.work(burst=True)
+    assert done == ["command", "poll0", "poll1", "poll2"]
+    assert lanes.lane_queue_names("relay.local") == ["lane:relay.local:high", "lane:relay.local"]
+
+
+def test_lane_worker_is_simple_worker(web_app, monkeypatch):
+    """Тест воркера линии: задания выполняются в процессе воркера (SimpleWorker), без fork на задание"""
+    started = []
+
+    class RecordingWorker:
+        def __init__(self, queues, connection=None):
+            started.append(queues)
+
+        def work(self):
+            started.append("work")
+
+    def forking_worker(*args, **kwargs):
+        raise AssertionError("lane worker must not fork per job")
+
+    monkeypatch.setattr(lanes.rq, "SimpleWorker", RecordingWorker)
+    monkeypatch.setattr(lanes.rq, "Worker", forking_worker)
+    with web_app.app_context():
+        result = web_app.test_cli_runner().invoke(args=["start-lane-worker", "relay.local"])
+    assert result.exit_code == 0, result.output
+    assert started == [["lane:relay.local:high", "lane:relay.local"], "work"]
+
+
+def test_start_workers_starts_lanes_by_default(web_app, monkeypatch):
+    """Тест start-workers: воркеры линий запускаются и без SYSTEMD_LANE_NAME в конфиге"""
+    calls = []
+    monkeypatch.setattr(systemd_handle.subprocess, "run", lambda args, **kwargs: calls.append(args))
+    web_app.config.update(RQ_NUM_WORKERS=1, SYSTEMD_WORKER_NAME="clay_golem_worker@",
+                          SYSTEMD_SCHEDULER_NAME="clay_golem_scheduler")
+    web_app.config.pop("SYSTEMD_LANE_NAME", None)
+    with web_app.app_context():
+        result = web_app.test_cli_runner().invoke(args=["start-workers"])
+    assert result.exit_code == 0, result.output
+    started = [args[-1] for args in calls]
+    assert "clay_golem_worker@1" in started and "clay_golem_scheduler" in started
+    assert "clay_golem_lane@relay.local" in started
@@ -0,0 +1,54 @@
+import threading
+import time
+import fakeredis
+from flaskr.locks import DeviceLock, device_lock
+
+
+def test_only_owner_releases():
+    """Тест владения по токену: чужой экземпляр не может снять блокировку"""
+    red = fakeredis.FakeRedis()
+    owner = device_lock(red, 1, ttl=5)
+    other = device_lock(red, 1, ttl=5)
+    assert owner.acquire(timeout=0.1)
+    assert not other.acquire(timeout=0.1)
+    assert other.release() is False
+    assert red.get("lock:device1") == owner.token.encode()
+    assert owner.release() is True
+    assert red.get("lock:device1") is None
+
+
+def test_lease_renewal():
+    """Тест продления аренды, пока блокировка удерживается"""
+    red = fakeredis.FakeRedis()
+    with DeviceLock(red, "device2", ttl=0.3) as lock:
+        time.sleep(0.6)
+        assert red.get("lock:device2") == lock.token.encode()
+        assert not lock.lost.is_set()
+    assert red.get("lock:device2") is None
+
+
+def test_fifo_waiters():
+    """Тест очереди ожидающих: блокировка достается в порядке прихода, без опроса"""
+    red = fakeredis.FakeRedis()
+    order = []
+    holder = device_lock(red, 3, wait_refresh=5)
+    holder.acquire()
+
+    def worker(i):
+        with device_lock(red, 3, wait_refresh=5):
+            order.append(i)
+
+    threads = []
+    for i in range(3):
+        threads.append(threading.Thread(target=worker, args=(i,)))
+        threads[-1].start()
+        # ждем, пока поток займет место в очереди
+        while red.zcard("lock:device3:queue") < i + 1:
+            time.sleep(0.01)
+    started = time.monotonic()
+    holder.release()
+    for thread in threads:
+        thread.join()
+    assert order == [0, 1, 2]
+    # ожидающие просыпаются по уведомлению, а не по таймауту опроса
+    assert time.monotonic() - started < 2
@@ -0,0 +1,87 @@
+import json
+import queue
+import time
+import fakeredis
+import redis
+from flaskr import db, push
+from flaskr.tasks import commands
+
+
+class FlakyRedis:
+    """ redis, первая подписка которого падает с таймаутом """
+    def __init__(self, red):
+        self.red = red
+        self.calls = 0
+
+    def pubsub(self, **kwargs):
+        self.calls += 1
+        if self.calls == 1:
+            raise redis.TimeoutError("Timeout reading from socket")
+        return self.red.pubsub(**kwargs)
+
+
+def wait_message(q, timeout=2.0):
+    return q.get(timeout=timeout)
+
+
+def test_overflow_resends_snapshot():
+    """Тест переполнения очереди медленного клиента: очередь очищается, клиент получает None"""
+    broadcaster = push.DeviceUpdatesBroadcaster(FlakyRedis(None), {}, queue_size=2, retry_delay=60)
+    q = broadcaster.subscribe()
+    for i in range(3):
+        broadcaster._send(("update", str(i)))
+    assert q.get_nowait() is None
+    assert q.empty()
+    broadcaster._send(("update", "3"))
+    assert q.get_nowait() == ("update", "3")
+    broadcaster.unsubscribe(q)
+    broadcaster._send(("update", "4"))
+    assert q.empty()
+
+
+def test_subscription_survives_redis_errors():
+    """Тест переподписки: после ошибки redis поток жив, клиенты получают None и новые сообщения"""
+    red = fakeredis.FakeRedis(decode_responses=True)
+    flaky = FlakyRedis(red)
+    broadcaster = push.DeviceUpdatesBroadcaster(flaky, push.CHANNEL_EVENTS, retry_delay=0.05)
+    q = broadcaster.subscribe()
+    assert wait_message(q) is None
+    deadline = time.monotonic() + 2
+    while not red.pubsub_numsub(db.UPDATES_CHANNEL)[0][1] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert broadcaster.thread.is_alive()
+    db.write_device_state(red, 1, "data", {"ch0": 1})
+    event, data = wait_message(q)
+    assert event == "update" and json.loads(data)["fields"] == {"ch0": "1"}
+    red.publish(db.UPDATES_CHANNEL, db.RESET_MESSAGE)
+    assert wait_message(q) is None
+    try:
+        q.get(timeout=0.1)
+        assert False, "unexpected message"
+    except queue.Empty:
+        pass
+
+
+def test_push_enabled(monkeypatch):
+    """Тест выбора server push: по умолчанию только с профилем gevent, SERVER_PUSH переопределяет"""
+    monkeypatch.delenv("CLAY_GUNICORN_PROFILE", raising=False)
+    assert not push.push_enabled({})
+    monkeypatch.setenv("CLAY_GUNICORN_PROFILE", "gevent")
+    assert push.push_enabled({})
+    assert not push.push_enabled({"SERVER_PUSH": False})
+    monkeypatch.setenv("CLAY_GUNICORN_PROFILE", "sync")
+    assert push.push_enabled({"SERVER_PUSH": True})
+
+
+def test_command_status_pushed():
+    """Тест push статуса команды: изменение статуса приходит событием "command" с id команды"""
+    red = fakeredis.FakeRedis(decode_responses=True)
+    broadcaster = push.DeviceUpdatesBroadcaster(red, push.CHANNEL_EVENTS, retry_delay=60)
+    q = broadcaster.subscribe()
+    deadline = time.monotonic() + 2
+    while not red.pubsub_numsub(commands.COMMANDS_CHANNEL)[0][1] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    commands.set_command_status(red, "c1", {"status": "ok", "command": "set_relay", "message": "SUCCESS"})
+    event, data = wait_message(q)
+    assert event == "command"
+    assert json.loads(data) == {"id": "c1", "status": "ok", "command": "set_relay", "message": "SUCCESS"}
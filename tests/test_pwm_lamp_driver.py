@@ -121,4 +121,29 @@ def test_set_pwm_invalid_duty(pwm_driver):
         pwm_driver.set_pwm(0, "invalid_duty")  # duty как строка
 
     with pytest.raises(ValueError, match="Duty must be between 0 and 100."):
-        pwm_driver.set_pwm(0, 150)  # duty вне диапазона 
\ No newline at end of file
+        pwm_driver.set_pwm(0, 150)  # duty вне диапазона 
+
+def test_set_pwm_many(requests_mock):
+    """Тест установки ШИМ сразу для нескольких каналов"""
+    def pwm_response(request, context):
+        data = request.json()
+        if data["channel"] == 2:
+            return "RESULT: ERROR invalid params!"
+        return f"RESULT: SUCCESS channel {data['channel']}"
+
+    requests_mock.post("http://test.local/pwm", text=pwm_response)
+    driver = PWMLampDriver(host="test.local")
+    results, latency = driver.set_pwm_many({0: 10, 1: 20, 2: 30})
+
+    assert set(results) == {0, 1, 2}
+    assert results[0][0] is True and results[1][0] is True
+    assert results[2] == (False, "RESULT: ERROR invalid params!")
+    assert latency >= 0
+    assert requests_mock.call_count == 3
+
+def test_set_pwm_many_invalid_params(requests_mock, pwm_driver):
+    """Тест проверки всех каналов до отправки запросов"""
+    requests_mock.post("http://test.local/pwm", text="RESULT: SUCCESS")
+    with pytest.raises(ValueError, match="Duty must be between 0 and 100."):
+        pwm_driver.set_pwm_many({0: 10, 1: 150})
+    assert requests_mock.call_count == 0
@@ -0,0 +1,26 @@
+import redis
+from flaskr import redis_pool
+
+
+def test_pool_from_config():
+    """Тест пула из конфига: база, проверка соединений и размер пула берутся из настроек"""
+    config = {"REDIS_HOST": "redis.local", "REDIS_PORT": 6380, "REDIS_DB": 2, "REDIS_HEALTH_CHECK_INTERVAL": 10}
+    pool = redis_pool.get_pool(config)
+    assert isinstance(pool, redis.BlockingConnectionPool)
+    assert pool.connection_kwargs["host"] == "redis.local" and pool.connection_kwargs["port"] == 6380
+    assert pool.connection_kwargs["db"] == 2
+    assert pool.connection_kwargs["health_check_interval"] == 10
+    assert pool.max_connections == redis_pool.SETTINGS["REDIS_MAX_CONNECTIONS"]
+    # тот же конфиг - тот же пул, клиенты разные
+    assert redis_pool.get_pool(dict(config)) is pool
+    assert redis_pool.get_redis(config) is not redis_pool.get_redis(config)
+    assert redis_pool.get_redis(config).connection_pool is pool
+    assert redis_pool.get_pool(config, decode_responses=False) is not pool
+
+
+def test_unix_socket_pool():
+    """Тест пула через unix сокет: хост и порт не используются"""
+    pool = redis_pool.get_pool({"REDIS_HOST": "localhost", "REDIS_UNIX_SOCKET": "/run/redis/redis.sock"})
+    assert pool.connection_class is redis.UnixDomainSocketConnection
+    assert pool.connection_kwargs["path"] == "/run/redis/redis.sock"
+    assert "host" not in pool.connection_kwargs
@@ -0,0 +1,85 @@
+import pytest
+from flaskr import registry
+from flaskr.drivers.esphome_driver import ESPHomeDeviceDriver
+from flaskr.drivers.esp32_relay_driver import ESP32RelayDriver
+from flaskr.tasks.data_logger_cycle import read_device
+
+CONFIG = {
+    "DEVICES": [
+        {"params": {"device_id": 5, "family": "esphome_dht22", "esphome_name": "kolos-3_dht_internal_"},
+         "data": {"humidity": 0, "temperature": 0}},
+        {"params": {"device_id": 7, "family": "esp32_relay", "host": "relay.local", "name": "relay7",
+                    "poll_interval": 5},
+         "data": {"ch0": 0, "ext_temp": 0}},
+        {"params": {"device_id": 9, "family": "sba5", "serial_port": "/dev/null"}, "data": {"co2": 0}},
+        {"params": {"device_id": 11, "family": "unknown"}, "data": {}},
+    ],
+    "POLL_INTERVAL": 2,
+    "ESP_IP_ADDR": "10.10.0.7",
+    "ESP_AUTH_LOGIN": "admin",
+    "ESP_AUTH_PASS": "pass",
+}
+
+
+@pytest.fixture
+def devices():
+    """Фикстура с реестром устройств из тестового конфига"""
+    registry.init_registry(CONFIG, "/tmp/data.sqlite")
+    yield registry
+
+
+def test_registry_polling_specs(devices):
+    """Тест построения реестра: опрашиваются только устройства известных семейств"""
+    assert sorted(entry["id"] for entry in devices.get_devices(poll="any")) == [5, 7]
+    assert [entry["id"] for entry in devices.get_devices(poll="esphome")] == [5]
+    assert devices.get_device("7")["poll_interval"] == 5
+    assert devices.get_device(5)["poll_interval"] == 2
+    assert devices.get_device(11)["spec"]["poll"] is None
+
+
+def test_make_drivers(devices):
+    """Тест создания драйверов по семейству устройства"""
+    channels = devices.make_drivers(devices.get_device(5))
+    assert [(domain, key) for domain, key, _ in channels] == [("sensor", "humidity"), ("sensor", "temperature")]
+    assert isinstance(channels[0][2], ESPHomeDeviceDriver)
+    assert channels[0][2].url == "http://10.10.0.7/sensor/kolos-3_dht_internal_hum"
+    relay = devices.make_drivers(devices.get_device(7))
+    assert isinstance(relay, ESP32RelayDriver)
+    assert relay.base_url == "http://relay.local"
+
+
+def test_read_info_device(devices, requests_mock):
+    """Тест опроса устройства через /info: берутся только ключи данных устройства"""
+    requests_mock.get("http://relay.local/info", json={"ch0": 1, "ext_temp": 21.5, "uptime": 100})
+    entry = devices.get_device(7)
+    readings, errors = read_device(entry, devices.make_drivers(entry))
+    assert readings == [("ch0", 1, 1.0), ("ext_temp", 21.5, 21.5)]
+    assert errors == []
+
+
+def test_read_info_skips_sensor_error_value(devices, requests_mock):
+    """Тест опроса через /info: значение ошибки датчика (-255) не записывается как измерение"""
+    requests_mock.get("http://relay.local/info", json={"ch0": 0, "ext_temp": -255})
+    entry = devices.get_device(7)
+    readings, errors = read_device(entry, devices.make_drivers(entry))
+    assert readings == [("ch0", 0, 0.0)]
+    assert errors == []
+
+
+def test_read_esphome_bad_payload(devices, requests_mock):
+    """Тест опроса esphome: неверный ответ одного канала - ошибка, остальные каналы читаются"""
+    requests_mock.get("http://10.10.0.7/sensor/kolos-3_dht_internal_hum", json={"id": "sensor-hum"})
+    requests_mock.get("http://10.10.0.7/sensor/kolos-3_dht_internal_temp",
+                      json={"id": "sensor-temp", "value": 26.3, "state": "26.3 °C"})
+    entry = devices.get_device(5)
+    readings, errors = read_device(entry, devices.make_drivers(entry))
+    assert readings == [("temperature", 26.3, 26.3)]
+    assert len(errors) == 1
+
+
+def test_device_lanes(devices):
+    """Тест линий команд: устройства одного контроллера попадают в одну линию"""
+    assert devices.get_device(5)["lane"] == "10.10.0.7"
+    assert devices.get_device(7)["lane"] == "relay.local"
+    assert devices.get_device(9)["lane"] is None
+    assert devices.get_lanes() == ["10.10.0.7", "relay.local"]
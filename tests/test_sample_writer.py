@@ -0,0 +1,100 @@
+import threading
+import time
+import fakeredis
+from flaskr.tasks import sample_writer
+from flaskr.tasks.sample_writer import (DEAD_LETTER_STREAM, SAMPLES_GROUP, SAMPLES_STREAM, SampleWriter,
+                                        publish_sample)
+
+
+def wait_for(condition, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition is not met in time"
+        time.sleep(0.01)
+
+
+def count_samples(writer):
+    return writer.conn.execute("SELECT COUNT(*) FROM samples").fetchone()[0]
+
+
+def make_writer(tmp_path, **kwargs):
+    return SampleWriter(str(tmp_path / "data.sqlite"), report_interval=3600, **kwargs)
+
+
+def run_stream_in_thread(writer, red):
+    thread = threading.Thread(target=writer.run_stream, args=(red,), daemon=True)
+    thread.start()
+    return thread
+
+
+def test_run_queue_group_commit(tmp_path):
+    """Тест записи из очереди процесса: пачки ограничены max_batch, каждая пачка - одна транзакция"""
+    writer = make_writer(tmp_path, max_batch=3, max_delay=0.2)
+    for i in range(7):
+        writer.submit(1, "temperature", 1000.0 + i, 20.0 + i)
+    writer.start()
+    wait_for(lambda: writer.stats["rows"] == 7)
+    writer.stop()
+    assert writer.stats["batches"] == 3
+    assert count_samples(writer) == 7
+
+
+def test_run_stream_acknowledges_written(tmp_path):
+    """Тест записи из redis stream: записанные сэмплы подтверждаются, в группе нет ожидающих"""
+    red = fakeredis.FakeRedis(decode_responses=True)
+    for i in range(5):
+        publish_sample(red, 1, "ch0", 1000.0 + i, i)
+    writer = make_writer(tmp_path, max_batch=2, max_delay=0.05)
+    thread = run_stream_in_thread(writer, red)
+    wait_for(lambda: writer.stats["rows"] == 5)
+    writer.stop()
+    thread.join(timeout=2)
+    assert not thread.is_alive()
+    assert red.xpending(SAMPLES_STREAM, SAMPLES_GROUP)["pending"] == 0
+    assert count_samples(writer) == 5
+
+
+def test_run_stream_pending_redelivery(tmp_path):
+    """Тест повторной доставки: сэмплы, прочитанные до падения писателя без подтверждения, записываются после рестарта"""
+    red = fakeredis.FakeRedis(decode_responses=True)
+    red.xgroup_create(SAMPLES_STREAM, SAMPLES_GROUP, id="0", mkstream=True)
+    for i in range(3):
+        publish_sample(red, 2, "ch1", 1000.0 + i, i)
+    # прочитаны упавшим писателем и не подтверждены
+    red.xreadgroup(SAMPLES_GROUP, "writer", {SAMPLES_STREAM: ">"}, count=10)
+    assert red.xpending(SAMPLES_STREAM, SAMPLES_GROUP)["pending"] == 3
+    publish_sample(red, 2, "ch1", 1003.0, 3)
+
+    writer = make_writer(tmp_path, max_delay=0.05)
+    thread = run_stream_in_thread(writer, red)
+    wait_for(lambda: writer.stats["rows"] == 4)
+    writer.stop()
+    thread.join(timeout=2)
+    assert red.xpending(SAMPLES_STREAM, SAMPLES_GROUP)["pending"] == 0
+    assert count_samples(writer) == 4
+
+
+def test_run_stream_rejects_malformed(tmp_path):
+    """Тест битой записи в stream: она подтверждается и переносится в dead letter, остальные записываются"""
+    red = fakeredis.FakeRedis(decode_responses=True)
+    publish_sample(red, 1, "ch0", 1000.0, 1)
+    red.xadd(SAMPLES_STREAM, {"device_id": 1, "key": "ch0", "ts": 1001.0, "value": "not a number"})
+    red.xadd(SAMPLES_STREAM, {"device_id": 1, "ts": 1002.0})
+    publish_sample(red, 1, "ch0", 1003.0, 3)
+
+    writer = make_writer(tmp_path, max_delay=0.05)
+    thread = run_stream_in_thread(writer, red)
+    wait_for(lambda: writer.stats["rows"] == 2 and writer.stats["rejected"] == 2)
+    writer.stop()
+    thread.join(timeout=2)
+    assert red.xpending(SAMPLES_STREAM, SAMPLES_GROUP)["pending"] == 0
+    dead = red.xrange(DEAD_LETTER_STREAM)
+    assert len(dead) == 2
+    assert dead[0][1]["field:value"] == "not a number" and "ValueError" in dead[0][1]["error"]
+    assert "KeyError" in dead[1][1]["error"]
+
+
+def test_parse_stream_sample():
+    """Тест разбора записи stream"""
+    fields = {"device_id": "1", "key": "ch0", "ts": "1000.5", "value": "2"}
+    assert sample_writer.parse_stream_sample(fields) == ("1", "ch0", 1000.5, 2.0)
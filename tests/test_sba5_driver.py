@@ -0,0 +1,107 @@
+import importlib.util
+import pathlib
+import queue
+import threading
+import pytest
+import flaskr
+from flaskr.drivers.sba5_driver import SBA5Session, parse_measurement
+
+
+class FakePort:
+    """Имитация последовательного порта SBA-5: отвечает на команды эхом и OK"""
+    def __init__(self, acknowledge=True):
+        self.incoming = queue.Queue()
+        self.written = []
+        self.acknowledge = acknowledge
+
+    def feed(self, data):
+        self.incoming.put(data)
+
+    def readline(self):
+        try:
+            return self.incoming.get(timeout=0.05)
+        except queue.Empty:
+            return b""
+
+    def write(self, data):
+        self.written.append(data)
+        command = data.decode().strip()
+        if self.acknowledge and len(command) > 1:
+            # эхо приходит двумя частями, как будто readline вернулся по таймауту
+            self.feed(command[:1].encode())
+            self.feed(command[1:].encode() + b"\r\n")
+            self.feed(b"M 50029 48765 410.25 39.8 10.4 21.3 1003 38.9 40.1\r\n")
+            self.feed(b"OK\r\n")
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_parse_measurement():
+    """Тест разбора строки измерения"""
+    record = parse_measurement("M 50029 48765 410.25 39.8 10.4 21.3 1003 38.9 40.1")
+    assert record["co2"] == 410.25
+    assert record["irga_temp"] == 39.8
+    assert record["humidity"] == 10.4
+    assert record["humidity_sensor_temp"] == 21.3
+    assert record["pressure"] == 1003
+    assert "ts" in record
+
+    assert parse_measurement("OK") is None
+    assert parse_measurement("Z,12 of 21") is None
+    assert parse_measurement("M 50029 48765 bad 39.8 10.4 21.3 1003") is None
+
+
+def test_send_command_acknowledged():
+    """Тест ожидания эха и OK без фиксированных пауз, измерения при этом не теряются"""
+    records = []
+    port = FakePort()
+    with SBA5Session(port=port, on_measurement=records.append) as sba:
+        ok, lines = sba.send_command("B5")
+    assert ok is True
+    assert lines == []
+    assert port.written == [b"B5\r"]
+    assert [record["co2"] for record in records] == [410.25]
+
+
+def test_send_command_timeout():
+    """Тест команды без подтверждения от прибора"""
+    port = FakePort(acknowledge=False)
+    with SBA5Session(port=port) as sba:
+        port.feed(b"ERROR\r\n")
+        ok, lines = sba.send_command("A10", timeout=0.3)
+    assert ok is False
+
+
+def test_wrapper_returns_device_lines():
+    """Тест обертки: возвращаются строки прибора, а при отсутствии подтверждения - None"""
+    # flaskr/hardware - папка скриптов, не пакет (его имя занято модулем flaskr/hardware.py)
+    path = pathlib.Path(flaskr.__file__).parent / "hardware" / "hardware_sba5.py"
+    spec = importlib.util.spec_from_file_location("hardware_sba5", path)
+    hardware_sba5 = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(hardware_sba5)
+    port = FakePort()
+    sba = hardware_sba5.SBAWrapper(timeout=0.3)
+    sba.session = SBA5Session(port=port).start()
+    try:
+        port.feed(b"Zero in 5 sec\r\n")
+        assert sba.send_command("Z,1\r\n") == "Zero in 5 sec"
+        port.acknowledge = False
+        assert sba.send_command("A10\r\n") is None
+    finally:
+        sba.session.close()
+
+
+def test_read_measurement():
+    """Тест ожидания следующего измерения"""
+    port = FakePort()
+    with SBA5Session(port=port) as sba:
+        assert sba.send_command("M") == (True, [])
+        # измерение приходит уже во время ожидания
+        threading.Timer(0.1, port.feed, args=(b"M 50029 48765 412.00 39.8 10.4 21.3 1003 38.9 40.1\r\n",)).start()
+        record = sba.read_measurement(timeout=2)
+    assert port.written == [b"M"]
+    assert record["co2"] == pytest.approx(412.0)
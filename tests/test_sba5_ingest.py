@@ -0,0 +1,52 @@
+import fakeredis
+from flaskr.tasks.sba5_ingest import SBA5_DATA_KEYS, SBA5Ingest, sba5_stream_key
+
+
+class FakeSession:
+    on_measurement = None
+
+
+def frame(co2):
+    return {"co2": co2, "irga_temp": 39.8, "humidity": 10.4, "humidity_sensor_temp": 21.3,
+            "pressure": 1003.0, "ts": 1700000000.0 + co2}
+
+
+def test_buffer_drops_oldest_frames():
+    """Тест ограниченного буфера: при медленной записи теряются самые старые кадры, а чтение не блокируется"""
+    session = FakeSession()
+    ingest = SBA5Ingest(12, session, red=None, writer=None, buffer_size=3)
+    assert session.on_measurement == ingest.on_measurement
+
+    for co2 in range(5):
+        session.on_measurement(frame(co2))
+    assert ingest.dropped == 2
+    assert [f["co2"] for f in ingest.take_frames()] == [2, 3, 4]
+    assert ingest.take_frames() == []
+
+
+class RecordingWriter:
+    def __init__(self):
+        self.samples = []
+
+    def submit(self, device_id, data_key, ts, value):
+        self.samples.append((device_id, data_key, ts, value))
+
+
+def test_flush_writes_redis_stream_and_writer():
+    """Тест сброса буфера: кадры попадают в данные устройства, в redis stream и в очередь записи sqlite"""
+    red = fakeredis.FakeRedis(decode_responses=True)
+    writer = RecordingWriter()
+    ingest = SBA5Ingest(12, FakeSession(), red=red, writer=writer, buffer_size=3)
+    for co2 in range(5):
+        ingest.on_measurement(frame(co2))
+
+    assert ingest.flush() == 3
+    assert ingest.flush() == 0
+    stream = red.xrange(sba5_stream_key(12))
+    assert [float(fields["co2"]) for _, fields in stream] == [2, 3, 4]
+    assert not sba5_stream_key(12).startswith("device_")
+    assert red.hget("device_12:data", "co2") == "4"
+    assert red.hget("device_12:params", "dropped_frames") == "2"
+    assert red.hget("device_12:params", "status") == "ok"
+    assert len(writer.samples) == 3 * len(SBA5_DATA_KEYS)
+    assert (12, "co2", frame(4)["ts"], 4) in writer.samples
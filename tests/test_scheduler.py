@@ -0,0 +1,101 @@
+from flaskr.tasks import scheduler
+from flaskr.tasks.scheduler import PeriodicScheduler, due_runs, make_task, next_slot_after
+
+
+def job_func():
+    pass
+
+
+class FakeJob:
+    def __init__(self, job_id, status="queued"):
+        self.id = job_id
+        self.status = status
+
+    def get_status(self, refresh=True):
+        return self.status
+
+
+class FakeQueue:
+    def __init__(self):
+        self.jobs = []
+
+    def enqueue(self, func, *args, **kwargs):
+        job = FakeJob(f"job{len(self.jobs)}")
+        self.jobs.append((job, args))
+        return job
+
+
+class FakeRedis:
+    """Только то, что нужно планировщику: конвейер с hset и hincrby"""
+    def __init__(self):
+        self.hashes = {}
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def hset(self, key, mapping):
+        self.hashes.setdefault(key, {}).update(mapping)
+
+    def hincrby(self, key, field, amount):
+        self.hashes.setdefault(key, {})[field] = self.hashes.get(key, {}).get(field, 0) + amount
+
+    def execute(self):
+        pass
+
+
+def test_due_runs_fixed_rate():
+    """Тест слотов с фиксированным шагом: запуск не сдвигает расписание"""
+    task = make_task("poll", job_func, (), interval=10)
+    assert next_slot_after(task, 1005.0) == 1010.0
+    assert next_slot_after(task, 1010.0) == 1020.0
+    assert due_runs(task, 1010.0, 1009.9) == ([], 1010.0)
+    # запуск с опозданием на 3 секунды, следующий слот все равно 1020
+    assert due_runs(task, 1010.0, 1013.0) == ([1010.0], 1020.0)
+
+
+def test_due_runs_missed_policies():
+    """Тест политик пропущенных запусков"""
+    once = make_task("once", job_func, (), interval=10, missed="once")
+    assert due_runs(once, 1010.0, 1045.0) == ([1040.0], 1050.0)
+
+    catch_up = make_task("all", job_func, (), interval=10, missed="all", max_catch_up=3)
+    assert due_runs(catch_up, 1010.0, 1045.0) == ([1020.0, 1030.0, 1040.0], 1050.0)
+
+    skip = make_task("skip", job_func, (), interval=10, missed="skip", grace=2)
+    assert due_runs(skip, 1010.0, 1041.0) == ([1040.0], 1050.0)
+    assert due_runs(skip, 1010.0, 1045.0) == ([], 1050.0)
+
+
+def test_tick_catch_up_all():
+    """Тест политики "all": каждый пропущенный слот ставит задание с теми же аргументами"""
+    red, queue = FakeRedis(), FakeQueue()
+    tasks = [make_task("all", job_func, (3,), interval=10, missed="all", max_catch_up=3, overlap="allow")]
+    periodic = PeriodicScheduler(red, queue, tasks, lock=object())
+    periodic.state = {"all": {"slot": 1010.0, "fire_at": 1010.0, "job_id": None}}
+
+    periodic.tick(1045.0)
+    assert [args for _, args in queue.jobs] == [(3,), (3,), (3,)]
+    assert red.hashes["periodic:all"]["slot"] == 1050.0
+
+
+def test_tick_overlap_skip(monkeypatch):
+    """Тест политики перекрытия: новое задание не ставится, пока предыдущее выполняется"""
+    statuses = {}
+    monkeypatch.setattr(scheduler.Job, "fetch_many",
+                        lambda ids, connection: [FakeJob(job_id, statuses[job_id]) for job_id in ids])
+    red, queue = FakeRedis(), FakeQueue()
+    tasks = [make_task("slow", job_func, (1,), interval=10), make_task("fast", job_func, (2,), interval=10,
+                                                                       overlap="allow")]
+    periodic = PeriodicScheduler(red, queue, tasks, lock=object())
+    periodic.state = {name: {"slot": 1010.0, "fire_at": 1010.0, "job_id": None} for name in ("slow", "fast")}
+
+    periodic.tick(1010.5)
+    assert [args for _, args in queue.jobs] == [(1,), (2,)]
+    statuses.update({"job0": "started", "job1": "started"})
+
+    periodic.tick(1020.5)
+    # медленное задание еще выполняется, его запуск пропущен
+    assert [args for _, args in queue.jobs] == [(1,), (2,), (2,)]
+    assert red.hashes["periodic:slow"]["skipped_overlap"] == 1
+    assert red.hashes["periodic:slow"]["slot"] == 1030.0
+    assert periodic.state["fast"]["fire_at"] == 1030.0
@@ -0,0 +1,56 @@
+from flaskr.tasks.sequences import SequenceDispatcher, get_sequence, run_sequence_step, step_index
+
+CONFIG = {"EXPERIMENT": {"ventilation": {"vent_time": 60, "measure_cycle_time": 6}}}
+
+
+class FakeRedis:
+    """Хеши в памяти, значения хранятся байтами, как в клиенте без decode_responses"""
+    def __init__(self, hashes):
+        self.hashes = {key: {field: str(value).encode() for field, value in fields.items()}
+                       for key, fields in hashes.items()}
+        self.results = []
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def hmget(self, key, *fields):
+        self.results.append([self.hashes.get(key, {}).get(field) for field in fields])
+
+    def execute(self):
+        results, self.results = self.results, []
+        return results
+
+    def hset(self, key, mapping):
+        self.hashes.setdefault(key, {}).update({field: str(value).encode() for field, value in mapping.items()})
+
+
+class FakeQueue:
+    def __init__(self):
+        self.jobs = []
+
+    def enqueue(self, func, *args):
+        self.jobs.append((func, args))
+
+
+def test_ventilation_sequence():
+    """Тест описания вентиляции: клапаны, ожидание, насосы на vent_time, все выключить"""
+    sequence = get_sequence(CONFIG, "ventilation")
+    assert [step["name"] for step in sequence["steps"]] == ["open_valves", "pumps_on", "all_off"]
+    assert sequence["steps"][1]["wait"] == 60
+    assert step_index(sequence, sequence["on_error"]) == 2
+    assert ("switch", "kolos-3_relay1", "turn_off") in sequence["steps"][2]["actions"]
+
+
+def test_dispatch_due_step_once():
+    """Тест планировщика шагов: шаг ставится в очередь один раз, когда подошло его время"""
+    red = FakeRedis({"sequence:ventilation": {"state": "running", "run_id": "run1", "step": 1, "next_at": 1000.0}})
+    queue = FakeQueue()
+    dispatcher = SequenceDispatcher(red, queue, ["ventilation"], "v1")
+
+    assert dispatcher.dispatch(999.5) == 1000.0
+    assert queue.jobs == []
+    dispatcher.dispatch(1000.5)
+    assert queue.jobs == [(run_sequence_step, ("v1", "ventilation", "run1", 1))]
+    # задание шага еще не выполнено, повторно не ставится
+    dispatcher.dispatch(1001.5)
+    assert len(queue.jobs) == 1
@@ -0,0 +1,127 @@
+import sqlite3
+from datetime import datetime
+import pytest
+from flaskr import db, timeseries
+
+
+@pytest.fixture
+def conn():
+    """Фикстура с пустой базой данных в памяти"""
+    conn = sqlite3.connect(":memory:", detect_types=sqlite3.PARSE_DECLTYPES)
+    timeseries.create_schema(conn)
+    yield conn
+    conn.close()
+
+
+def test_get_series_id(conn):
+    """Тест регистрации серий в каталоге"""
+    cache = {}
+    first = timeseries.get_series_id(conn, 5, "temperature", cache)
+    second = timeseries.get_series_id(conn, "5", "humidity", cache)
+    assert first != second
+    assert timeseries.get_series_id(conn, "5", "temperature") == first
+    assert cache[(5, "temperature")] == first
+
+
+def test_insert_samples(conn):
+    """Тест записи измерений в узкую таблицу"""
+    timeseries.insert_samples(conn, [(5, "temperature", 1000.5, 21.5),
+                                     (5, "temperature", 1001.0, 21.7),
+                                     (5, "temperature", 1001.0, 21.8)])
+    rows = conn.execute("SELECT ts, value FROM samples ORDER BY ts").fetchall()
+    # одинаковая метка времени - остается последнее значение
+    assert rows == [(1000500, 21.5), (1001000, 21.8)]
+
+
+def test_migrate_old_tables(conn):
+    """Тест переноса данных из старых таблиц device_<id>_<field>"""
+    conn.execute("""CREATE TABLE device_5_temperature (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        datetime DATETIME NOT NULL,
+                        value REAL NOT NULL)""")
+    moment = datetime(2024, 5, 1, 12, 0, 0, 250000)
+    conn.execute("INSERT INTO device_5_temperature (datetime, value) VALUES (?, ?)", (moment, 21.5))
+    conn.commit()
+
+    copied = timeseries.migrate_old_tables(conn, drop=True)
+    assert copied == {"device_5_temperature": 1}
+    series_id = timeseries.get_series_id(conn, 5, "temperature")
+    rows = conn.execute("SELECT series_id, ts, value FROM samples").fetchall()
+    assert rows == [(series_id, int(moment.timestamp() * 1000), 21.5)]
+    tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+    assert "device_5_temperature" not in tables
+
+
+def test_rollup_tiers(conn):
+    """Тест построения агрегатов 1 мин / 15 мин / 1 час"""
+    # два часа измерений раз в 10 секунд, значение - номер минуты
+    samples = [(5, "temperature", t, float(t // 60)) for t in range(0, 7200, 10)]
+    timeseries.insert_samples(conn, samples)
+    done = timeseries.rollup(conn, now_ms=7200 * 1000, grace_ms=0)
+    assert done == {60: 7200000, 900: 7200000, 3600: 7200000}
+
+    series_id = timeseries.get_series_id(conn, 5, "temperature")
+    minute = conn.execute("SELECT min, max, sum, count FROM rollup_60 WHERE series_id = ? AND bucket = 60000",
+                          (series_id,)).fetchone()
+    assert minute == (1.0, 1.0, 6.0, 6)
+    hours = conn.execute("SELECT bucket, min, max, count FROM rollup_3600 ORDER BY bucket").fetchall()
+    assert hours == [(0, 0.0, 59.0, 360), (3600000, 60.0, 119.0, 360)]
+
+    # повторный запуск ничего не меняет
+    assert timeseries.rollup(conn, now_ms=7200 * 1000, grace_ms=0) == done
+
+
+def test_rollup_retention(conn):
+    """Тест удаления старых сырых данных только после агрегации"""
+    timeseries.insert_samples(conn, [(5, "temperature", t, 1.0) for t in range(0, 600, 10)])
+    timeseries.rollup(conn, now_ms=600 * 1000, grace_ms=300 * 1000, raw_retention_ms=0)
+    # агрегировано только до 300 секунд, остальное должно остаться
+    assert conn.execute("SELECT MIN(ts), COUNT(*) FROM samples").fetchone() == (300000, 30)
+
+
+def test_query_series_picks_tier(conn):
+    """Тест выбора уровня агрегации по бюджету точек"""
+    timeseries.insert_samples(conn, [(5, "temperature", t, 1.0) for t in range(0, 7200, 10)])
+    timeseries.rollup(conn, now_ms=3600 * 1000, grace_ms=0)
+    series_id = timeseries.get_series_id(conn, 5, "temperature")
+
+    tier, rows = timeseries.query_series(conn, series_id, 0, 7200 * 1000, max_points=1000)
+    assert tier == 0 and len(rows) == 720
+
+    tier, rows = timeseries.query_series(conn, series_id, 0, 7200 * 1000, max_points=200)
+    assert tier == 60 and len(rows) == 120
+    # вторая половина еще не агрегирована и считается из сырых данных
+    assert rows[-1] == (7140000, 1.0, 1.0, 1.0, 6)
+
+    tier, rows = timeseries.query_series(conn, series_id, 0, 7200 * 1000, max_points=2)
+    assert tier == 3600 and len(rows) == 2
+
+
+def test_query_series_raw_by_retention(conn):
+    """Тест выбора сырых данных по границе хранения, а не по первому измерению ряда"""
+    # ряд начался позже начала запрошенного диапазона, сырые данные полные
+    timeseries.insert_samples(conn, [(5, "temperature", t, 1.0) for t in range(3600, 7200, 10)])
+    series_id = timeseries.get_series_id(conn, 5, "temperature")
+    tier, rows = timeseries.query_series(conn, series_id, 0, 7200 * 1000, max_points=1000)
+    assert tier == timeseries.RAW_TIER and len(rows) == 360
+
+    # старые сырые данные удалены, до границы хранения есть только агрегаты
+    timeseries.rollup(conn, now_ms=7200 * 1000, grace_ms=0, raw_retention_ms=1800 * 1000)
+    tier, rows = timeseries.query_series(conn, series_id, 0, 7200 * 1000, max_points=1000)
+    assert tier == 60 and len(rows) == 60
+    tier, rows = timeseries.query_series(conn, series_id, 5400 * 1000, 7200 * 1000, max_points=1000)
+    assert tier == timeseries.RAW_TIER and len(rows) == 180
+
+
+def test_history_route_explicit_zero(web_app):
+    """Тест истории: явные start=0 и end=0 не заменяются значениями по умолчанию"""
+    conn = db.connect_data_db(web_app.instance_path + "/" + web_app.config["DATA_DB_NAME"])
+    timeseries.create_schema(conn)
+    with conn:
+        timeseries.insert_samples(conn, [(8, "temperature", t, 20.0) for t in range(0, 600, 10)])
+    conn.close()
+
+    client = web_app.test_client()
+    result = client.get("/history/8/temperature?start=0&end=60000").json
+    assert result["tier"] == timeseries.RAW_TIER and result["t"] == list(range(0, 60000, 10000))
+    assert client.get("/history/8/temperature?start=0&end=0").status_code == 400
@@ -0,0 +1,71 @@
+import threading
+import time
+import pytest
+import requests_mock
+from flaskr.drivers import transport
+from flaskr.drivers.esp32_relay_driver import ESP32RelayDriver
+from flaskr.drivers.pwm_lamp_driver import PWMLampDriver
+
+
+@pytest.fixture
+def mock_requests():
+    """Фикстура для мокирования HTTP-запросов"""
+    with requests_mock.Mocker() as m:
+        yield m
+
+
+def test_transport_shared_by_host():
+    """Тест общего пула соединений для всех драйверов одного устройства"""
+    relay = ESP32RelayDriver(host="shared.local")
+    lamp = PWMLampDriver(host="shared.local")
+    other = ESP32RelayDriver(host="other.local")
+    assert relay.transport is lamp.transport
+    assert relay.transport is transport.get_transport("shared.local")
+    assert relay.transport is not other.transport
+
+
+def test_default_timeout(mock_requests):
+    """Тест таймаутов по умолчанию для запросов драйвера"""
+    relay = ESP32RelayDriver(host="timeout.local")
+    mock_requests.get("http://timeout.local/info", json={"uptime": 1})
+    relay.get_info()
+    assert mock_requests.last_request.timeout == (transport.DEFAULT_OPTIONS["connect_timeout"],
+                                                  transport.DEFAULT_OPTIONS["read_timeout"])
+
+
+def test_retry_policy():
+    """Тест повторов: GET повторяется при ошибках чтения, POST - только при ошибке соединения"""
+    host = transport.HostTransport("retry.local", connect_timeout=1, read_timeout=1,
+                                   retries=3, backoff=0.1, max_concurrency=1)
+    retry = host.session.get_adapter("http://retry.local").max_retries
+    assert retry.connect == 3
+    assert retry.is_retry("GET", 503)
+    assert not retry.is_retry("POST", 503)
+    assert not retry._is_method_retryable("POST")
+
+
+def test_concurrency_limit(mock_requests):
+    """Тест ограничения числа одновременных запросов к одному устройству"""
+    host = transport.HostTransport("busy.local", connect_timeout=1, read_timeout=1,
+                                   retries=0, backoff=0, max_concurrency=2)
+    active = []
+    peak = []
+    lock = threading.Lock()
+
+    def slow_response(request, context):
+        with lock:
+            active.append(1)
+            peak.append(len(active))
+        time.sleep(0.05)
+        with lock:
+            active.pop()
+        return "ok"
+
+    mock_requests.get("http://busy.local/info", text=slow_response)
+    threads = [threading.Thread(target=host.get, args=("http://busy.local/info",)) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(peak) == 6
+    assert max(peak) <= 2